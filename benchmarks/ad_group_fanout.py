@@ -0,0 +1,58 @@
+"""
+Latency comparison for reading a testing campaign's ad groups.
+
+Attaches N creative groups to creative_testing_campaign on a running simulator, then
+times three ways of reading their ad groups back:
+  - sequential:  one GET /cm/v1/ad_groups/<id> after another (the old main.py loop)
+  - concurrent:  the same per-ID GETs on a bounded thread pool
+  - multi-get:   chunked GET /cm/v1/ad_groups?ids=... fetched concurrently
+
+Run from the repository root while moloco_simulator.py is serving:
+    python -m benchmarks.ad_group_fanout --ad-groups 500
+"""
+import argparse
+import statistics
+import time
+import env_variables as env
+from client.moloco_client import MolocoClient
+
+
+def _seed_ad_groups(client: MolocoClient, count: int) -> list:
+    creative_groups = [{"title": f"Fan-out CG {i}", "description": "benchmark", "creative_ids": []}
+                       for i in range(count)]
+    creative_group_ids = [cg["id"] for cg in client.create_creative_groups(creative_groups)["data"]]
+    attach_response = client.attach_creative_groups("creative_testing_campaign", creative_group_ids)
+    return attach_response["ad_group_ids"][-count:]
+
+
+def _time(label: str, fetch, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fetch()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<28} median {statistics.median(timings) * 1000:9.1f} ms   "
+          f"min {min(timings) * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=env.simulator_base_url)
+    parser.add_argument("--ad-groups", type=int, default=500)
+    parser.add_argument("--max-concurrency", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    client = MolocoClient(args.base_url, max_concurrency=max(args.max_concurrency))
+    ad_group_ids = _seed_ad_groups(client, args.ad_groups)
+    print(f"Reading {len(ad_group_ids)} ad groups from {args.base_url}")
+
+    _time("sequential", lambda: [client.get_ad_group(agid) for agid in ad_group_ids], args.repeat)
+    for limit in args.max_concurrency:
+        _time(f"concurrent (limit {limit})",
+              lambda: client.get_ad_groups_concurrently(ad_group_ids, max_concurrency=limit), args.repeat)
+    _time("multi-get (chunks of 100)", lambda: client.get_ad_groups(ad_group_ids), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
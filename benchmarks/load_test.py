@@ -0,0 +1,268 @@
+"""
+Load test for the simulator API.
+
+Seeds creatives, creative groups and ad groups through the real endpoints, then replays a
+weighted mix of the Streamlit flow from --concurrency worker threads, each with its own
+keep-alive session:
+  list creatives, list campaigns, read ad groups, create a creative group, attach it,
+  pause + simulate performance, submit a champion, replace the worst ad group.
+Reports p50/p95/p99 latency and throughput per endpoint. --save-baseline writes the
+results to a JSON file, and --baseline compares the run against one and exits with
+status 1 when an endpoint regressed by more than --tolerance.
+
+Run from the repository root while moloco_simulator.py is serving:
+    python -m benchmarks.load_test --concurrency 8 --duration 30
+    python -m benchmarks.load_test --baseline benchmarks/load_test_baseline.json
+Campaigns cannot be created through the API, so the fixture campaigns receive the seeded ad groups.
+Throttled requests (429) count as errors; start the simulator with --no-rate-limit to measure raw capacity.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+import requests
+import env_variables as env
+from client.moloco_client import MolocoClient
+
+TESTING_CAMPAIGN_ID = "creative_testing_campaign"
+REGULAR_CAMPAIGN_IDS = ["regular_campaign_a", "regular_campaign_b"]
+
+# Scenario weights per mix; "streamlit" follows the dashboard, where reads dominate
+MIXES = {
+    "streamlit": {"list_creatives": 25, "list_campaigns": 20, "read_ad_groups": 20, "create_group": 8,
+                  "attach": 8, "pause_and_simulate": 5, "submit_champion": 8, "replace_worst": 6},
+    "read_heavy": {"list_creatives": 40, "list_campaigns": 30, "read_ad_groups": 30},
+    "write_heavy": {"create_group": 25, "attach": 25, "pause_and_simulate": 15, "submit_champion": 20,
+                    "replace_worst": 15},
+}
+
+
+class _Seed:
+    """IDs created by the seeding phase, which the scenarios pick from."""
+
+    def __init__(self, creative_ids: List[str], creative_group_ids: List[str], ad_group_ids: List[str]):
+        self.creative_ids = creative_ids
+        self.creative_group_ids = creative_group_ids
+        self.ad_group_ids = ad_group_ids
+
+
+class _Worker:
+    """Runs scenarios on one session and records (endpoint, seconds, ok) for every request."""
+
+    def __init__(self, base_url: str, seed: _Seed, rng: random.Random):
+        self.base_url = base_url
+        self.seed = seed
+        self.rng = rng
+        self.session = requests.Session()
+        self.samples: List[tuple] = []
+
+    def _call(self, endpoint: str, method: str, path: str, **kwargs) -> Optional[dict]:
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 400
+            body = response.json() if ok else None
+        except (requests.RequestException, ValueError):
+            ok, body = False, None
+        self.samples.append((endpoint, time.perf_counter() - start, ok))
+        return body
+
+    def list_creatives(self):
+        ad_type = self.rng.choice(["PORTRAIT", "LANDSCAPE"])
+        self._call("GET /cm/v1/creatives/<ad_type>", "GET", f"/cm/v1/creatives/{ad_type}",
+                   params={"page_size": 100})
+
+    def list_campaigns(self):
+        self._call("GET /cm/v1/campaigns", "GET", "/cm/v1/campaigns")
+
+    def read_ad_groups(self):
+        ids = self.rng.sample(self.seed.ad_group_ids, min(50, len(self.seed.ad_group_ids)))
+        self._call("GET /cm/v1/ad_groups", "GET", "/cm/v1/ad_groups", params={"ids": ",".join(ids)})
+
+    def create_group(self):
+        creative_ids = self.rng.sample(self.seed.creative_ids, min(2, len(self.seed.creative_ids)))
+        self._call("POST /cm/v1/creative_groups", "POST", "/cm/v1/creative_groups",
+                   params={"title": "Load test group", "description": "load test", "creative_ids": creative_ids})
+
+    def attach(self):
+        campaign_id = self.rng.choice(REGULAR_CAMPAIGN_IDS)
+        self._call("POST /cm/v1/campaigns/<campaign_id>", "POST", f"/cm/v1/campaigns/{campaign_id}",
+                   json={"creative_group_ids": [self.rng.choice(self.seed.creative_group_ids)]})
+
+    def pause_and_simulate(self):
+        self._call("POST /cm/v1/campaigns/<campaign_id>/status", "POST",
+                   f"/cm/v1/campaigns/{TESTING_CAMPAIGN_ID}/status", json={"status": "PAUSED"})
+        self._call("POST /cm/v1/campaigns/performance", "POST", "/cm/v1/campaigns/performance",
+                   json={"campaign_ids": [TESTING_CAMPAIGN_ID]})
+
+    def submit_champion(self):
+        self._call("POST /cm/v1/champion_queue", "POST", "/cm/v1/champion_queue",
+                   json={"ad_group_id": self.rng.choice(self.seed.ad_group_ids)})
+
+    def replace_worst(self):
+        self._call("POST /cm/v1/campaigns/replace_worst", "POST", "/cm/v1/campaigns/replace_worst",
+                   json={"k": 1})
+
+
+def seed_entities(client: MolocoClient, creatives: int, creative_groups: int) -> _Seed:
+    """Creates the entities the scenarios read and write, in batches, through the API."""
+    creative_ids = []
+    for start in range(0, creatives, 500):
+        batch = [{"ad_account_id": env.ad_account_id, "product_id": env.product_id, "title": f"Load test {i}",
+                  "type": "VIDEO", "ad_type": "PORTRAIT" if i % 2 else "LANDSCAPE"}
+                 for i in range(start, min(start + 500, creatives))]
+        creative_ids += [c["id"] for c in _checked(client.upload_creatives(batch))["data"]]
+    creative_group_ids = []
+    for start in range(0, creative_groups, 500):
+        batch = [{"title": f"Load test group {i}", "description": "load test",
+                  "creative_ids": [creative_ids[(2 * i) % creatives], creative_ids[(2 * i + 1) % creatives]]}
+                 for i in range(start, min(start + 500, creative_groups))]
+        creative_group_ids += [cg["id"] for cg in _checked(client.create_creative_groups(batch))["data"]]
+    # Half the groups go into the testing campaign, the rest are split over the regular campaigns
+    campaign_ids = [TESTING_CAMPAIGN_ID, TESTING_CAMPAIGN_ID] + REGULAR_CAMPAIGN_IDS
+    ad_group_ids = []
+    for index, campaign_id in enumerate(campaign_ids):
+        group_ids = creative_group_ids[index::len(campaign_ids)]
+        if group_ids:
+            attached = _checked(client.attach_creative_groups(campaign_id, group_ids))["ad_group_ids"]
+            ad_group_ids += attached[-len(group_ids):]
+    return _Seed(creative_ids, creative_group_ids, ad_group_ids)
+
+
+def _checked(response: dict) -> dict:
+    if "error" in response:
+        sys.exit(f"Seeding failed: {response['error']}")
+    return response
+
+
+def run_load(base_url: str, seed: _Seed, mix: Dict[str, int], concurrency: int, duration: float,
+             warmup: float, random_seed: int) -> dict:
+    """
+    Runs the mix from concurrency threads for warmup + duration seconds and summarizes the
+    requests that started after the warmup, per endpoint.
+    """
+    scenarios, weights = list(mix), list(mix.values())
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def work(worker: _Worker) -> list:
+        measured = []
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            scenario = worker.rng.choices(scenarios, weights)[0]
+            getattr(worker, scenario)()
+            if began >= measure_from:
+                measured += worker.samples
+            worker.samples = []
+        return measured
+
+    workers = [_Worker(base_url, seed, random.Random(random_seed + i)) for i in range(concurrency)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = [sample for result in executor.map(work, workers) for sample in result]
+    return summarize(samples, duration)
+
+
+def summarize(samples: List[tuple], wall_seconds: float) -> dict:
+    by_endpoint: Dict[str, List[tuple]] = {}
+    for endpoint, seconds, ok in samples:
+        by_endpoint.setdefault(endpoint, []).append((seconds, ok))
+    by_endpoint["ALL"] = [(seconds, ok) for _, seconds, ok in samples]
+    summary = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = np.array([seconds for seconds, _ in rows]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+        summary[endpoint] = {"count": len(rows), "errors": sum(1 for _, ok in rows if not ok),
+                             "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+                             "p99_ms": round(float(p99), 2), "rps": round(len(rows) / wall_seconds, 1)}
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"{'endpoint':<46} {'count':>7} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, stats in summary.items():
+        print(f"{endpoint:<46} {stats['count']:>7} {stats['errors']:>6} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Returns one message per regression: p95 or p99 latency more than tolerance above the
+    baseline's, or throughput more than tolerance below it. Endpoints missing from either side are skipped.
+    """
+    regressions = []
+    print(f"\n{'endpoint':<46} {'p95 ms':>18} {'p99 ms':>18} {'rps':>16}")
+    for endpoint, stats in summary.items():
+        base = baseline["endpoints"].get(endpoint)
+        if base is None:
+            continue
+        row = []
+        for metric in ("p95_ms", "p99_ms"):
+            change = stats[metric] / base[metric] - 1 if base[metric] else 0.0
+            row.append(f"{stats[metric]:>8} ({change:+6.0%})")
+            if change > tolerance:
+                regressions.append(f"{endpoint}: {metric} {base[metric]} -> {stats[metric]}")
+        change = stats["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        row.append(f"{stats['rps']:>7} ({change:+6.0%})")
+        if change < -tolerance:
+            regressions.append(f"{endpoint}: rps {base['rps']} -> {stats['rps']}")
+        print(f"{endpoint:<46} " + " ".join(row))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=env.simulator_base_url)
+    parser.add_argument("--creatives", type=int, default=2000)
+    parser.add_argument("--creative-groups", type=int, default=1000)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="streamlit")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds run before measuring")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the scenario mix")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative regression of p95/p99 latency and throughput")
+    parser.add_argument("--save-baseline", help="Write this run's results to a baseline JSON file")
+    args = parser.parse_args()
+
+    client = MolocoClient(args.base_url)
+    start = time.perf_counter()
+    seed = seed_entities(client, args.creatives, args.creative_groups)
+    print(f"Seeded {len(seed.creative_ids)} creatives, {len(seed.creative_group_ids)} creative groups and "
+          f"{len(seed.ad_group_ids)} ad groups in {time.perf_counter() - start:.1f}s")
+    print(f"Running the {args.mix} mix at concurrency {args.concurrency} for {args.duration:g}s\n")
+    summary = run_load(args.base_url, seed, MIXES[args.mix], args.concurrency, args.duration, args.warmup,
+                       args.seed)
+    print_summary(summary)
+
+    config = {key: getattr(args, key) for key in ("creatives", "creative_groups", "mix", "concurrency")}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"config": config, "machine": {"platform": platform.platform(), "cpus": os.cpu_count(),
+                                                     "python": platform.python_version()},
+                       "endpoints": summary}, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print(f"\nWarning: baseline was recorded with {baseline['config']}, this run used {config}")
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from client.read_cache import ReadCache
+from client.throttle import AdaptiveLimiter, RequestCoalescer
+
+Timeout = Union[float, tuple]
+
+
+class MolocoClient:
+    """
+    HTTP client for the mock Moloco API served by moloco_simulator.py.
+    Holds one pooled requests.Session, so every call reuses keep-alive connections,
+    applies a timeout to every request and retries with backoff when the connection fails.
+    Failures are returned as {"error": ...} dicts, like the API's own error responses.
+    Fan-out reads run on a bounded thread pool of at most max_concurrency requests.
+    When a ReadCache is given, GETs are served from it and each mutation evicts the reads it affects.
+    sync_changes() follows the simulator's change feed and evicts the reads that other clients' changes affect.
+    Requests in flight are capped by an AIMD limiter that backs off when the API answers 429, and a
+    throttled request is retried after its Retry-After. Concurrent identical GETs share one request.
+    """
+
+    def __init__(self, base_url: str, timeout: Timeout = (3.05, 10), retries: int = 3,
+                 backoff_factor: float = 0.3, pool_size: int = 10, max_concurrency: int = 8,
+                 cache: Optional[ReadCache] = None, ad_account_id: Optional[str] = None,
+                 rate_limit_retries: int = 8, max_retry_wait: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.rate_limit_retries = rate_limit_retries
+        self.max_retry_wait = max_retry_wait
+        # Shared by every thread, so fan-outs and concurrent sessions back off together
+        self.limiter = AdaptiveLimiter(initial=max_concurrency, maximum=max_concurrency)
+        self._coalescer = RequestCoalescer()
+        # Change feed cursor and per-kind change counters, shared by every caller of sync_changes
+        self._feed_id: Optional[str] = None
+        self._feed_sequence = 0
+        self._feed_synced = float("-inf")
+        self._feed_lock = threading.Lock()
+        self.change_counts: Dict[str, int] = {}
+        # Every concurrent request needs its own pooled connection
+        pool_size = max(pool_size, max_concurrency)
+        self.session = requests.Session()
+        self.session.headers.update({"accept": "application/json"})
+        if ad_account_id:
+            # The account the simulator's rate limits are charged to
+            self.session.headers["X-Ad-Account-Id"] = ad_account_id
+        # Only connection errors are retried: the request never reached the server,
+        # so retrying is safe for POSTs too. 429s are left to _send_throttled, which adapts the limiter.
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                      backoff_factor=backoff_factor, allowed_methods=None, respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _send(self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        """Sends a request under the adaptive limiter; identical concurrent GETs are coalesced into one."""
+        if method != "GET":
+            return self._send_throttled(method, path, timeout, **kwargs)
+        key = (path, repr(sorted((kwargs.get("params") or {}).items())), repr(kwargs.get("headers")))
+        return self._coalescer.run(key, lambda: self._send_throttled(method, path, timeout, **kwargs))
+
+    def _send_throttled(self, method: str, path: str, timeout: Optional[Timeout] = None,
+                        **kwargs) -> requests.Response:
+        """
+        Retries a 429 up to rate_limit_retries times. Its Retry-After (at most max_retry_wait) pauses
+        the limiter, so the retry and every other request of this client wait it out together.
+        """
+        for attempt in range(self.rate_limit_retries + 1):
+            started = self.limiter.acquire()
+            throttled = None
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=timeout or self.timeout,
+                                                **kwargs)
+                throttled = response.status_code == 429
+            finally:
+                self.limiter.release(started, throttled)
+            if not throttled or attempt == self.rate_limit_retries:
+                return response
+            self.limiter.pause(min(_retry_after(response), self.max_retry_wait))
+
+    def _request(self, method: str, path: str, timeout: Optional[Timeout] = None, **kwargs) -> dict:
+        try:
+            response = self._send(method, path, timeout=timeout, **kwargs)
+            return response.json()
+        except requests.RequestException as e:
+            return {"error": f"{method} {path} failed: {e}"}
+        except ValueError:
+            return {"error": f"{method} {path} returned a non-JSON response (HTTP {response.status_code})."}
+
+    def _conditional_get(self, path: str, params: Optional[dict], etag: Optional[str],
+                         timeout: Optional[Timeout] = None) -> Tuple[Optional[dict], Optional[str]]:
+        """GET with If-None-Match. Returns (None, etag) on 304 Not Modified, else (response, new etag)."""
+        headers = {"If-None-Match": etag} if etag else None
+        try:
+            response = self._send("GET", path, params=params, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            return {"error": f"GET {path} failed: {e}"}, None
+        if response.status_code == 304:
+            return None, etag
+        try:
+            return response.json(), response.headers.get("ETag")
+        except ValueError:
+            return {"error": f"GET {path} returned a non-JSON response (HTTP {response.status_code})."}, None
+
+    def _get(self, path: str, params: Optional[dict] = None, timeout: Optional[Timeout] = None) -> dict:
+        if self.cache is None:
+            return self._conditional_get(path, params, None, timeout)[0]
+        return self.cache.get_or_fetch(path, params, lambda etag: self._conditional_get(path, params, etag, timeout))
+
+    def invalidate(self, *paths: str):
+        """Evicts cached reads of the given endpoint paths. No-op when caching is off."""
+        if self.cache is not None:
+            self.cache.invalidate(*paths)
+
+    def _invalidate_prefix(self, prefix: str):
+        if self.cache is not None:
+            self.cache.invalidate_prefix(prefix)
+
+    # --- Creatives ---
+    def upload_creatives(self, creatives: List[Dict[str, str]], timeout: Optional[Timeout] = None) -> dict:
+        response = self._request("POST", "/cm/v1/creatives/batch", json={"creatives": creatives}, timeout=timeout)
+        self.invalidate(*{f"/cm/v1/creatives/{c.get('ad_type')}" for c in creatives})
+        return response
+
+    def get_creatives(self, ad_type: str, timeout: Optional[Timeout] = None, **params) -> dict:
+        return self._get(f"/cm/v1/creatives/{ad_type}", params=params, timeout=timeout)
+
+    def upload_asset(self, file: BinaryIO, filename: str = "", chunk_size: int = 8 * 1024 * 1024,
+                     max_attempts: int = 3, timeout: Optional[Timeout] = None) -> dict:
+        """
+        Uploads a seekable binary file to the blob store through the resumable upload protocol
+        and returns {"data": {content_hash, size, deduplicated, ...}}.
+        The file is hashed first, so content the server already has is never sent. Parts of
+        chunk_size bytes are then sent one at a time, and a failed part resumes from the
+        offset the server reports. Memory use is bounded by chunk_size.
+        """
+        hasher = hashlib.sha256()
+        file.seek(0)
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+        size = file.tell()
+        init = self._request("POST", "/cm/v1/uploads", timeout=timeout,
+                             json={"filename": filename, "size": size, "content_hash": hasher.hexdigest()})
+        if "error" in init or init["data"].get("deduplicated"):
+            return init
+        upload_id = init["data"]["upload_id"]
+        offset, failures = 0, 0
+        while offset < size:
+            file.seek(offset)
+            part = self._request("PUT", f"/cm/v1/uploads/{upload_id}", params={"offset": offset},
+                                 data=file.read(chunk_size), headers={"Content-Type": "application/octet-stream"},
+                                 timeout=timeout)
+            if "error" in part:
+                failures += 1
+                if failures >= max_attempts:
+                    return part
+                # Ask the server how far it got and resume from there
+                status = self._request("GET", f"/cm/v1/uploads/{upload_id}", timeout=timeout)
+                if "error" in status:
+                    return status
+                offset = status["data"]["offset"]
+                continue
+            offset = part["data"]["offset"]
+        return self._request("POST", f"/cm/v1/uploads/{upload_id}/complete", timeout=timeout)
+
+    def upload_creative_assets(self, creatives: List[dict], chunk_size: int = 8 * 1024 * 1024,
+                               timeout: Optional[Timeout] = None) -> dict:
+        """
+        Uploads the asset of every creative in parallel, then creates the creatives in one batch call.
+        Each creative dict carries a "file" (seekable binary file) next to its creative fields.
+        """
+        uploads = self._fan_out(
+            lambda c: self.upload_asset(c["file"], c.get("title", ""), chunk_size=chunk_size, timeout=timeout),
+            creatives)
+        errors = [u["error"] for u in uploads if "error" in u]
+        if errors:
+            return {"error": errors[0]}
+        fields = [{**{k: v for k, v in c.items() if k != "file"}, "content_hash": u["data"]["content_hash"]}
+                  for c, u in zip(creatives, uploads)]
+        response = self.upload_creatives(fields, timeout=timeout)
+        if "data" in response:
+            for result, upload in zip(response["data"], uploads):
+                result["upload"] = upload["data"]
+        return response
+
+    def get_media_job(self, job_id: str, timeout: Optional[Timeout] = None) -> dict:
+        return self._request("GET", f"/cm/v1/media_jobs/{job_id}", timeout=timeout)
+
+    def wait_for_media_jobs(self, job_ids: List[str], max_wait: float = 60.0, poll_interval: float = 0.5,
+                            timeout: Optional[Timeout] = None) -> dict:
+        """
+        Polls media jobs until all of them are DONE or FAILED, or max_wait seconds have passed.
+        Returns {"data": [job, ...]} in job_ids order, with unfinished jobs in their last polled state.
+        """
+        deadline = time.monotonic() + max_wait
+        jobs: Dict[str, dict] = {}
+        while True:
+            waiting = [job_id for job_id in job_ids if jobs.get(job_id, {}).get("status") not in ("DONE", "FAILED")]
+            for job_id, response in zip(waiting, self._fan_out(lambda j: self.get_media_job(j, timeout), waiting)):
+                if "error" in response:
+                    return response
+                jobs[job_id] = response["data"]
+            if all(jobs[job_id]["status"] in ("DONE", "FAILED") for job_id in job_ids) \
+                    or time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+        # Finished jobs changed their creatives' status and metadata
+        self._invalidate_prefix("/cm/v1/creatives")
+        return {"data": [jobs[job_id] for job_id in job_ids]}
+
+    # --- Creative Groups ---
+    def create_creative_groups(self, creative_groups: List[dict], timeout: Optional[Timeout] = None) -> dict:
+        return self._request("POST", "/cm/v1/creative_groups/batch",
+                             json={"creative_groups": creative_groups}, timeout=timeout)
+
+    # --- Campaigns ---
+    def get_campaigns(self, timeout: Optional[Timeout] = None, **params) -> dict:
+        return self._get("/cm/v1/campaigns", params=params, timeout=timeout)
+
+    def get_campaign(self, campaign_id: str, timeout: Optional[Timeout] = None) -> dict:
+        return self._get(f"/cm/v1/campaigns/{campaign_id}", timeout=timeout)
+
+    def attach_creative_groups(self, campaign_id: str, creative_group_ids: List[str],
+                               timeout: Optional[Timeout] = None, **params) -> dict:
+        response = self._request("POST", f"/cm/v1/campaigns/{campaign_id}",
+                                 json={"creative_group_ids": creative_group_ids, **params}, timeout=timeout)
+        self.invalidate("/cm/v1/campaigns", f"/cm/v1/campaigns/{campaign_id}")
+        return response
+
+    def update_campaign_status(self, campaign_id: str, status: str, timeout: Optional[Timeout] = None) -> dict:
+        response = self._request("POST", f"/cm/v1/campaigns/{campaign_id}/status", json={"status": status},
+                                 timeout=timeout)
+        self.invalidate("/cm/v1/campaigns", f"/cm/v1/campaigns/{campaign_id}")
+        return response
+
+    def get_campaign_allocation(self, campaign_id: str, timeout: Optional[Timeout] = None) -> dict:
+        """How the next simulated tick splits the campaign's impressions across its ad groups."""
+        # Not cached: in THOMPSON mode every call is a fresh sample
+        return self._request("GET", f"/cm/v1/campaigns/{campaign_id}/allocation", timeout=timeout)
+
+    def set_campaign_allocation(self, campaign_id: str, mode: str, impression_budget: Optional[int] = None,
+                                timeout: Optional[Timeout] = None) -> dict:
+        """Switches the campaign between FIXED and THOMPSON traffic allocation."""
+        response = self._request("POST", f"/cm/v1/campaigns/{campaign_id}/allocation",
+                                 json={"mode": mode, "impression_budget": impression_budget}, timeout=timeout)
+        self.invalidate("/cm/v1/campaigns", f"/cm/v1/campaigns/{campaign_id}")
+        return response
+
+    def simulate_performance(self, timeout: Optional[Timeout] = None, **options) -> dict:
+        """Runs the simulator's performance engine. options: campaign_ids, ticks, impressions_per_tick, noise, seed."""
+        response = self._request("POST", "/cm/v1/campaigns/performance", json=options or None, timeout=timeout)
+        # Performance lives on the ad groups, so every cached ad group read is stale
+        self._invalidate_prefix("/cm/v1/ad_groups")
+        return response
+
+    def evaluate_campaign(self, campaign_id: str, timeout: Optional[Timeout] = None, **options) -> dict:
+        """Runs the sequential champion test on a testing campaign. options: batch_impressions, noise, seed."""
+        response = self._request("POST", f"/cm/v1/campaigns/{campaign_id}/evaluate", json=options or None,
+                                 timeout=timeout)
+        # Evaluation adds traffic to the ad groups and winners to the champion queue
+        self._invalidate_prefix("/cm/v1/ad_groups")
+        self.invalidate("/cm/v1/champion_queue")
+        return response
+
+    # --- Ad Groups ---
+    def get_ad_group(self, ad_group_id: str, timeout: Optional[Timeout] = None) -> dict:
+        return self._get(f"/cm/v1/ad_groups/{ad_group_id}", timeout=timeout)
+
+    def get_ad_groups(self, ad_group_ids: List[str], chunk_size: int = 100, max_concurrency: Optional[int] = None,
+                      timeout: Optional[Timeout] = None) -> dict:
+        """
+        Multi-gets ad groups. IDs are split into chunks of chunk_size to keep URLs short,
+        and the chunks are fetched concurrently. Results keep the order of ad_group_ids.
+        """
+        if not ad_group_ids:
+            return {"data": [], "not_found": []}
+        chunks = [ad_group_ids[i:i + chunk_size] for i in range(0, len(ad_group_ids), chunk_size)]
+        responses = self._fan_out(
+            lambda chunk: self._get("/cm/v1/ad_groups", params={"ids": ",".join(chunk)}, timeout=timeout),
+            chunks, max_concurrency)
+        errors = [r["error"] for r in responses if "error" in r]
+        if errors:
+            return {"error": errors[0]}
+        return {"data": [ag for r in responses for ag in r.get("data", [])],
+                "not_found": [agid for r in responses for agid in r.get("not_found", [])]}
+
+    def get_ad_groups_concurrently(self, ad_group_ids: List[str], max_concurrency: Optional[int] = None,
+                                   timeout: Optional[Timeout] = None) -> List[dict]:
+        """
+        Fetches each ad group with its own GET /cm/v1/ad_groups/<id>, at most max_concurrency at a time.
+        Returns one response dict per ID, in the order of ad_group_ids.
+        """
+        return self._fan_out(lambda agid: self.get_ad_group(agid, timeout=timeout), ad_group_ids, max_concurrency)
+
+    def _fan_out(self, fetch, items: list, max_concurrency: Optional[int] = None) -> list:
+        """Runs fetch over items on a bounded thread pool and returns the results in input order."""
+        workers = min(max_concurrency or self.max_concurrency, len(items))
+        if workers <= 1:
+            return [fetch(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch, items))
+
+    # --- Change Feed ---
+    def get_changes(self, since: int = 0, feed_id: Optional[str] = None, kinds: Optional[List[str]] = None,
+                    wait: float = 0.0, timeout: Optional[Timeout] = None) -> dict:
+        """Reads entity change events after since; with wait, the server holds the request until one arrives."""
+        params = {"since": since, "timeout": wait}
+        if feed_id:
+            params["feed_id"] = feed_id
+        if kinds:
+            params["kinds"] = ",".join(kinds)
+        if timeout is None and wait:
+            # The read timeout has to outlast the server's wait
+            connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+            timeout = (connect, read + wait)
+        return self._request("GET", "/cm/v1/changes", params=params, timeout=timeout)
+
+    def sync_changes(self, min_interval: float = 1.0) -> Dict[str, int]:
+        """
+        Catches up with the change feed, at most once per min_interval seconds across all callers,
+        evicts the cached reads of every changed entity and bumps change_counts per kind.
+        After a reset (missed events or a restarted server) the whole cache is dropped and every kind counts as changed.
+        Returns a copy of change_counts, so callers can tell which kinds changed since they last looked.
+        """
+        if not self._feed_lock.acquire(blocking=False):
+            # Another caller is syncing right now
+            return dict(self.change_counts)
+        try:
+            if time.monotonic() - self._feed_synced >= min_interval:
+                self._feed_synced = time.monotonic()
+                self._catch_up()
+            return dict(self.change_counts)
+        finally:
+            self._feed_lock.release()
+
+    def _catch_up(self):
+        while True:
+            response = self.get_changes(self._feed_sequence, self._feed_id)
+            if "error" in response:
+                return
+            if response["reset"] and self._feed_id is not None:
+                if self.cache is not None:
+                    self.cache.clear()
+                for kind in ("creative", "creative_group", "ad_group", "ad_group_performance", "campaign",
+                             "champion_queue"):
+                    self.change_counts[kind] = self.change_counts.get(kind, 0) + 1
+            self._feed_id = response["feed_id"]
+            self._feed_sequence = response["sequence"]
+            events = response["data"]
+            for event in events:
+                self.change_counts[event["kind"]] = self.change_counts.get(event["kind"], 0) + 1
+            self._evict_changed(events)
+            if len(events) < 1000:
+                return
+
+    def _evict_changed(self, events: List[dict]):
+        if self.cache is None or not events:
+            return
+        kinds = {event["kind"] for event in events}
+        if "creative" in kinds:
+            # Creative reads are keyed by ad_type, which events do not carry
+            self._invalidate_prefix("/cm/v1/creatives")
+        for kind, path in (("ad_group", "/cm/v1/ad_groups"), ("campaign", "/cm/v1/campaigns")):
+            if kind in kinds:
+                ids = {event["id"] for event in events if event["kind"] == kind}
+                self.invalidate(path, *(f"{path}/{entity_id}" for entity_id in ids))
+        if "ad_group_performance" in kinds:
+            # One event per simulated campaign, which does not list its ad groups
+            self._invalidate_prefix("/cm/v1/ad_groups")
+        if "ad_group" in kinds or "ad_group_performance" in kinds:
+            # Campaign performance reports roll up their ad groups
+            self.invalidate(*(path for path in self.cache.paths() if path.endswith("/performance")))
+        if "champion_queue" in kinds:
+            self.invalidate("/cm/v1/champion_queue")
+
+    # --- Champion Queue ---
+    def submit_champion(self, ad_group_id: str, timeout: Optional[Timeout] = None) -> dict:
+        response = self._request("POST", "/cm/v1/champion_queue", json={"ad_group_id": ad_group_id}, timeout=timeout)
+        self.invalidate("/cm/v1/champion_queue")
+        return response
+
+    def get_champion_queue(self, timeout: Optional[Timeout] = None) -> dict:
+        return self._get("/cm/v1/champion_queue", timeout=timeout)
+
+    def dequeue_champion(self, timeout: Optional[Timeout] = None) -> dict:
+        response = self._request("POST", "/cm/v1/champion_queue/dequeue", timeout=timeout)
+        self.invalidate("/cm/v1/champion_queue")
+        return response
+
+    def reorder_champions(self, ad_group_ids: List[str], timeout: Optional[Timeout] = None) -> dict:
+        response = self._request("PUT", "/cm/v1/champion_queue", json={"ad_group_ids": ad_group_ids},
+                                 timeout=timeout)
+        self.invalidate("/cm/v1/champion_queue")
+        return response
+
+    def run_rotation(self, timeout: Optional[Timeout] = None) -> dict:
+        """Rotates champions into every regular campaign now instead of at the scheduler's next run."""
+        response = self._request("POST", "/cm/v1/rotations", timeout=timeout)
+        self.invalidate("/cm/v1/champion_queue")
+        self._invalidate_prefix("/cm/v1/campaigns")
+        return response
+
+    def get_rotations(self, limit: int = 20, timeout: Optional[Timeout] = None) -> dict:
+        """Recent rotation runs, newest first, with their decisions."""
+        return self._request("GET", "/cm/v1/rotations", params={"limit": limit}, timeout=timeout)
+
+    def replace_worst(self, campaign_id: str, timeout: Optional[Timeout] = None) -> dict:
+        """Replaces the campaign's worst performing ad group with the next champion."""
+        response = self._request("POST", f"/cm/v1/campaigns/{campaign_id}/replace_worst", timeout=timeout)
+        self.invalidate("/cm/v1/champion_queue", "/cm/v1/campaigns", f"/cm/v1/campaigns/{campaign_id}")
+        return response
+
+
+def _retry_after(response: requests.Response) -> float:
+    """
+    Seconds the server asked to wait before retrying: the precise X-RateLimit-Reset-After when sent,
+    else Retry-After, else 1 (also when Retry-After is an HTTP date).
+    """
+    try:
+        return max(0.0, float(response.headers.get("X-RateLimit-Reset-After")
+                              or response.headers.get("Retry-After", 1)))
+    except ValueError:
+        return 1.0
@@ -0,0 +1,85 @@
+import copy
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+CacheKey = Tuple[str, tuple]
+
+
+class ReadCache:
+    """
+    Thread-safe read-through TTL cache for GET responses, keyed by endpoint path and query params.
+    Entries are evicted by path, so a mutation only drops the reads it affects.
+    Expired entries that carry an ETag are revalidated with a conditional GET instead of
+    being refetched, so an unchanged resource costs a 304 with no body.
+    Error responses are never cached.
+    """
+
+    def __init__(self, ttl_seconds: float = 30, max_entries: int = 512):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (expiry, response, etag)
+        self._entries: Dict[CacheKey, Tuple[float, dict, Optional[str]]] = {}
+        self._keys_by_path: Dict[str, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path: str, params: Optional[dict] = None) -> CacheKey:
+        return path, tuple(sorted((params or {}).items()))
+
+    def get_or_fetch(self, path: str, params: Optional[dict],
+                     fetch: Callable[[Optional[str]], Tuple[Optional[dict], Optional[str]]]) -> dict:
+        """
+        Returns a copy of the cached response for (path, params), calling fetch on a miss or expiry.
+        fetch receives the cached ETag (or None) and returns (response, etag), where a None
+        response means the server answered 304 Not Modified.
+        """
+        key = self.make_key(path, params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return copy.deepcopy(entry[1])
+        response, etag = fetch(entry[2] if entry is not None else None)
+        if response is None:
+            # Not modified: keep the cached body for another TTL
+            cached, response = entry[1], copy.deepcopy(entry[1])
+        elif "error" in response:
+            return response
+        else:
+            cached = copy.deepcopy(response)
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                self._evict_oldest()
+            self._entries[key] = (now + self.ttl_seconds, cached, etag)
+            self._keys_by_path.setdefault(path, set()).add(key)
+        return response
+
+    def invalidate(self, *paths: str):
+        """Evicts every cached response for the given endpoint paths, whatever their params."""
+        with self._lock:
+            for path in paths:
+                for key in self._keys_by_path.pop(path, set()):
+                    self._entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix: str):
+        """Evicts every cached response whose endpoint path starts with prefix."""
+        with self._lock:
+            paths = [path for path in self._keys_by_path if path.startswith(prefix)]
+        self.invalidate(*paths)
+
+    def paths(self) -> List[str]:
+        """Endpoint paths that currently have cached responses."""
+        with self._lock:
+            return list(self._keys_by_path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+
+    def _evict_oldest(self):
+        # Entries share one TTL, so the earliest expiry is the oldest entry
+        key = min(self._entries, key=lambda k: self._entries[k][0])
+        self._entries.pop(key)
+        self._keys_by_path.get(key[0], set()).discard(key)
@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional
+
+
+class AdaptiveLimiter:
+    """
+    Caps the requests in flight with an AIMD (additive increase, multiplicative decrease) limit,
+    like TCP congestion control. Every successful response raises the limit by increase / limit,
+    so about one request per round of limit requests. A 429 multiplies it by decrease, at most
+    once per round: only a request that started after the last decrease can decrease it again,
+    so a burst of 429s from the same round counts once. The limit stays between minimum and maximum.
+    pause() holds back every new request until the server's Retry-After has passed, instead of
+    letting the other threads spend it collecting more 429s.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 8, increase: float = 1.0,
+                 decrease: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.throttled = 0 # 429s seen, for callers that report on throttling
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._paused_until = 0.0
+        self._changed = threading.Condition()
+
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> float:
+        """Waits for a free slot under the limit and returns the start time to pass to release()."""
+        with self._changed:
+            while True:
+                paused = self._paused_until - time.monotonic()
+                if paused > 0:
+                    self._changed.wait(paused)
+                elif self._in_flight >= int(self.limit):
+                    self._changed.wait()
+                else:
+                    break
+            self._in_flight += 1
+            return time.monotonic()
+
+    def pause(self, seconds: float):
+        """Lets no request start for the next seconds seconds."""
+        with self._changed:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def release(self, started: float, throttled: Optional[bool]):
+        """Frees the slot and adapts the limit: throttled=True for a 429, None when there was no response."""
+        with self._changed:
+            self._in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                if started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+            elif throttled is not None:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._changed.notify_all()
+
+
+class RequestCoalescer:
+    """
+    Lets concurrent identical reads share one request. The first caller with a key runs fetch;
+    callers with the same key that arrive before it finishes wait for its result (or exception)
+    instead of sending their own. Nothing is cached: the next call after that sends again.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0 # Calls answered by another caller's request
+
+    def run(self, key: Hashable, fetch: Callable[[], object]):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from typing import Dict
 
-@dataclass
+@dataclass(slots=True)
 class AdGroup:
     ad_group_id: str
     campaign_id: str
@@ -9,4 +9,10 @@ class AdGroup:
     performance: Dict[str, int] = field(default_factory=lambda: {"impressions": 0, "conversions": 0})
 
     def to_dict(self):
-        return self.__dict__
+        """Returns a detached snapshot; later changes to the ad group do not show up in it."""
+        return {
+            "ad_group_id": self.ad_group_id,
+            "campaign_id": self.campaign_id,
+            "creative_group_ids": list(self.creative_group_ids),
+            "performance": dict(self.performance),
+        }
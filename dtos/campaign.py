@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from typing import List, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Campaign:
     ad_account_id: str
     product_id: str
@@ -14,6 +14,23 @@ class Campaign:
     createTime: str
     lastModifiedTime: str
     impressions_goal_per_cg: Optional[int] = None
+    allocation_mode: str = "FIXED" # FIXED or THOMPSON
+    impression_budget: Optional[int] = None # Impressions per tick shared by the ad groups in THOMPSON mode
 
     def to_dict(self):
-        return self.__dict__
+        """Returns a detached snapshot; later changes to the campaign do not show up in it."""
+        return {
+            "ad_account_id": self.ad_account_id,
+            "product_id": self.product_id,
+            "campaign_id": self.campaign_id,
+            "title": self.title,
+            "description": self.description,
+            "status": self.status,
+            "ad_group_ids": list(self.ad_group_ids),
+            "type": self.type,
+            "createTime": self.createTime,
+            "lastModifiedTime": self.lastModifiedTime,
+            "impressions_goal_per_cg": self.impressions_goal_per_cg,
+            "allocation_mode": self.allocation_mode,
+            "impression_budget": self.impression_budget,
+        }
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Creative:
     id: str
     ad_account_id: str
@@ -12,6 +12,21 @@ class Creative:
     video_property: Dict[str, any]
     createTime: str
     lastModifiedTime: str
+    content_hash: Optional[str] = None # SHA-256 of the uploaded asset in the blob store
+    status: str = "READY" # PROCESSING while the asset is probed, then READY or FAILED
 
     def to_dict(self):
-        return self.__dict__
+        """Returns a detached snapshot; later changes to the creative do not show up in it."""
+        return {
+            "id": self.id,
+            "ad_account_id": self.ad_account_id,
+            "product_id": self.product_id,
+            "title": self.title,
+            "type": self.type,
+            "ad_type": self.ad_type,
+            "video_property": dict(self.video_property),
+            "createTime": self.createTime,
+            "lastModifiedTime": self.lastModifiedTime,
+            "content_hash": self.content_hash,
+            "status": self.status,
+        }
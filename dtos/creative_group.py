@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from typing import List, Dict
 
-@dataclass
+@dataclass(slots=True)
 class CreativeGroup:
     id: str
     title: str
@@ -13,4 +13,14 @@ class CreativeGroup:
     performance: Dict[str, int] = field(default_factory=lambda: {"impressions": 0, "conversions": 0})
 
     def to_dict(self):
-        return self.__dict__
\ No newline at end of file
+        """Returns a detached snapshot; later changes to the creative group do not show up in it."""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "creative_ids": list(self.creative_ids),
+            "status": self.status,
+            "createTime": self.createTime,
+            "lastModifiedTime": self.lastModifiedTime,
+            "performance": dict(self.performance),
+        }
\ No newline at end of file
@@ -1,4 +1,28 @@
 api_key = "your_api_key_here"
 api_secret = "your_api_secret_here"
 ad_account_id = "your_ad_account_id_here"
-product_id = "your_product_id_here"
\ No newline at end of file
+product_id = "your_product_id_here"
+simulator_base_url = "http://localhost:8080"
+request_timeout_seconds = 10
+max_concurrent_requests = 8
+read_cache_ttl_seconds = 30
+simulator_threads = 16
+blob_store_dir = "blob_store"
+upload_chunk_size = 8 * 1024 * 1024
+media_workers = 2
+media_queue_limit = 256
+media_job_timeout_seconds = 300 # A probe still running after this fails, freeing its worker
+request_log_sample_rate = 0.01
+slow_request_seconds = 0.5
+request_profiling = False # ?profile=1 on any request; turn on only for local debugging
+change_feed_poll_seconds = 2
+simulator_shards = 1
+rotation_interval_seconds = 300
+rotation_max_per_campaign = 1
+rate_limit_per_second = 100
+rate_limit_burst = 200
+rate_limit_overrides = {
+    "POST /cm/v1/creatives/batch": (20, 40),
+    "POST /cm/v1/creative_groups/batch": (20, 40),
+    "POST /cm/v1/uploads": (20, 40),
+}
\ No newline at end of file
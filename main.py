@@ -1,73 +1,99 @@
 import streamlit as st
-import moloco_simulator
 import env_variables as env
-import requests
+from client.moloco_client import MolocoClient
+from client.read_cache import ReadCache
 
 st.set_page_config(layout="wide", page_title="Bubbleye Ad Manager (Mock)")
 
+@st.cache_resource
+def get_client():
+    """One pooled HTTP client shared by every session and rerun, with a TTL cache for its reads."""
+    return MolocoClient(env.simulator_base_url, timeout=(3.05, env.request_timeout_seconds),
+                        max_concurrency=env.max_concurrent_requests,
+                        cache=ReadCache(ttl_seconds=env.read_cache_ttl_seconds), ad_account_id=env.ad_account_id)
+
+client = get_client()
+
+def changed_since_last_run(section: str, *kinds: str) -> bool:
+    """
+    Catches the shared client up with the simulator's change feed (which evicts stale cached reads)
+    and tells whether any of kinds changed since this session's section last asked.
+    """
+    counts = client.sync_changes(min_interval=env.change_feed_poll_seconds)
+    seen = tuple(counts.get(kind, 0) for kind in kinds)
+    changed = st.session_state.get(f"seen_changes_{section}") != seen
+    st.session_state[f"seen_changes_{section}"] = seen
+    return changed
+
+# Reads below are served from the cache unless the change feed reported them stale
+client.sync_changes(min_interval=env.change_feed_poll_seconds)
+
 st.title("Bubbleye Ad Manager - Mock Application")
 st.subheader("Simulating Moloco API Interactions")
 
 st.write("---")
 st.header("New Creative Concept Upload")
 
-headers = {"accept": "application/json"}
-
 # Simulate uploading a portrait and landscape video for a new concept
 uploaded_file1 = st.file_uploader("Choose a file", type=["txt", "png", "jpg", "jpeg", "pdf", "mp3", "mp4"])
 uploaded_file2 = st.file_uploader("Choose a second file", type=["txt", "png", "jpg", "jpeg", "pdf", "mp3", "mp4"])
 if uploaded_file1 is not None and uploaded_file2 is not None:
     if st.button("Upload New Creative Concept"):
-        st.info("Simulating upload of portrait video...")
-        url = "http://localhost:8080/cm/v1/creatives"
-        params = {
-            "ad_account_id": env.ad_account_id,
-            "product_id": env.product_id,
-            "title": uploaded_file1.name,
-            "type": "VIDEO",
-            "ad_type": "PORTRAIT"  # Specify ad type for portrait video
-        }
-        portrait_asset_response = requests.post(url, headers=headers, params=params)
-        portrait_asset_response_json = portrait_asset_response.json()
-        if "error" in portrait_asset_response_json:
-            st.error(f"Failed to upload portrait video: {portrait_asset_response_json['error']}")
-        else:
-            portrait_creative_id = portrait_asset_response_json["data"]["id"]
-            st.success(f"Portrait video uploaded. Creative ID: `{portrait_creative_id}`")
-
-        st.info("Simulating upload of landscape video...")
-        params = {
-            "ad_account_id": env.ad_account_id,
-            "product_id": env.product_id,
-            "title": uploaded_file2.name,
-            "type": "VIDEO", 
-            "ad_type": "LANDSCAPE"  # Specify ad type for landscape video
-        }
-        landscape_asset_response = requests.post(url, headers=headers, params=params)
-        landscape_asset_response_json = landscape_asset_response.json()
-        if "error" in landscape_asset_response_json:
-            st.error(f"Failed to upload landscape video: {landscape_asset_response_json['error']}")
+        st.info("Uploading portrait and landscape videos...")
+        creatives = [
+            {
+                "ad_account_id": env.ad_account_id,
+                "product_id": env.product_id,
+                "title": uploaded_file1.name,
+                "type": "VIDEO",
+                "ad_type": "PORTRAIT",  # Specify ad type for portrait video
+                "file": uploaded_file1
+            },
+            {
+                "ad_account_id": env.ad_account_id,
+                "product_id": env.product_id,
+                "title": uploaded_file2.name,
+                "type": "VIDEO",
+                "ad_type": "LANDSCAPE",  # Specify ad type for landscape video
+                "file": uploaded_file2
+            }
+        ]
+        # Both assets stream to the simulator's blob store in parallel, in chunks
+        asset_response_json = client.upload_creative_assets(creatives, chunk_size=env.upload_chunk_size)
+        if "error" in asset_response_json:
+            st.error(f"Failed to upload videos: {asset_response_json['error']}")
         else:
-            landscape_creative_id = landscape_asset_response_json["data"]["id"]
-            st.success(f"Landscape video uploaded. Creative ID: `{landscape_creative_id}`")
+            results = asset_response_json["data"]
+            for label, result in zip(["Portrait", "Landscape"], results):
+                upload = result["upload"]
+                detail = "already stored" if upload.get("deduplicated") else f"{upload['upload_time_seconds']}s"
+                st.info(f"{label} video uploaded ({upload['size']} bytes, {detail}), processing. "
+                        f"Creative ID: `{result['id']}`")
+            # The simulator probes each asset in the background; wait for the creatives to become READY
+            with st.spinner("Processing videos..."):
+                jobs_response_json = client.wait_for_media_jobs([result["job_id"] for result in results])
+            if "error" in jobs_response_json:
+                st.error(f"Failed to check processing status: {jobs_response_json['error']}")
+            else:
+                for label, job in zip(["Portrait", "Landscape"], jobs_response_json["data"]):
+                    if job["status"] == "DONE":
+                        st.success(f"{label} video is ready. Creative ID: `{job['creative_id']}`")
+                    elif job["status"] == "FAILED":
+                        st.error(f"{label} video failed processing: {job['error']}")
+                    else:
+                        st.warning(f"{label} video is still processing (job `{job['job_id']}`).")
 
 st.write("---")
 st.header("Create New Creative Group")
-# Fetch all portrait and landscape creatives
-url = "http://localhost:8080/cm/v1/creatives/PORTRAIT"
-params = {"ad_type": "PORTRAIT"}
-portrait_response = requests.get(url, headers=headers, params=params)
-portrait_creatives = portrait_response.json().get("data", [])
+# Fetch the portrait and landscape creatives that finished processing
+portrait_creatives = client.get_creatives("PORTRAIT", status="READY").get("data", [])
 portrait_creative_id = st.selectbox(
     "Select Portrait Creative",
     options=[c["id"] for c in portrait_creatives],
     format_func=lambda cid: next((c["title"] for c in portrait_creatives if c["id"] == cid), cid),
     key="portrait_creative_select"
 )
-url = "http://localhost:8080/cm/v1/creatives/LANDSCAPE"
-params = {"ad_type": "LANDSCAPE"}
-landscape_response = requests.get(url, headers=headers, params=params)
-landscape_creatives = landscape_response.json().get("data", [])
+landscape_creatives = client.get_creatives("LANDSCAPE", status="READY").get("data", [])
 landscape_creative_id = st.selectbox(
     "Select Landscape Creative",
     options=[c["id"] for c in landscape_creatives],
@@ -85,27 +111,22 @@ if st.button("Upload Portrait and Landscape Creatives"):
     st.info("Simulating creative group creation...")
     new_creative_group_name = creative_group_title or "New Creative Group"
     new_creative_group_description = creative_group_description or "Description of the new creative group"
-    url = "http://localhost:8080/cm/v1/creative_groups"
-    params = {
+    creative_group_response_json = client.create_creative_groups([{
         "title": new_creative_group_name,
         "description": new_creative_group_description,
         "creative_ids": [portrait_creative_id, landscape_creative_id]
-    }
-    creative_group_response = requests.post(url, headers=headers, json=params)
-    creative_group_response_json = creative_group_response.json()
+    }])
     if "data" in creative_group_response_json:
-        new_cg_id = creative_group_response_json["data"]["id"]
+        new_cg_id = creative_group_response_json["data"][0]["id"]
         st.success(f"Creative group '{new_cg_id}' created successfully!")
         st.session_state["last_created_cg_ids"].append(new_cg_id)
     else:
-        st.error(f"Failed to create creative group: {creative_group_response}")
+        st.error(f"Failed to create creative group: {creative_group_response_json.get('error', 'Unknown error')}")
 
 
 st.write("---")
 
-url = "http://localhost:8080/cm/v1/campaigns/creative_testing_campaign"
-fetch_campaign_response = requests.get(url, headers=headers)
-test_campaign = fetch_campaign_response.json().get("data", None)
+test_campaign = client.get_campaign("creative_testing_campaign").get("data", None)
 if test_campaign:
     st.session_state["testing_campaign_ad_group_ids"] = test_campaign.get('ad_group_ids', [])
 
@@ -116,14 +137,12 @@ if st.session_state["last_created_cg_ids"]:
     for cg_id in st.session_state["last_created_cg_ids"]:
         st.write(f"- `{cg_id}`")
     if st.button(f"Attach {', '.join(st.session_state['last_created_cg_ids'])} to creative_testing_campaign"):
-        url = "http://localhost:8080/cm/v1/campaigns/creative_testing_campaign"
-        params = {
-            "creative_group_ids": st.session_state["last_created_cg_ids"],
-            "ad_account_id": env.ad_account_id,
-            "product_id": env.product_id
-        }
-        attach_response = requests.post(url, headers=headers, json=params)
-        attach_response_json = attach_response.json()
+        attach_response_json = client.attach_creative_groups(
+            "creative_testing_campaign",
+            st.session_state["last_created_cg_ids"],
+            ad_account_id=env.ad_account_id,
+            product_id=env.product_id
+        )
         if "message" in attach_response_json:
             st.success(attach_response_json["message"])
             # Extend only with new ad_group_ids not already in the list
@@ -141,57 +160,76 @@ else:
 st.write("---")
 
 st.header("Manage Creative Testing Campaign")
-# Simulate fetching the testing campaign
-if test_campaign:
+# Re-rendered on its own as ad groups and campaigns change, without rerunning the whole page
+@st.fragment(run_every=env.change_feed_poll_seconds)
+def testing_campaign_section():
+    if changed_since_last_run("testing_campaign", "campaign", "ad_group", "ad_group_performance"):
+        test_campaign = client.get_campaign("creative_testing_campaign").get("data", None)
+        if test_campaign:
+            st.session_state["testing_campaign"] = test_campaign
+            st.session_state["testing_campaign_ad_group_ids"] = test_campaign.get('ad_group_ids', [])
+    test_campaign = st.session_state.get("testing_campaign")
+    if not test_campaign:
+        return
     st.write(f"Current Status of 'creative_testing_campaign': **{test_campaign['status']}**")
     st.write(f"**Testing Campaign ID:** `{test_campaign['campaign_id']}`")
     test_campaign_ad_group_ids = st.session_state.get("testing_campaign_ad_group_ids", [])
-    for ad_group_id in test_campaign_ad_group_ids:
-        url = "http://localhost:8080/cm/v1/ad_groups/" + ad_group_id
-        ad_group_response = requests.get(url, headers=headers)
-        ad_group_data = ad_group_response.json().get("data", {})
-        if ad_group_data:
-            with st.expander(f"Ad Group ID: `{ad_group_id}`", expanded=False):
-                st.write(f"**Performance:** {ad_group_data.get('performance', {})}")
+    for ad_group_data in client.get_ad_groups(test_campaign_ad_group_ids).get("data", []):
+        with st.expander(f"Ad Group ID: `{ad_group_data['ad_group_id']}`", expanded=False):
+            st.write(f"**Performance:** {ad_group_data.get('performance', {})}")
+
+    # THOMPSON shifts each simulated tick's impressions toward the ad groups likely to be winning
+    modes = ["FIXED", "THOMPSON"]
+    current_mode = test_campaign.get("allocation_mode", "FIXED")
+    mode = st.radio("Traffic allocation", modes, index=modes.index(current_mode), horizontal=True,
+                    key="testing_allocation_mode")
+    if mode != current_mode:
+        allocation_response_json = client.set_campaign_allocation("creative_testing_campaign", mode)
+        if "message" in allocation_response_json:
+            st.success(allocation_response_json["message"])
+        else:
+            st.error(f"Failed to update allocation: {allocation_response_json.get('error', 'Unknown error')}")
+    if mode == "THOMPSON":
+        allocation = client.get_campaign_allocation("creative_testing_campaign").get("data", {})
+        st.dataframe([{"Ad Group": ag["ad_group_id"], "P(best)": ag["probability_best"],
+                       "Next tick impressions": ag["next_tick_impressions"]}
+                      for ag in allocation.get("ad_groups", [])])
     
     if st.button("Start Testing Campaign"):
-        url = "http://localhost:8080/cm/v1/campaigns/creative_testing_campaign/status"
-        params = {"status": "RUNNING"}
-        status_response = requests.post(url, headers=headers, json=params)
-        status_response_json = status_response.json()
+        status_response_json = client.update_campaign_status("creative_testing_campaign", "RUNNING")
         if "message" in status_response_json:
             st.success(f"Campaign status updated to: RUNNING")
         else:
             st.error(f"Failed to update status")
     if st.button("Pause Testing Campaign"):
-        url = "http://localhost:8080/cm/v1/campaigns/performance"
-        response = requests.post(url, headers=headers)
+        client.simulate_performance()
 
-        url = "http://localhost:8080/cm/v1/campaigns/creative_testing_campaign/status"
-        params = {"status": "PAUSED"}
-        status_response = requests.post(url, headers=headers, json=params)
-        status_response_json = status_response.json()
+        status_response_json = client.update_campaign_status("creative_testing_campaign", "PAUSED")
         if "message" in status_response_json:
             st.success(f"Campaign status updated to: PAUSED")
         else:
             st.error(f"Failed to update status")
 
-st.write("---")
+testing_campaign_section()
+test_campaign_ad_group_ids = st.session_state.get("testing_campaign_ad_group_ids", [])
 
-if "champion_queue" not in st.session_state:
-    st.session_state["champion_queue"] = moloco_simulator.simulate_get_champion_queue_status()
+st.write("---")
 
 st.header("Evaluate Testing Campaign & Champions")
 if st.button("Evaluate Creative Testing Campaign"):
-    # Show performance for each ad group in the testing campaign
-    test_campaign_ad_group_ids = st.session_state.get("testing_campaign_ad_group_ids", [])
-    st.subheader("Ad Group Performance")
-    for ad_group_id in test_campaign_ad_group_ids:
-        url = f"http://localhost:8080/cm/v1/ad_groups/" + ad_group_id
-        ad_group_response = requests.get(url, headers=headers)
-        ad_group_data = ad_group_response.json().get("data", {})
-        if ad_group_data:
-            st.write(f"- **Ad Group `{ad_group_id}`:** {ad_group_data.get('performance', {})}")
+    # Sequential test against the control; winners go to the champion queue automatically
+    evaluate_response_json = client.evaluate_campaign("creative_testing_campaign")
+    if "message" in evaluate_response_json:
+        st.success(evaluate_response_json["message"])
+        st.subheader("Ad Group Decisions")
+        for result in evaluate_response_json.get("data", []):
+            st.write(f"- **Ad Group `{result['ad_group_id']}`:** {result['decision']} "
+                     f"({result['conversions']} conversions / {result['impressions']} impressions)")
+        if "impressions_spent" in evaluate_response_json:
+            st.write(f"Impressions spent: {evaluate_response_json['impressions_spent']} "
+                     f"of {evaluate_response_json['impressions_budget']}")
+    else:
+        st.error(f"Failed to evaluate: {evaluate_response_json.get('error', 'Unknown error')}")
 
     st.write("---")
 selected_ad_group = st.selectbox(
@@ -202,13 +240,9 @@ selected_ad_group = st.selectbox(
 )
 if st.button("Submit Selected Ad Group to Champion Queue"):
     # Simulate submitting selected ad group to the champion queue
-    submit_url = "http://localhost:8080/cm/v1/champion_queue"
-    params = {"ad_group_id": selected_ad_group}
-    submit_response = requests.post(submit_url, headers=headers, json=params)
-    submit_response_json = submit_response.json()
+    submit_response_json = client.submit_champion(selected_ad_group)
     if "message" in submit_response_json:
         st.success(submit_response_json["message"])
-        st.session_state["champion_queue"] = submit_response_json.get("data", [])
     else:
         st.error(f"Failed to submit to champion queue: {submit_response_json.get('error', 'Unknown error')}")
 
@@ -216,19 +250,34 @@ st.write("---")
 
 st.header("Champions Waiting Queue")
 
-# Display the current champion queue status first
-queue_status = st.session_state.get("champion_queue", [])
-if queue_status:
+@st.fragment(run_every=env.change_feed_poll_seconds)
+def champion_queue_section():
+    client.sync_changes(min_interval=env.change_feed_poll_seconds)
+    # Served from the read cache until the change feed reports a queue change
+    queue_response = client.get_champion_queue()
+    if "error" in queue_response:
+        st.error(f"Failed to load the champion queue: {queue_response['error']}")
+        return
+    queue = queue_response["data"]
+    if not queue:
+        st.info("No champion concepts currently in the waiting queue.")
+        return
     st.write("Current Champions in Queue:")
-    for champion_group in queue_status:
-        st.write(f"- `{champion_group}`")
-else:
-    st.info("No champion concepts currently in the waiting queue.")
+    for champion in queue:
+        st.write(f"- `{champion['ad_group_id']}` ({champion['conversions']} conversions / "
+                 f"{champion['impressions']} impressions)")
+    ad_group_ids = [champion["ad_group_id"] for champion in queue]
+    next_in_line = st.selectbox("Move a champion to the front of the queue", options=ad_group_ids[1:],
+                                key="champion_move_to_front")
+    if next_in_line and st.button("Move to Front"):
+        ad_group_ids.remove(next_in_line)
+        reorder_response_json = client.reorder_champions([next_in_line] + ad_group_ids)
+        if "error" in reorder_response_json:
+            st.error(f"Failed to reorder: {reorder_response_json['error']}")
+        else:
+            st.rerun(scope="fragment")
 
-# Update the champion queue if new ad groups have been added (after submission)
-new_champions = moloco_simulator.simulate_get_champion_queue_status()
-if new_champions != queue_status:
-    st.session_state["champion_queue"] = new_champions
+champion_queue_section()
 
 st.write("---")
 st.header("Moloco Campaigns Overview")
@@ -238,42 +287,56 @@ st.header("Moloco Campaigns Overview")
 # Example of calling the local Flask API endpoint from moloco_simulator
 # (Assuming your Flask app is running locally on port 5000)
 
-url = "http://localhost:8080/cm/v1/campaigns"
-params = {
-    "ad_account_id": env.ad_account_id,
-    "product_id": env.product_id,
-    "states": "ACTIVE",
-    "fetch_option": "UNKNOWN_FETCH_OPTION"
-}
-
-response = requests.get(url, headers=headers, params=params)
-campaigns_response = response.json()
-
-if "data" in campaigns_response:
-    campaigns = campaigns_response["data"]
-
-    for campaign in campaigns:
-        st.markdown(f"**Campaign Name:** {campaign['description']} (ID: `{campaign['title']}`)")
-        st.write(f"**Status:** {campaign['status']}")
-        st.write(f"**Type:** {campaign['type']}")
-        st.write(f"**Ad Groups Attached:** {len(campaign['ad_group_ids'])}")
-        cg_key = f"creative_groups_{campaign['campaign_id']}"
-        if cg_key not in st.session_state:
-            st.session_state[cg_key] = list(campaign['ad_group_ids'])
-        # Always display the latest creative groups from session_state
-        st.write(f"Ad Groups: {st.session_state[cg_key]}")
-        if st.button(f"Replace Worst in {campaign['description']}", key=f"replace_{campaign['campaign_id']}"):
-            replace_response = moloco_simulator.simulate_replace_worst_creative_in_regular_campaign(campaign['campaign_id'])
-            if "message" in replace_response:
-                st.success(replace_response["message"])
-                # Update session_state with the new creative group list
-                st.session_state[cg_key] = st.session_state[cg_key] + [replace_response["new_champion_id"]]
-                if replace_response["replaced_ad_group_id"]:
-                    st.session_state[cg_key].remove(replace_response["replaced_ad_group_id"])
-                # Display the updated creative groups immediately
-                st.write(f"Updated Ad Groups: {st.session_state[cg_key]}")
-            else:
-                st.error(f"Failed to replace: {replace_response.get('error', 'Unknown error')}")
-        st.markdown("---")
-else:
-    st.error(f"Error fetching campaigns: {campaigns_response.get('error', 'Unknown error')}")
\ No newline at end of file
+@st.fragment(run_every=env.change_feed_poll_seconds)
+def campaigns_overview():
+    campaigns_changed = changed_since_last_run("campaigns_overview", "campaign")
+    campaigns_response = client.get_campaigns(
+        ad_account_id=env.ad_account_id,
+        product_id=env.product_id,
+        states="ACTIVE",
+        fetch_option="UNKNOWN_FETCH_OPTION"
+    )
+
+    # The simulator also rotates on its own every rotation_interval_seconds
+    if st.button("Rotate All Regular Campaigns Now"):
+        rotation_response = client.run_rotation()
+        if "data" in rotation_response:
+            st.success(f"Rotation run {rotation_response['data']['run_id']} replaced "
+                       f"{rotation_response['data']['replaced']} worst ad groups.")
+        else:
+            st.error(f"Failed to rotate: {rotation_response.get('error', 'Unknown error')}")
+    latest_runs = client.get_rotations(limit=1).get("data", [])
+    if latest_runs:
+        st.caption(f"Last rotation run {latest_runs[0]['run_id']} ({latest_runs[0]['trigger']}): "
+                   f"{latest_runs[0]['replaced']} replaced")
+
+    if "data" in campaigns_response:
+        campaigns = campaigns_response["data"]
+
+        for campaign in campaigns:
+            st.markdown(f"**Campaign Name:** {campaign['description']} (ID: `{campaign['title']}`)")
+            st.write(f"**Status:** {campaign['status']}")
+            st.write(f"**Type:** {campaign['type']}")
+            st.write(f"**Ad Groups Attached:** {len(campaign['ad_group_ids'])}")
+            cg_key = f"creative_groups_{campaign['campaign_id']}"
+            if cg_key not in st.session_state or campaigns_changed:
+                st.session_state[cg_key] = list(campaign['ad_group_ids'])
+            # Always display the latest creative groups from session_state
+            st.write(f"Ad Groups: {st.session_state[cg_key]}")
+            if st.button(f"Replace Worst in {campaign['description']}", key=f"replace_{campaign['campaign_id']}"):
+                replace_response = client.replace_worst(campaign['campaign_id'])
+                if "message" in replace_response:
+                    st.success(replace_response["message"])
+                    # Update session_state with the new creative group list
+                    st.session_state[cg_key] = st.session_state[cg_key] + [replace_response["new_champion_id"]]
+                    if replace_response["replaced_ad_group_id"]:
+                        st.session_state[cg_key].remove(replace_response["replaced_ad_group_id"])
+                    # Display the updated creative groups immediately
+                    st.write(f"Updated Ad Groups: {st.session_state[cg_key]}")
+                else:
+                    st.error(f"Failed to replace: {replace_response.get('error', 'Unknown error')}")
+            st.markdown("---")
+    else:
+        st.error(f"Error fetching campaigns: {campaigns_response.get('error', 'Unknown error')}")
+
+campaigns_overview()
\ No newline at end of file
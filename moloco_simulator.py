@@ -1,18 +1,44 @@
+import argparse
+import atexit
+import os
+import signal
+import subprocess
+import sys
 import uuid
 import datetime
+import functools
+import time
+import hashlib
+import logging
 import random
+import numpy as np
 import env_variables as env
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from dtos.campaign import Campaign
 from dtos.ad_group import AdGroup
 from dtos.creative_group import CreativeGroup
 from dtos.creative import Creative
+from simulator.blob_store import BlobStore, UploadError, is_content_hash
+from simulator.dataset import SyntheticDataset
+from simulator.entity_store import EntityStore
+from simulator.instrumentation import RequestMetrics, instrument
+from simulator.media_jobs import MediaJobQueue, QueueFullError
+from simulator.persistence import PersistenceError, SQLitePersistence
+from simulator.performance_engine import NOISE_MODELS, PerformanceEngine
+from simulator.performance_store import GRANULARITIES, PerformanceTimeSeries
+from simulator.sequential_test import DECISION_NAMES, SequentialEvaluator, WINNER
+from simulator.serialization import FastJSONProvider, dumps
+from simulator.rate_limiter import RateLimiter, rate_limit
+from simulator.rotation_scheduler import RotationScheduler
+from simulator.traffic_allocator import ALLOCATION_MODES, ThompsonAllocator
+from simulator.shard_router import ShardRouter, create_router_app, shard_for_account, shard_tag
+from simulator.pagination import build_filter, decode_page_token, ndjson_stream, paginate, parse_page_size
 
 # --- In-memory Data Stores (Mock Moloco Database) ---
 # Initialize data with two creatives and one creative group
 # Three campaigns: one testing, two regular
 
-_MOLOCO_CREATIVES = [] # Stores mock creative data
+_STORE = EntityStore() # Indexed store for all mock entities
 creative_1 = Creative(
     id="creative_00000001",
     ad_account_id=env.ad_account_id,
@@ -57,11 +83,6 @@ creative_4 = Creative(
     createTime=datetime.datetime.now().isoformat(),
     lastModifiedTime=datetime.datetime.now().isoformat()
 )
-_MOLOCO_CREATIVES.append(creative_1)
-_MOLOCO_CREATIVES.append(creative_2)
-_MOLOCO_CREATIVES.append(creative_3)
-_MOLOCO_CREATIVES.append(creative_4)
-_MOLOCO_CREATIVE_GROUPS = [] # Stores mock creative group data
 # Pre-populate the "good_creative_group" as it's a control group
 good_creative_group = CreativeGroup(
     id="good_creative_group",
@@ -83,7 +104,6 @@ regular_creative_group = CreativeGroup(
     lastModifiedTime=datetime.datetime.now().isoformat(),
     performance={"impressions": 0, "conversions": 0}
 )
-_MOLOCO_CREATIVE_GROUPS.append(good_creative_group)
 good_ad_group = AdGroup(
     ad_group_id="good_ad_group",
     campaign_id="creative_testing_campaign",
@@ -127,11 +147,6 @@ regular_campaign_b = Campaign(
     createTime=datetime.datetime.now().isoformat(),
     lastModifiedTime=datetime.datetime.now().isoformat(),
 )
-_MOLOCO_CAMPAIGNS = [
-    testing_campaign,
-    regular_campaign_a,
-    regular_campaign_b
-]
 # Stores champion creative group IDs in a waiting line
 champion_ad1 = AdGroup(
     ad_group_id="champion_cg_1",
@@ -151,106 +166,522 @@ champion_ad3 = AdGroup(
     creative_group_ids=["champion_cg_3"], 
     performance={"impressions": 10000, "conversions": 200}
 )
-_MOLOCO_CHAMPION_CONCEPTS_QUEUE = [
-    champion_ad1, champion_ad2, champion_ad3
-] 
-_MOLOCO_AD_GROUPS = [] # Stores mock ad group data
-_MOLOCO_AD_GROUPS.append(good_ad_group) # Add the good ad group to the mock data
-_MOLOCO_AD_GROUPS.append(champion_ad1) # Add champion ad groups to the mock data
-_MOLOCO_AD_GROUPS.append(champion_ad2) # Add champion ad groups to the mock data
-_MOLOCO_AD_GROUPS.append(champion_ad3) # Add champion ad groups to the mock data
+
+def _add_fixtures(store: EntityStore):
+    """Adds the fixture entities above to store, e.g. next to a generated dataset."""
+    store.add_creative(creative_1)
+    store.add_creative(creative_2)
+    store.add_creative(creative_3)
+    store.add_creative(creative_4)
+    store.add_creative_group(good_creative_group)
+    store.add_ad_group(good_ad_group) # Add the good ad group to the mock data
+    store.add_ad_group(champion_ad1) # Add champion ad groups to the mock data
+    store.add_ad_group(champion_ad2) # Add champion ad groups to the mock data
+    store.add_ad_group(champion_ad3) # Add champion ad groups to the mock data
+    store.add_campaign(testing_campaign)
+    store.add_campaign(regular_campaign_a)
+    store.add_campaign(regular_campaign_b)
+    store.enqueue_champion(champion_ad1)
+    store.enqueue_champion(champion_ad2)
+    store.enqueue_champion(champion_ad3)
+
+_add_fixtures(_STORE)
+
+_ENGINE = PerformanceEngine() # Vectorized impression / conversion simulator
+_PERFORMANCE_HISTORY = PerformanceTimeSeries() # Hourly / daily performance rollups per ad group
+_EVALUATOR = SequentialEvaluator() # Sequential tests of testing campaign arms against the control
+_ALLOCATOR = ThompsonAllocator() # Splits the impression budget of THOMPSON campaigns across their ad groups
+_CONTROL_AD_GROUP_ID = "good_ad_group" # Control arm of the testing campaign
+_BLOBS = BlobStore(env.blob_store_dir) # Content-addressed storage for uploaded assets
+# Background probing of uploaded assets; _finish_media_job is defined with the creative endpoints
+_MEDIA_JOBS = MediaJobQueue(lambda job: _finish_media_job(job), max_workers=env.media_workers,
+                            max_pending=env.media_queue_limit, job_timeout=env.media_job_timeout_seconds)
+# Rotates champions into every REGULAR campaign; _rotate_regular_campaigns is defined with the champion endpoints
+_ROTATION = RotationScheduler(lambda run_id: _rotate_regular_campaigns(run_id), env.rotation_interval_seconds,
+                              history=100)
+_LAST_ROTATED = {} # Campaign ID -> the last rotation run that replaced one of its ad groups
+_SHARD_TAG = "" # Suffix of generated IDs when this process is one shard behind a router
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app) # orjson-backed when installed
+_LOG = logging.getLogger("simulator")
+_METRICS = RequestMetrics() # Served at /metrics
+_METRICS.add_gauge("champion_queue_size", "Ad groups waiting in the champion queue.",
+                   lambda: _STORE.champion_queue_size())
+_METRICS.add_gauge("media_jobs_pending", "Media jobs queued or running.", lambda: _MEDIA_JOBS.pending())
+instrument(app, _METRICS, log_sample_rate=env.request_log_sample_rate,
+           slow_request_seconds=env.slow_request_seconds, allow_profiling=env.request_profiling)
+_RATE_LIMITER = RateLimiter(env.rate_limit_per_second, env.rate_limit_burst, env.rate_limit_overrides)
+rate_limit(app, _RATE_LIMITER) # 429 with Retry-After past an account's per-endpoint quota
+_METRICS.add_gauge("rate_limit_buckets", "Token buckets tracked by the rate limiter.",
+                   lambda: _RATE_LIMITER.bucket_count())
+_PERSISTENCE = None # SQLitePersistence behind the store when started with --db
+
+@app.before_request
+def _refuse_unpersisted_writes():
+    """Answers writes with 503 once the database stopped accepting them, instead of changing only memory."""
+    if request.method in ("POST", "PUT", "DELETE") and _PERSISTENCE is not None and _PERSISTENCE.error:
+        return jsonify({"error": f"Changes cannot be saved: {_PERSISTENCE.error}"}), 503
+
+@app.errorhandler(PersistenceError)
+def _persistence_failed(e):
+    return jsonify({"error": f"Changes cannot be saved: {e}"}), 503
+
 # --- Helper Function for ID Generation ---
+def _holding_store_lock(view):
+    """
+    Runs a handler under the store lock. For handlers that read and then write, or that touch the
+    performance engine, history or evaluator, which share the store's lock instead of having their own.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with _STORE.lock:
+            return view(*args, **kwargs)
+    return wrapper
+
 def _generate_id(prefix="id"):
-    """Generates a unique ID with a given prefix."""
-    return f"{prefix}_{str(uuid.uuid4()).replace('-', '_')[:8]}"
+    """Generates a unique ID with a given prefix, tagged with this process's shard when sharded."""
+    return f"{prefix}_{str(uuid.uuid4()).replace('-', '_')[:8]}{_SHARD_TAG}"
 
-# --- Simulation Functions (Mock Moloco API Endpoints) ---
-@app.route('/cm/v1/creatives', methods=['POST'])
-def upload_creative():
+def _wants_ndjson():
+    """True when the caller asked for a streamed NDJSON response instead of a single JSON body."""
+    return request.args.get("format") == "ndjson" or \
+        request.accept_mimetypes.best == "application/x-ndjson"
+
+def _entity_etag(kind: str, entity_id: str, entity) -> str:
+    """ETag of a single entity, derived from its store version and lastModifiedTime."""
+    last_modified = getattr(entity, "lastModifiedTime", "")
+    raw = f"{kind}:{entity_id}:{_STORE.version(kind, entity_id)}:{last_modified}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def _conditional_jsonify(payload_fn, etag: str):
     """
-    Simulates the Moloco API call to upload an asset.
-    Returns a mock response dictionary.
+    Returns 304 Not Modified when the request's If-None-Match matches etag.
+    Otherwise builds the JSON body from payload_fn, so unchanged entities are never serialized.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload_fn())
+    response.set_etag(etag)
+    return response
+
+def _list_jsonify(payload: dict):
+    """JSON list response with a content ETag, answered with 304 when If-None-Match matches."""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
+def _parse_modified_since():
+    """Returns the normalized modified_since query param, or None when it was not given."""
+    value = request.args.get("modified_since")
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid modified_since '{value}'.")
+
+def _delta_response(changed, predicate, server_time: str):
+    """Response for a modified_since delta query: only the changed entities that match the filters."""
+    return _list_jsonify({"data": [entity.to_dict() for entity in changed if predicate(entity)],
+                          "server_time": server_time})
+
+def _list_response(scan, predicate, page_size):
+    """
+    Builds a list endpoint response from a lazy (position, entity) scan.
+    Streams NDJSON when requested, otherwise returns one page with its next_page_token.
+    """
+    if _wants_ndjson():
+        return Response(stream_with_context(ndjson_stream(scan, predicate, limit=page_size)),
+                        mimetype="application/x-ndjson")
+    data, next_page_token = paginate(scan, predicate, page_size)
+    return _list_jsonify({"data": data, "next_page_token": next_page_token})
+
+def _create_creative(fields):
+    """
+    Creates a creative from a mapping of request fields and adds it to the store.
+    A content_hash field links the creative to an asset uploaded through /cm/v1/uploads; such a
+    creative starts out PROCESSING and a media job probes the asset in the background.
     """
-    ad_account_id = request.args.get("ad_account_id")
-    product_id = request.args.get("product_id")
     creative_id = _generate_id("creative")
-    title = request.args.get("title", "New Creative")
-    type = request.args.get("type")
-    ad_type = request.args.get("ad_type")
-    upload_time = random.randint(2, 10) # Simulate varying upload times
     now = datetime.datetime.now().isoformat()
+    content_hash = fields.get("content_hash")
     creative = Creative(
         id=creative_id, 
-        ad_account_id=ad_account_id,
-        product_id=product_id,
-        title=title, 
-        type=type,
-        ad_type=ad_type,
+        ad_account_id=fields.get("ad_account_id"),
+        product_id=fields.get("product_id"),
+        title=fields.get("title", "New Creative"), 
+        type=fields.get("type"),
+        ad_type=fields.get("ad_type"),
         video_property={"auto_endcard": True}, # Assume video property for simplicity
         createTime=now,
-        lastModifiedTime=now
+        lastModifiedTime=now,
+        content_hash=content_hash,
+        status="PROCESSING" if content_hash else "READY"
     )
-    _MOLOCO_CREATIVES.append(creative)
-    return jsonify({"data": {"id": creative_id, "status": "uploaded", "upload_time_seconds": upload_time}})
+    _STORE.add_creative(creative)
+    if content_hash:
+        job = _submit_media_job(creative)
+        return {"id": creative_id, "status": creative.status, "content_hash": content_hash,
+                "size": _BLOBS.blob_size(content_hash), "job_id": job.job_id}
+    upload_time = random.randint(2, 10) # Simulate varying upload times for creatives without an asset
+    return {"id": creative_id, "status": creative.status, "upload_time_seconds": upload_time}
+
+def _submit_media_job(creative):
+    """
+    Queues the probe of the creative's asset. When the queue is full the creative is marked FAILED,
+    so it does not stay PROCESSING forever, and QueueFullError propagates (a 503 in requests).
+    """
+    try:
+        return _MEDIA_JOBS.submit(creative.id, _BLOBS.blob_path(creative.content_hash), creative.content_hash,
+                                  creative.ad_type)
+    except QueueFullError as e:
+        _STORE.update_creative_status(creative.id, "FAILED", {"processing_error": f"Not processed: {e}"})
+        raise
+
+@app.errorhandler(QueueFullError)
+def _media_queue_full(e):
+    """Jobs that got past _queue_full_response while other requests filled the queue."""
+    response = jsonify({"error": f"Media processing queue is full: {e} Retry later."})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+def _finish_media_job(job):
+    """Records a finished media job's metadata on its creative and flips it to READY or FAILED."""
+    metadata = dict(job.result or {})
+    thumbnail = metadata.pop("thumbnail", None)
+    if thumbnail:
+        metadata["thumbnail_hash"] = _BLOBS.put_bytes(thumbnail)
+    metadata.pop("checksum_ok", None)
+    metadata["processing_error"] = metadata.pop("error", None) or job.error
+    if _STORE.get_creative(job.creative_id) is not None:
+        _STORE.update_creative_status(job.creative_id, "FAILED" if job.error else "READY", metadata)
+
+def _queue_full_response(count: int):
+    """503 with Retry-After when count more media jobs would overflow the queue (400 if they never fit), else None."""
+    if _MEDIA_JOBS.has_capacity(count):
+        return None
+    if count > _MEDIA_JOBS.max_pending:
+        return jsonify({"error": f"At most {_MEDIA_JOBS.max_pending} assets can be processed per batch."}), 400
+    retry_after = _MEDIA_JOBS.retry_after()
+    response = jsonify({"error": f"Media processing queue cannot take {count} more job(s): "
+                                 f"{_MEDIA_JOBS.pending()} of {_MEDIA_JOBS.max_pending} pending. "
+                                 f"Retry in {retry_after}s."})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 503
+
+def _content_hash_error(creatives):
+    """400 when a creative's content_hash is not a hex SHA-256 digest or not in the blob store, else None."""
+    hashes = [c["content_hash"] for c in creatives if c.get("content_hash")]
+    invalid = [h for h in hashes if not is_content_hash(h)]
+    if invalid:
+        return jsonify({"error": f"content_hash must be a lowercase hex SHA-256 digest: {invalid}"}), 400
+    missing = [h for h in hashes if not _BLOBS.has_blob(h)]
+    if missing:
+        return jsonify({"error": f"Unknown content_hash: {missing}"}), 400
+    return None
+
+# --- Simulation Functions (Mock Moloco API Endpoints) ---
+@app.route('/health', methods=['GET'])
+def health():
+    """200 while the simulator can serve and save changes; 503 with the reason once the database failed."""
+    if _PERSISTENCE is not None and _PERSISTENCE.error:
+        return jsonify({"status": "failing", "error": _PERSISTENCE.error}), 503
+    return jsonify({"status": "ok"})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request counters, latency histograms and in-flight gauges in the Prometheus text format."""
+    return Response(_METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+def _parse_change_cursor():
+    """Returns (since, kinds) from the change feed query params; since may come from Last-Event-ID."""
+    since = request.args.get("since", request.headers.get("Last-Event-ID", 0))
+    try:
+        since = int(since)
+    except ValueError:
+        raise ValueError(f"Invalid since '{since}'.")
+    kinds = {kind for value in request.args.getlist("kinds") for kind in value.split(",") if kind}
+    return since, kinds
+
+def _change_events(feed, since: int, kinds: set, limit: int = 1000):
+    """Returns (events as dicts, sequence to resume from, reset) for the feed after since."""
+    events, reset = feed.since(since, limit)
+    if reset:
+        return [], feed.sequence, True
+    next_since = events[-1][0] if events else since
+    return [{"seq": seq, "kind": kind, "id": entity_id, "version": version}
+            for seq, kind, entity_id, version in events if not kinds or kind in kinds], next_since, False
+
+@app.route('/cm/v1/changes', methods=['GET'])
+def get_changes():
+    """
+    Long-polls the entity change feed.
+    Query params: since (the last sequence seen, default 0), feed_id (the feed_id of the previous
+    response), kinds (comma separated, e.g. campaign,ad_group), timeout (seconds to wait for a
+    change, default 0, at most 30).
+    Returns {"data": [{seq, kind, id, version}, ...], "sequence", "feed_id", "reset"}; the next call
+    passes sequence as since. reset=true means events were missed (the subscriber fell behind or
+    the server restarted): reload everything, then continue from sequence.
+    """
+    try:
+        since, kinds = _parse_change_cursor()
+        timeout = min(float(request.args.get("timeout", 0)), 30.0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    feed = _STORE.changes
+    if request.args.get("feed_id", feed.feed_id) != feed.feed_id:
+        return jsonify({"data": [], "sequence": feed.sequence, "feed_id": feed.feed_id, "reset": True})
+    deadline = time.monotonic() + timeout
+    events, sequence, reset = _change_events(feed, since, kinds)
+    # Keep waiting while nothing arrives, or only events of other kinds
+    while not events and not reset and feed.wait(sequence, deadline - time.monotonic()):
+        events, sequence, reset = _change_events(feed, sequence, kinds)
+    return jsonify({"data": events, "sequence": sequence, "feed_id": feed.feed_id, "reset": reset})
+
+@app.route('/cm/v1/changes/stream', methods=['GET'])
+def stream_changes():
+    """
+    Server-sent events version of /cm/v1/changes: one "change" event per entity change, with the
+    sequence number as the event id, so a reconnecting EventSource resumes through Last-Event-ID.
+    A "reset" event means events were missed and the subscriber has to reload. Every stream holds
+    one server thread, so this is meant for a handful of dashboards, not for every page view.
+    """
+    try:
+        since, kinds = _parse_change_cursor()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    feed = _STORE.changes
+
+    def generate(since):
+        yield f"retry: 3000\nevent: hello\ndata: {dumps({'feed_id': feed.feed_id, 'sequence': feed.sequence})}\n\n"
+        while True:
+            events, sequence, reset = _change_events(feed, since, kinds)
+            if reset:
+                yield f"id: {sequence}\nevent: reset\ndata: {dumps({'sequence': sequence})}\n\n"
+            for event in events:
+                yield f"id: {event['seq']}\nevent: change\ndata: {dumps(event)}\n\n"
+            since = sequence
+            if not feed.wait(since, 15):
+                yield ": keepalive\n\n"
+
+    return Response(generate(since), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/cm/v1/creatives', methods=['POST'])
+@_holding_store_lock
+def upload_creative():
+    """
+    Simulates the Moloco API call to upload an asset.
+    Creatives with a content_hash are returned right away as PROCESSING along with the job_id
+    to poll at /cm/v1/media_jobs/<job_id>; 503 with Retry-After when the media queue is full.
+    Returns a mock response dictionary.
+    """
+    hash_error = _content_hash_error([request.args])
+    if hash_error:
+        return hash_error
+    queue_full = _queue_full_response(1 if request.args.get("content_hash") else 0)
+    if queue_full:
+        return queue_full
+    return jsonify({"data": _create_creative(request.args)})
+
+@app.route('/cm/v1/creatives/batch', methods=['POST'])
+@_holding_store_lock
+def batch_upload_creatives():
+    """
+    Simulates uploading several assets in one call.
+    Expects a JSON body {"creatives": [{ad_account_id, product_id, title, type, ad_type}, ...]}
+    and returns one result per creative, in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    creatives = data.get("creatives")
+    if not isinstance(creatives, list) or not creatives or not all(isinstance(c, dict) for c in creatives):
+        return jsonify({"error": "Request body must contain a non-empty 'creatives' list of objects."}), 400
+    hash_error = _content_hash_error(creatives)
+    if hash_error:
+        return hash_error
+    # All or nothing: a batch is only accepted when every one of its media jobs fits in the queue
+    queue_full = _queue_full_response(sum(1 for c in creatives if c.get("content_hash")))
+    if queue_full:
+        return queue_full
+    return jsonify({"data": [_create_creative(fields) for fields in creatives]})
+
+@app.route('/cm/v1/media_jobs/<job_id>', methods=['GET'])
+def get_media_job(job_id: str):
+    """Status of a creative's media processing job: QUEUED, RUNNING, DONE or FAILED."""
+    job = _MEDIA_JOBS.job(job_id)
+    if job is None:
+        return jsonify({"error": f"Media job '{job_id}' not found."}), 404
+    return jsonify({"data": job.to_dict()})
+
+@app.route('/cm/v1/uploads', methods=['POST'])
+def init_upload():
+    """
+    Starts a resumable asset upload. Body: {"filename", "size", "content_hash"}, all optional.
+    When content_hash names a blob that is already stored, nothing needs to be sent and the
+    response carries that hash with deduplicated=true instead of an upload_id.
+    """
+    data = request.get_json(silent=True) or {}
+    content_hash = data.get("content_hash")
+    if content_hash is not None and not is_content_hash(content_hash):
+        return jsonify({"error": "content_hash must be a lowercase hex SHA-256 digest."}), 400
+    if content_hash and _BLOBS.has_blob(content_hash):
+        return jsonify({"data": {"content_hash": content_hash, "size": _BLOBS.blob_size(content_hash),
+                                 "deduplicated": True}})
+    size = data.get("size")
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({"error": "size must be a non-negative integer."}), 400
+    upload_id = _BLOBS.init_upload(data.get("filename", ""), size)
+    return jsonify({"data": {"upload_id": upload_id, "offset": 0}}), 201
+
+@app.route('/cm/v1/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id: str):
+    """Returns how many bytes of the upload were received, which is where a resumed upload continues."""
+    try:
+        return jsonify({"data": {"upload_id": upload_id, "offset": _BLOBS.offset(upload_id)}})
+    except KeyError:
+        return jsonify({"error": f"Upload '{upload_id}' not found."}), 404
+
+@app.route('/cm/v1/uploads/<upload_id>', methods=['PUT'])
+def upload_part(upload_id: str):
+    """
+    Appends the raw request body to the upload. The offset query param must equal the bytes
+    received so far; otherwise the part is rejected with 409 and the offset to resume from.
+    The body is streamed to disk in chunks and never held in memory as a whole.
+    """
+    try:
+        offset = int(request.args.get("offset", 0))
+        new_offset = _BLOBS.write_part(upload_id, offset, request.stream)
+    except ValueError:
+        return jsonify({"error": "offset must be an integer."}), 400
+    except KeyError:
+        return jsonify({"error": f"Upload '{upload_id}' not found."}), 404
+    except UploadError as e:
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    return jsonify({"data": {"upload_id": upload_id, "offset": new_offset}})
+
+@app.route('/cm/v1/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id: str):
+    """Finalizes the upload into the content-addressed blob store and returns its content_hash."""
+    try:
+        return jsonify({"data": _BLOBS.complete(upload_id)})
+    except KeyError:
+        return jsonify({"error": f"Upload '{upload_id}' not found."}), 404
+    except UploadError as e:
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+
+@app.route('/cm/v1/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id: str):
+    try:
+        _BLOBS.abort(upload_id)
+    except KeyError:
+        return jsonify({"error": f"Upload '{upload_id}' not found."}), 404
+    return jsonify({"message": f"Upload '{upload_id}' aborted."})
 
 @app.route('/cm/v1/creatives/<ad_type>', methods=['GET'])
 def get_creative_by_ad_type(ad_type):
     """
     Simulates the Moloco API call to retrieve a creative by its ad_type.
+    Supports cursor pagination (page_size, page_token), filtering on type, status and
+    createTime (create_time_from, create_time_to) and streaming with format=ndjson.
+    With modified_since, only the creatives changed after that timestamp are returned.
     Returns a mock response dictionary.
     """
-    result = []
-    for creative in _MOLOCO_CREATIVES:
-        if creative.ad_type == ad_type:
-            result.append(creative.to_dict())
+    server_time = datetime.datetime.now().isoformat()
+    try:
+        page_size = parse_page_size(request.args.get("page_size"))
+        start = decode_page_token(request.args.get("page_token"))
+        predicate = build_filter(request.args, ("type", "status", "ad_account_id", "product_id"))
+        modified_since = _parse_modified_since()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if modified_since is not None:
+        changed = [c for c in _STORE.creatives_modified_since(modified_since) if c.ad_type == ad_type]
+        return _delta_response(changed, predicate, server_time)
+    if page_size is not None or start or _wants_ndjson():
+        return _list_response(_STORE.scan_creatives_by_ad_type(ad_type, start), predicate, page_size)
+    result = [creative.to_dict() for creative in _STORE.creatives_by_ad_type(ad_type) if predicate(creative)]
     if result:
-        return jsonify({"data": result})
+        return _list_jsonify({"data": result})
     return jsonify({"error": f"No creatives found for ad_type '{ad_type}'."})
 
-@app.route('/cm/v1/creative_groups', methods=['POST'])
-def create_creative_group():
-    """
-    Simulates the Moloco API call to create a creative group.
-    Returns a mock response dictionary.
-    """
+def _create_creative_group(fields, creative_ids):
+    """Creates a creative group from a mapping of request fields and adds it to the store."""
     creative_group_id = _generate_id("creative_group")
-    creative_ids = request.args.getlist("creative_ids")
     creative_group = CreativeGroup(
         id=creative_group_id,
-        title=request.args.get("title", "New Creative Group"),
-        description=request.args.get("description", "No description provided"),
+        title=fields.get("title", "New Creative Group"),
+        description=fields.get("description", "No description provided"),
         creative_ids=creative_ids,
         status="ACTIVE",
         createTime=datetime.datetime.now().isoformat(),
         lastModifiedTime=datetime.datetime.now().isoformat()
     )
-    _MOLOCO_CREATIVE_GROUPS.append(creative_group)
-    return jsonify({"data": {"id": creative_group.id, "creatived_ids": creative_ids, "status": "ACTIVE"}})
+    _STORE.add_creative_group(creative_group)
+    return {"id": creative_group.id, "creatived_ids": creative_ids, "status": "ACTIVE"}
+
+@app.route('/cm/v1/creative_groups', methods=['POST'])
+def create_creative_group():
+    """
+    Simulates the Moloco API call to create a creative group.
+    Returns a mock response dictionary.
+    """
+    creative_ids = request.args.getlist("creative_ids")
+    return jsonify({"data": _create_creative_group(request.args, creative_ids)})
+
+@app.route('/cm/v1/creative_groups/batch', methods=['POST'])
+@_holding_store_lock
+def batch_create_creative_groups():
+    """
+    Simulates creating several creative groups in one call.
+    Expects a JSON body {"creative_groups": [{title, description, creative_ids}, ...]}
+    and returns one result per creative group, in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    creative_groups = data.get("creative_groups")
+    if not isinstance(creative_groups, list) or not creative_groups:
+        return jsonify({"error": "Request body must contain a non-empty 'creative_groups' list."}), 400
+    return jsonify({"data": [_create_creative_group(fields, list(fields.get("creative_ids", [])))
+                             for fields in creative_groups]})
 
 @app.route('/cm/v1/campaigns', methods=['GET'])
 def get_campaigns():
     """
     API endpoint to retrieve all campaign data.
     Supports Moloco-like query parameters: ad_account_id, product_id, states, fetch_option.
+    Also supports cursor pagination (page_size, page_token), filtering on type, status and
+    createTime (create_time_from, create_time_to) and streaming with format=ndjson.
+    With modified_since, only the campaigns changed after that timestamp are returned.
     """
+    server_time = datetime.datetime.now().isoformat()
     # For simulation, ignore query params but accept them for compatibility
     ad_account_id = request.args.get('ad_account_id')
     product_id = request.args.get('product_id')
     states = request.args.get('states')
     fetch_option = request.args.get('fetch_option')
+    try:
+        page_size = parse_page_size(request.args.get("page_size"))
+        start = decode_page_token(request.args.get("page_token"))
+        predicate = build_filter(request.args, ("type", "status", "ad_account_id", "product_id"))
+        modified_since = _parse_modified_since()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if modified_since is not None:
+        changed = [c for c in _STORE.campaigns_modified_since(modified_since) if not states or c.status == states]
+        return _delta_response(changed, predicate, server_time)
+    if page_size is not None or start or _wants_ndjson():
+        scan = _STORE.scan_campaigns(start)
+        if states:
+            scan = ((position, c) for position, c in scan if c.status == states)
+        return _list_response(scan, predicate, page_size)
     # Filter campaigns based on query params (if provided)
     campaign_list = []
-    for c in _MOLOCO_CAMPAIGNS:
-        if states and c.status != states:
+    for c in _STORE.campaigns(status=states or None):
+        if not predicate(c):
             continue
-        if ad_account_id and c.ad_account_id != ad_account_id:
-            continue
-        if product_id and c.product_id != product_id:
-            continue
-        campaign_list.append(c.to_dict() if hasattr(c, "to_dict") else c.__dict__)
-    return jsonify({"data": campaign_list})
+        campaign_list.append(c.to_dict())
+    return _list_jsonify({"data": campaign_list})
 
 @app.route('/cm/v1/campaigns/<campaign_id>', methods=['GET'])
 def get_campaign_by_id(campaign_id: str):
@@ -258,33 +689,116 @@ def get_campaign_by_id(campaign_id: str):
     Helper function to retrieve a campaign by its ID.
     Returns the campaign object or None if not found.
     """
-    for campaign in _MOLOCO_CAMPAIGNS:
-        if campaign.campaign_id == campaign_id:
-            return jsonify({"data" : campaign.to_dict() if hasattr(campaign, "to_dict") else campaign.__dict__})
+    campaign = _STORE.get_campaign(campaign_id)
+    if campaign is not None:
+        return _conditional_jsonify(lambda: {"data" : campaign.to_dict()},
+                                    _entity_etag("campaign", campaign_id, campaign))
     return jsonify({"error": f"Campaign with ID '{campaign_id}' not found."})
 
+def _find_attached_ad_group(ad_group_id: str):
+    """Returns the ad group if it is attached to a campaign, as only those are visible through the API."""
+    if _STORE.campaign_for_ad_group(ad_group_id) is None:
+        return None
+    return _STORE.get_ad_group(ad_group_id)
+
 @app.route('/cm/v1/ad_groups/<ad_group_id>', methods=['GET'])
 def get_ad_group_by_id(ad_group_id: str):
     """
     Helper function to retrieve an ad group by its ID.
     Returns the ad group object or None if not found.
     """
-    print(f"Retrieving ad group with ID: {ad_group_id}")
-    for campaign in _MOLOCO_CAMPAIGNS:
-        print(campaign.ad_group_ids)
-        for agid in campaign.ad_group_ids:
-            if ad_group_id == agid:
-                ad_group = next((ag for ag in _MOLOCO_AD_GROUPS if ag.ad_group_id == ad_group_id), None)
-                if ad_group is not None:
-                    return jsonify({"data": ad_group.to_dict() if hasattr(ad_group, "to_dict") else ad_group.__dict__})
+    ad_group = _find_attached_ad_group(ad_group_id)
+    if ad_group is not None:
+        return _conditional_jsonify(lambda: {"data": ad_group.to_dict()},
+                                    _entity_etag("ad_group", ad_group_id, ad_group))
     return jsonify({"error": f"Ad Group with ID '{ad_group_id}' not found."})
 
+@app.route('/cm/v1/ad_groups', methods=['GET'])
+def get_ad_groups_by_ids():
+    """
+    Retrieves several ad groups in one call.
+    Accepts ids either comma separated (?ids=a,b) or repeated (?ids=a&ids=b).
+    Returns the found ad groups in request order and the IDs that were not found.
+    """
+    ad_group_ids = [agid for value in request.args.getlist("ids") for agid in value.split(",") if agid]
+    found = []
+    not_found = []
+    for ad_group_id in ad_group_ids:
+        ad_group = _find_attached_ad_group(ad_group_id)
+        if ad_group is None:
+            not_found.append(ad_group_id)
+        else:
+            found.append(ad_group)
+    # The combined ETag only needs versions, so a matching If-None-Match skips serialization
+    etag = hashlib.sha1("\n".join(
+        [_entity_etag("ad_group", ag.ad_group_id, ag) for ag in found] + not_found).encode()).hexdigest()
+    return _conditional_jsonify(lambda: {"data": [ag.to_dict() for ag in found], "not_found": not_found}, etag)
+
+def _parse_performance_window():
+    """Parses the from / to / granularity query params of the performance history endpoints."""
+    granularity = request.args.get("granularity", "hour")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {list(GRANULARITIES)}.")
+    bounds = []
+    for name in ("from", "to"):
+        value = request.args.get(name)
+        try:
+            bounds.append(int(datetime.datetime.fromisoformat(value).timestamp()) if value else None)
+        except ValueError:
+            raise ValueError(f"Invalid '{name}' timestamp '{value}'.")
+    return granularity, bounds[0], bounds[1]
+
+@app.route('/cm/v1/ad_groups/<ad_group_id>/performance', methods=['GET'])
+@_holding_store_lock
+def get_ad_group_performance_history(ad_group_id: str):
+    """
+    Returns the ad group's performance per hour or day between from (inclusive) and to (exclusive).
+    Query params: from, to (ISO timestamps, optional), granularity ("hour" or "day", default "hour").
+    """
+    if _STORE.get_ad_group(ad_group_id) is None:
+        return jsonify({"error": f"Ad Group with ID '{ad_group_id}' not found."}), 404
+    try:
+        granularity, from_ts, to_ts = _parse_performance_window()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    buckets = _PERFORMANCE_HISTORY.series(ad_group_id, granularity, from_ts, to_ts)
+    for bucket in buckets:
+        bucket["start"] = datetime.datetime.fromtimestamp(bucket["start"]).isoformat()
+    return jsonify({"data": {
+        "ad_group_id": ad_group_id,
+        "granularity": granularity,
+        "buckets": buckets,
+        "total": {"impressions": sum(b["impressions"] for b in buckets),
+                  "conversions": sum(b["conversions"] for b in buckets)}
+    }})
+
+@app.route('/cm/v1/campaigns/<campaign_id>/performance', methods=['GET'])
+@_holding_store_lock
+def get_campaign_performance_report(campaign_id: str):
+    """
+    Returns windowed performance totals for every ad group attached to the campaign.
+    Accepts the same from / to / granularity params as the ad group history endpoint.
+    """
+    if _STORE.get_campaign(campaign_id) is None:
+        return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
+    try:
+        granularity, from_ts, to_ts = _parse_performance_window()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    ad_group_ids = [ag.ad_group_id for ag in _STORE.ad_groups_for_campaign(campaign_id)]
+    impressions, conversions = _PERFORMANCE_HISTORY.aggregate(ad_group_ids, granularity, from_ts, to_ts)
+    return jsonify({"data": [
+        {"ad_group_id": agid, "impressions": imp, "conversions": conv}
+        for agid, imp, conv in zip(ad_group_ids, impressions.tolist(), conversions.tolist())
+    ]})
+
 @app.route('/cm/v1/campaigns/<campaign_id>', methods=['POST'])
+@_holding_store_lock
 def add_creative_groups_to_campaign(campaign_id: str):
     """
     Simulates attaching creative groups to a campaign.
     """
-    campaign = next((c for c in _MOLOCO_CAMPAIGNS if c.campaign_id == campaign_id), None)
+    campaign = _STORE.get_campaign(campaign_id)
     if campaign is None:
         return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
     data = request.get_json()
@@ -297,73 +811,318 @@ def add_creative_groups_to_campaign(campaign_id: str):
             creative_group_ids=[cg_id],
             performance={"impressions": 0, "conversions": 0}
         )
-        _MOLOCO_AD_GROUPS.append(ad_group)
-        campaign.ad_group_ids.append(ad_group_id)
-    campaign.lastModifiedTime = datetime.datetime.now().isoformat()
+        _STORE.add_ad_group(ad_group)
+        _STORE.attach_ad_group(campaign_id, ad_group_id)
 
-    return jsonify({"message": "Creative groups attached successfully.", "ad_group_ids": campaign.ad_group_ids})
+    return jsonify({"message": "Creative groups attached successfully.", "ad_group_ids": list(campaign.ad_group_ids)})
 
 @app.route('/cm/v1/campaigns/<campaign_id>/status', methods=['POST'])
 def update_campaign_status(campaign_id: str):
-    campaign = next((c for c in _MOLOCO_CAMPAIGNS if c.campaign_id == campaign_id), None)
+    campaign = _STORE.get_campaign(campaign_id)
     if campaign is None:
         return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
     data = request.get_json()
     new_status = data.get("status")
-    campaign.status = new_status
-    campaign.lastModifiedTime = datetime.datetime.now().isoformat()
+    _STORE.update_campaign_status(campaign_id, new_status)
     return jsonify({"message": f"Campaign '{campaign_id}' status updated to '{new_status}'."})
 
+def _parse_start_time(data: dict) -> int:
+    """Epoch seconds of the first simulated tick: start_time from the body, or now, never before recorded history."""
+    last_recorded = _PERFORMANCE_HISTORY.last_timestamp()
+    if data.get("start_time"):
+        try:
+            start = int(datetime.datetime.fromisoformat(data["start_time"]).timestamp())
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid start_time '{data['start_time']}'.")
+        if last_recorded is not None and start < last_recorded:
+            raise ValueError("start_time is before the last recorded tick.")
+        return start
+    start = int(datetime.datetime.now().timestamp())
+    if last_recorded is not None:
+        # last_recorded is the start of the latest hourly bucket, which still accepts samples
+        start = max(start, last_recorded)
+    return start
+
+def _parse_engine_overrides(data: dict):
+    """(true_rates, seed) from a simulation body: rates between 0 and 1 for known ad groups, and an integer seed."""
+    true_rates = data.get("true_rates") or None
+    if true_rates is not None:
+        if not isinstance(true_rates, dict):
+            raise ValueError("true_rates must be an object of {ad_group_id: conversion rate}.")
+        unknown = [agid for agid in true_rates if _STORE.get_ad_group(agid) is None]
+        if unknown:
+            raise ValueError(f"true_rates names unknown ad groups: {unknown}")
+        invalid = [agid for agid, rate in true_rates.items()
+                   if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not 0 <= rate <= 1]
+        if invalid:
+            raise ValueError(f"true_rates must be numbers between 0 and 1; invalid for: {invalid}")
+    seed = data.get("seed")
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+        raise ValueError("seed must be a non-negative integer.")
+    return true_rates, seed
+
+def _serving_ad_group_ids(campaign) -> list:
+    """IDs of the campaign's ad groups that receive traffic; arms with a sequential test decision have stopped serving."""
+    ids = [ag.ad_group_id for ag in _STORE.ad_groups_for_campaign(campaign.campaign_id)]
+    if campaign.type == "TESTING":
+        ids = [agid for agid in ids if not _EVALUATOR.is_decided(agid)]
+    return ids
+
+def _impression_budget(campaign, arm_count: int) -> int:
+    """Impressions per tick a THOMPSON campaign splits; by default what FIXED mode would spend."""
+    return campaign.impression_budget or (campaign.impressions_goal_per_cg or 10000) * arm_count
+
+def _simulate_allocated(ad_group_ids, impressions_per_tick, allocated, ticks: int, noise: str, seed):
+    """
+    Simulates one tick at a time, because the arms of THOMPSON campaigns get a fresh split of their
+    budget every tick, sampled from posteriors that include the ticks before it. allocated holds
+    (start, stop, budget) slices of ad_group_ids; the other ad groups keep impressions_per_tick.
+    Returns (impressions, conversions) of shape (ticks, n) like PerformanceEngine.simulate.
+    """
+    performance = [_STORE.get_ad_group(agid).performance for agid in ad_group_ids]
+    seen_impressions = np.array([p["impressions"] for p in performance], dtype=np.int64)
+    seen_conversions = np.array([p["conversions"] for p in performance], dtype=np.int64)
+    # Independent, reproducible streams for every tick's allocation and simulation when seeded
+    seeds = np.random.SeedSequence(seed).spawn(2 * ticks) if seed is not None else [None] * (2 * ticks)
+    impressions = np.empty((ticks, len(ad_group_ids)), dtype=np.int64)
+    conversions = np.empty_like(impressions)
+    targets = impressions_per_tick.copy()
+    for tick in range(ticks):
+        for start, stop, budget in allocated:
+            targets[start:stop], _ = _ALLOCATOR.allocate(seen_impressions[start:stop], seen_conversions[start:stop],
+                                                         budget, seed=seeds[2 * tick])
+        tick_impressions, tick_conversions = _ENGINE.simulate(ad_group_ids, targets, noise=noise,
+                                                              seed=seeds[2 * tick + 1])
+        impressions[tick], conversions[tick] = tick_impressions[0], tick_conversions[0]
+        seen_impressions += tick_impressions[0]
+        seen_conversions += tick_conversions[0]
+    return impressions, conversions
+
 @app.route('/cm/v1/campaigns/performance', methods=['POST'])
+@_holding_store_lock
 def simulate_campaign_performance():
     """
     Simulates retrieving performance data for a campaign.
-    For the testing campaign, it simulates impressions reaching the goal and random conversions.
-    For regular campaigns, it simulates ongoing performance.
+    Runs the vectorized engine over every ad group of the requested campaigns in one pass
+    and adds the simulated impressions and conversions to each ad group's performance.
+    Optional JSON body:
+        campaign_ids: distinct campaigns to simulate (default: ["creative_testing_campaign"])
+        ticks: number of simulation rounds (default: 1)
+        impressions_per_tick: impressions per ad group per tick
+            (default: the campaign's impressions_goal_per_cg, or 10,000)
+        noise: "binomial" or "poisson" (default: "binomial")
+        seed: makes the run reproducible
+        true_rates: {ad_group_id: conversion rate} to pin before simulating
+        start_time: ISO timestamp of the first tick (default: now, or right after the last recorded tick)
+        tick_seconds: simulated time between ticks (default: 3600)
+    Every tick is also recorded in the performance history. Campaigns in THOMPSON allocation mode
+    split their impression budget (impressions_per_tick times their ad groups, when given) anew
+    every tick; see /cm/v1/campaigns/<campaign_id>/allocation.
     """
-    campaign = next((c for c in _MOLOCO_CAMPAIGNS if c.campaign_id == "creative_testing_campaign"), None)
-    for ad_id in campaign.ad_group_ids:
-        ad_group = next((ag for ag in _MOLOCO_AD_GROUPS if ag.ad_group_id == ad_id), None)
-        if ad_group is not None:
-            impressions = 10000 # Simulate reaching 10,000 impressions for testing campaign if running
-            # Simulate conversions based on impressions, with some randomness
-            conversions = int(impressions * random.uniform(0.01, 0.15)) # 1% to 5% conversion rate
+    data = request.get_json(silent=True) or {}
+    campaign_ids = data.get("campaign_ids", ["creative_testing_campaign"])
+    ticks = data.get("ticks", 1)
+    noise = data.get("noise", "binomial")
+    tick_seconds = data.get("tick_seconds", 3600)
+    impressions_goal = data.get("impressions_per_tick")
+    if (not isinstance(campaign_ids, list) or not campaign_ids
+            or not all(isinstance(cid, str) for cid in campaign_ids) or len(set(campaign_ids)) < len(campaign_ids)):
+        return jsonify({"error": "campaign_ids must be a non-empty list of distinct campaign IDs."}), 400
+    if not isinstance(ticks, int) or ticks < 1:
+        return jsonify({"error": "ticks must be a positive integer."}), 400
+    if not isinstance(tick_seconds, int) or tick_seconds < 1:
+        return jsonify({"error": "tick_seconds must be a positive integer."}), 400
+    if impressions_goal is not None and (not isinstance(impressions_goal, int) or impressions_goal < 1):
+        return jsonify({"error": "impressions_per_tick must be a positive integer."}), 400
+    try:
+        start = _parse_start_time(data)
+        true_rates, seed = _parse_engine_overrides(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if noise not in NOISE_MODELS:
+        return jsonify({"error": f"noise must be one of {list(NOISE_MODELS)}."}), 400
+    missing = [cid for cid in campaign_ids if _STORE.get_campaign(cid) is None]
+    if missing:
+        return jsonify({"error": f"Campaigns not found: {missing}"}), 404
 
-            ad_group.performance = {
-                "impressions": impressions,
-                "conversions": conversions
-            }
-            print(f"Ad Group {ad_group.ad_group_id} performance updated: {ad_group.performance}")
-    return jsonify({"message": "Performance simulated successfully."})
+    ad_group_ids = []
+    impressions_per_tick = []
+    allocated = [] # (start, stop, budget) of the ad_group_ids slices that THOMPSON campaigns split their budget over
+    for campaign_id in campaign_ids:
+        campaign = _STORE.get_campaign(campaign_id)
+        ids = _serving_ad_group_ids(campaign)
+        # Simulate reaching the impressions goal (10,000 by default) for every ad group
+        goal = impressions_goal or campaign.impressions_goal_per_cg or 10000
+        if campaign.allocation_mode == "THOMPSON" and ids:
+            budget = goal * len(ids) if impressions_goal else _impression_budget(campaign, len(ids))
+            allocated.append((len(ad_group_ids), len(ad_group_ids) + len(ids), budget))
+        ad_group_ids.extend(ids)
+        impressions_per_tick.extend([goal] * len(ids))
+    if true_rates:
+        _ENGINE.set_true_rates(true_rates)
+    if allocated:
+        impressions, conversions = _simulate_allocated(ad_group_ids, np.array(impressions_per_tick, dtype=np.int64),
+                                                       allocated, ticks, noise, seed)
+    else:
+        impressions, conversions = _ENGINE.simulate(ad_group_ids, np.array(impressions_per_tick, dtype=np.int64),
+                                                    ticks=ticks, noise=noise, seed=seed)
+    _PERFORMANCE_HISTORY.append(ad_group_ids, [start + tick * tick_seconds for tick in range(ticks)],
+                                impressions, conversions)
+    total_impressions = impressions.sum(axis=0)
+    total_conversions = conversions.sum(axis=0)
+    _STORE.add_ad_group_performance(ad_group_ids, total_impressions.tolist(), total_conversions.tolist())
+    _LOG.debug("Simulated %d tick(s) for %d ad groups in %s", ticks, len(ad_group_ids), campaign_ids)
+    return jsonify({"message": "Performance simulated successfully.",
+                    "data": {"ad_group_count": len(ad_group_ids), "ticks": ticks,
+                             "impressions": int(total_impressions.sum()),
+                             "conversions": int(total_conversions.sum())}})
 
+@app.route('/cm/v1/campaigns/<campaign_id>/allocation', methods=['GET'])
+@_holding_store_lock
+def get_campaign_allocation(campaign_id: str):
     """
-    Simulates evaluating the testing campaign to identify champions.
-    Adds champions to the waiting queue.
+    Shows how the next simulated tick splits the campaign's impressions across its serving ad groups.
+    Per ad group: the traffic so far, the posterior mean conversion rate, the probability of being
+    the best arm and next_tick_impressions. In FIXED mode every ad group gets the goal; in THOMPSON
+    mode the budget is split by probability of being best, so the split is a fresh sample each call.
     """
-    if campaign_id != "creative_testing_campaign" or _MOLOCO_CAMPAIGNS[campaign_id]["status"] != "PAUSED":
-        return {"error": "Testing campaign must be paused for evaluation."}
+    campaign = _STORE.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
+    ad_groups = [_STORE.get_ad_group(agid) for agid in _serving_ad_group_ids(campaign)]
+    impressions = np.array([ag.performance["impressions"] for ag in ad_groups], dtype=np.int64)
+    conversions = np.array([ag.performance["conversions"] for ag in ad_groups], dtype=np.int64)
+    goal = campaign.impressions_goal_per_cg or 10000
+    budget = _impression_budget(campaign, len(ad_groups))
+    if campaign.allocation_mode == "THOMPSON":
+        next_tick, probability_best = _ALLOCATOR.allocate(impressions, conversions, budget)
+    else:
+        next_tick = np.full(len(ad_groups), goal, dtype=np.int64)
+        probability_best = _ALLOCATOR.probability_best(impressions, conversions)
+    alpha, beta = _ALLOCATOR.prior
+    posterior_mean = (alpha + conversions) / (alpha + beta + impressions)
+    return jsonify({"data": {
+        "campaign_id": campaign_id,
+        "allocation_mode": campaign.allocation_mode,
+        "impression_budget": budget if campaign.allocation_mode == "THOMPSON" else goal * len(ad_groups),
+        "ad_groups": [{"ad_group_id": ag.ad_group_id, "impressions": int(imp), "conversions": int(conv),
+                       "posterior_mean": round(float(mean), 6), "probability_best": float(p),
+                       "next_tick_impressions": int(n)}
+                      for ag, imp, conv, mean, p, n in zip(ad_groups, impressions, conversions, posterior_mean,
+                                                           probability_best, next_tick)]
+    }})
 
-    campaign = _MOLOCO_CAMPAIGNS[campaign_id]
-    control_group_id = "good_creative_group"
-    
-    if control_group_id not in campaign["creative_group_ids"]:
-        return {"error": "Control group missing from testing campaign for evaluation."}
-    
-    control_performance = _MOLOCO_CREATIVE_GROUPS[control_group_id]["performance"]["conversions"]
+@app.route('/cm/v1/campaigns/<campaign_id>/allocation', methods=['POST'])
+def update_campaign_allocation(campaign_id: str):
+    """
+    Sets how simulated ticks split the campaign's impressions. Body: {"mode": "FIXED" or "THOMPSON",
+    "impression_budget": impressions per tick shared by all ad groups in THOMPSON mode (optional,
+    default: impressions_goal_per_cg times the number of serving ad groups)}.
+    """
+    campaign = _STORE.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
+    data = request.get_json(silent=True) or {}
+    mode = data.get("mode")
+    impression_budget = data.get("impression_budget")
+    if mode not in ALLOCATION_MODES:
+        return jsonify({"error": f"mode must be one of {list(ALLOCATION_MODES)}."}), 400
+    if impression_budget is not None and (not isinstance(impression_budget, int) or impression_budget < 1):
+        return jsonify({"error": "impression_budget must be a positive integer."}), 400
+    _STORE.update_campaign_allocation(campaign_id, mode, impression_budget)
+    return jsonify({"message": f"Campaign '{campaign_id}' allocation mode set to '{mode}'.",
+                    "data": {"allocation_mode": mode, "impression_budget": impression_budget}})
 
-    champions = []
-    for cg_id in campaign["creative_group_ids"]:
-        if cg_id == control_group_id:
-            continue
-        cg_performance = _MOLOCO_CREATIVE_GROUPS[cg_id]["performance"]["conversions"]
-        # A simple logic for "champion": better or similar conversion rate than control
-        if cg_performance >= control_performance * random.uniform(0.8, 1.2): # Allow some variability
-            champions.append(cg_id)
-            _MOLOCO_CHAMPION_CONCEPTS_QUEUE.append(cg_id) # Add to waiting line
+@app.route('/cm/v1/campaigns/<campaign_id>/evaluate', methods=['POST'])
+@_holding_store_lock
+def evaluate_testing_campaign(campaign_id: str):
+    """
+    Runs the testing campaign's undecided arms against the control ad group with a sequential test.
+    Traffic is simulated in rounds of batch_impressions per ad group, and each arm stops serving as
+    soon as the test decides it, or once it reaches the campaign's impressions_goal_per_cg.
+    Winners are added to the champion queue.
+    Optional JSON body: batch_impressions (default: 500), noise, seed, true_rates, start_time and
+    tick_seconds as in POST /cm/v1/campaigns/performance. Every round is recorded in the history.
+    """
+    campaign = _STORE.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
+    if campaign.type != "TESTING":
+        return jsonify({"error": "Only testing campaigns can be evaluated."}), 400
+    if _STORE.campaign_for_ad_group(_CONTROL_AD_GROUP_ID) is not campaign:
+        return jsonify({"error": "Control group missing from testing campaign for evaluation."}), 400
+
+    data = request.get_json(silent=True) or {}
+    batch_impressions = data.get("batch_impressions", 500)
+    noise = data.get("noise", "binomial")
+    tick_seconds = data.get("tick_seconds", 3600)
+    if not isinstance(batch_impressions, int) or batch_impressions < 1:
+        return jsonify({"error": "batch_impressions must be a positive integer."}), 400
+    if not isinstance(tick_seconds, int) or tick_seconds < 1:
+        return jsonify({"error": "tick_seconds must be a positive integer."}), 400
+    if noise not in NOISE_MODELS:
+        return jsonify({"error": f"noise must be one of {list(NOISE_MODELS)}."}), 400
+    try:
+        start = _parse_start_time(data)
+        true_rates, seed = _parse_engine_overrides(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    arm_ids = [ag.ad_group_id for ag in _STORE.ad_groups_for_campaign(campaign_id)
+               if ag.ad_group_id != _CONTROL_AD_GROUP_ID and not _EVALUATOR.is_decided(ag.ad_group_id)]
+    if not arm_ids:
+        return jsonify({"message": "No undecided arms to evaluate.", "data": []})
+
+    goal = campaign.impressions_goal_per_cg or 10000
+    ad_group_ids = [_CONTROL_AD_GROUP_ID] + arm_ids
+    performance = [_STORE.get_ad_group(agid).performance for agid in ad_group_ids]
+    base_impressions = np.array([p["impressions"] for p in performance], dtype=np.int64)
+    base_conversions = np.array([p["conversions"] for p in performance], dtype=np.int64)
+    # Enough rounds for every arm to reach the goal; the test usually stops most of them sooner
+    rounds = max(1, -(-(goal - int(base_impressions[1:].min())) // batch_impressions))
+    if true_rates:
+        _ENGINE.set_true_rates(true_rates)
+    impressions, conversions = _ENGINE.simulate(ad_group_ids, batch_impressions, ticks=rounds, noise=noise,
+                                                seed=seed)
+    impressions, conversions, decisions, rounds_used = _EVALUATOR.run(
+        (base_impressions[0], base_conversions[0]), (base_impressions[1:], base_conversions[1:]),
+        impressions, conversions, max_impressions=goal)
+    impressions, conversions = impressions[:rounds_used], conversions[:rounds_used]
+
+    _PERFORMANCE_HISTORY.append(ad_group_ids, [start + tick * tick_seconds for tick in range(rounds_used)],
+                                impressions, conversions)
+    total_impressions = impressions.sum(axis=0)
+    total_conversions = conversions.sum(axis=0)
+    _STORE.add_ad_group_performance(ad_group_ids, total_impressions.tolist(), total_conversions.tolist())
+    _EVALUATOR.record(arm_ids, decisions)
+
+    results = []
+    for index, (ad_group_id, code) in enumerate(zip(arm_ids, decisions.tolist())):
+        if code == WINNER:
+            _STORE.enqueue_champion(_STORE.get_ad_group(ad_group_id))
+        results.append({"ad_group_id": ad_group_id, "decision": DECISION_NAMES.get(code, "UNDECIDED"),
+                        "impressions": int(base_impressions[index + 1] + total_impressions[index + 1]),
+                        "conversions": int(base_conversions[index + 1] + total_conversions[index + 1])})
+    return jsonify({"message": "Evaluation complete.",
+                    "data": results,
+                    "champions_identified": [r["ad_group_id"] for r in results if r["decision"] == "WINNER"],
+                    "rounds": rounds_used,
+                    "impressions_spent": int(total_impressions.sum()),
+                    "impressions_budget": goal * len(arm_ids),
+                    "queue_size": _STORE.champion_queue_size()})
+
+def _champion_entries() -> list:
+    """The champion queue as compact {ad_group_id, conversions, impressions} entries, next in line first."""
+    return [{"ad_group_id": ag.ad_group_id, "conversions": ag.performance["conversions"],
+             "impressions": ag.performance["impressions"]} for ag in _STORE.champion_queue()]
 
-    return {"message": "Evaluation complete.", "champions_identified": champions, "queue_size": len(_MOLOCO_CHAMPION_CONCEPTS_QUEUE)}
+@app.route('/cm/v1/champion_queue', methods=['GET'])
+def get_champion_queue():
+    """Lists the waiting champions, next in line first, with the performance they are ranked by."""
+    return _list_jsonify({"data": _champion_entries(), "queue_size": _STORE.champion_queue_size()})
 
 @app.route('/cm/v1/champion_queue', methods=['POST'])
+@_holding_store_lock
 def add_champion_to_queue():
     """
     Simulates adding a champion creative group to the waiting queue.
@@ -371,57 +1130,338 @@ def add_champion_to_queue():
     data = request.get_json()
     ad_group_id = data.get("ad_group_id")
 
-    ad_group = next((ag for ag in _MOLOCO_AD_GROUPS if ag.ad_group_id == ad_group_id), None)
+    ad_group = _STORE.get_ad_group(ad_group_id)
     if ad_group is None:
         return jsonify({"error": f"Ad Group '{ad_group_id}' not found."}), 404
         
-    _MOLOCO_CHAMPION_CONCEPTS_QUEUE.append(ad_group)
+    _STORE.enqueue_champion(ad_group)
     
     return jsonify({"message": f"Champion '{ad_group_id}' added to the waiting queue."\
-                    , "queue_size": len(_MOLOCO_CHAMPION_CONCEPTS_QUEUE)
-                    , "data" : _MOLOCO_CHAMPION_CONCEPTS_QUEUE})
+                    , "queue_size": _STORE.champion_queue_size()
+                    , "data" : _champion_entries()})
 
-def simulate_replace_worst_creative_in_regular_campaign(campaign_id: str):
+@app.route('/cm/v1/champion_queue', methods=['PUT'])
+@_holding_store_lock
+def reorder_champion_queue():
     """
-    Simulates replacing the worst performing creative group in a regular campaign
-    with a champion from the waiting queue.
+    Reorders the waiting champions. Body: {"ad_group_ids": [...]}, the full queue in its new order.
+    Answers 409 when the list does not match the queued ad groups, e.g. because the queue changed meanwhile.
     """
-    if campaign_id not in ["regular_campaign_a", "regular_campaign_b"]:
-        return {"error": "Campaign is not a regular campaign."}
+    data = request.get_json(silent=True) or {}
+    ad_group_ids = data.get("ad_group_ids")
+    if not isinstance(ad_group_ids, list):
+        return jsonify({"error": "Request body must contain an 'ad_group_ids' list."}), 400
+    try:
+        _STORE.reorder_champions(ad_group_ids)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"message": "Champion queue reordered.", "queue_size": _STORE.champion_queue_size(),
+                    "data": _champion_entries()})
 
-    if not _MOLOCO_CHAMPION_CONCEPTS_QUEUE:
-        return {"error": "No champion concepts in the waiting line."}
+@app.route('/cm/v1/champion_queue/dequeue', methods=['POST'])
+@_holding_store_lock
+def dequeue_champion():
+    """Removes the next champion from the waiting queue and returns it."""
+    ad_group = _STORE.dequeue_champion()
+    if ad_group is None:
+        return jsonify({"error": "No champion concepts in the waiting line."}), 404
+    return jsonify({"data": {"ad_group_id": ad_group.ad_group_id, **ad_group.performance},
+                    "queue_size": _STORE.champion_queue_size()})
 
-    campaign = next((c for c in _MOLOCO_CAMPAIGNS if c.campaign_id == campaign_id), None)
-    ad_group_ids = campaign.ad_group_ids if campaign else []
-    worst_ad_group = None
-    worst_performance = float('inf')
+@app.route('/cm/v1/campaigns/<campaign_id>/replace_worst', methods=['POST'])
+@_holding_store_lock
+def replace_worst_in_regular_campaign(campaign_id: str):
+    """
+    Replaces the worst performing creative group in a regular campaign
+    with a champion from the waiting queue.
+    """
+    campaign = _STORE.get_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({"error": f"Campaign '{campaign_id}' not found."}), 404
+    if campaign.type != "REGULAR":
+        return jsonify({"error": "Campaign is not a regular campaign."}), 400
+
+    if not _STORE.champion_queue_size():
+        return jsonify({"error": "No champion concepts in the waiting line."}), 409
 
-    for id in ad_group_ids:
-        ad_group = next((ag for ag in _MOLOCO_AD_GROUPS if ag.ad_group_id == id), None)
-        if ad_group is not None:
-            # Find the worst performing ad group
-            if ad_group.performance["conversions"] < worst_performance:
-                worst_performance = ad_group.performance["conversions"]
-                worst_ad_group = ad_group
+    # The store keeps a min-heap of conversions per campaign, so this is O(log n)
+    worst_ad_group = _STORE.worst_ad_group(campaign_id)
 
     # Replace it with the first champion from the queue
-    champion_ad = _MOLOCO_CHAMPION_CONCEPTS_QUEUE.pop(0)
+    champion_ad = _STORE.dequeue_champion()
     if worst_ad_group is not None:
-        campaign.ad_group_ids.remove(worst_ad_group.ad_group_id)
-        campaign.ad_group_ids.append(champion_ad.ad_group_id)
-        return {"message": f"Replaced worst creative group '{worst_ad_group.ad_group_id}' with champion '{champion_ad.ad_group_id}'."
-                        , "new_champion_id" : champion_ad.ad_group_id, "replaced_ad_group_id" : worst_ad_group.ad_group_id}
+        _STORE.replace_ad_group(campaign_id, worst_ad_group.ad_group_id, champion_ad.ad_group_id)
+        return jsonify({"message": f"Replaced worst creative group '{worst_ad_group.ad_group_id}' with champion '{champion_ad.ad_group_id}'."
+                        , "new_champion_id" : champion_ad.ad_group_id, "replaced_ad_group_id" : worst_ad_group.ad_group_id})
     else:
-        campaign.ad_group_ids.append(champion_ad.ad_group_id)
-        return {"message" : "Added champion to the campaign as no worst performing ad group found."
-                        , "new_champion_id" : champion_ad.ad_group_id, "replaced_ad_group_id" : None}
-        
+        _STORE.attach_ad_group(campaign_id, champion_ad.ad_group_id)
+        return jsonify({"message" : "Added champion to the campaign as no worst performing ad group found."
+                        , "new_champion_id" : champion_ad.ad_group_id, "replaced_ad_group_id" : None})
+
+@app.route('/cm/v1/campaigns/replace_worst', methods=['POST'])
+@_holding_store_lock
+def replace_worst_ad_groups():
+    """
+    Replaces the K worst performing ad groups across regular campaigns with the next K champions
+    from the waiting queue, worst first.
+    Body: {"k": int, "campaign_ids": [...]} where campaign_ids defaults to every REGULAR campaign.
+    K is capped at the number of waiting champions.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        k = int(data.get("k", 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'k' must be an integer."}), 400
+    if k < 1:
+        return jsonify({"error": "'k' must be at least 1."}), 400
+
+    campaign_ids = data.get("campaign_ids")
+    if campaign_ids is None:
+        campaign_ids = [c.campaign_id for c in _STORE.campaigns() if c.type == "REGULAR"]
+    for campaign_id in campaign_ids:
+        campaign = _STORE.get_campaign(campaign_id)
+        if campaign is None or campaign.type != "REGULAR":
+            return jsonify({"error": f"Campaign '{campaign_id}' is not a regular campaign."}), 400
+
+    k = min(k, _STORE.champion_queue_size())
+    replacements = []
+    for campaign_id, worst_ad_group in _STORE.k_worst_ad_groups(campaign_ids, k):
+        # An earlier champion in this batch may have been this ad group, moving it elsewhere
+        if _STORE.campaign_for_ad_group(worst_ad_group.ad_group_id) is not _STORE.get_campaign(campaign_id):
+            continue
+        champion_ad = _STORE.dequeue_champion()
+        _STORE.replace_ad_group(campaign_id, worst_ad_group.ad_group_id, champion_ad.ad_group_id)
+        replacements.append({"campaign_id": campaign_id, "replaced_ad_group_id": worst_ad_group.ad_group_id,
+                             "conversions": worst_ad_group.performance["conversions"],
+                             "new_champion_id": champion_ad.ad_group_id})
+
+    return jsonify({"message": f"Replaced {len(replacements)} worst ad groups.", "replacements": replacements,
+                    "queue_size": _STORE.champion_queue_size()})
+
+def _rotate_regular_campaigns(run_id: int) -> list:
+    """
+    One run of the rotation scheduler over every REGULAR campaign that has ad groups.
+    Champions are handed out round robin, at most env.rotation_max_per_campaign per campaign and
+    run, to the least recently rotated campaigns first and then to those with the worst performers,
+    so a short queue is spread over the whole portfolio across runs. A campaign's worst ad group
+    (fewest conversions, as picked by the store's worst-performer index) is only replaced by a
+    champion with more conversions; otherwise it is KEPT and the champion is offered to the next
+    campaign. A champion that every campaign kept its worst ad group against is REQUEUED at the
+    back of the queue, so the champions behind it get their turn. Campaigns left over once the
+    queue runs out get NO_CHAMPION. Returns the decisions in the order they were made.
+    """
+    with _STORE.lock:
+        if not _STORE.champion_queue_size():
+            return []
+        worst_conversions = {}
+        for campaign in _STORE.campaigns():
+            worst_ad_group = _STORE.worst_ad_group(campaign.campaign_id) if campaign.type == "REGULAR" else None
+            if worst_ad_group is not None:
+                worst_conversions[campaign.campaign_id] = worst_ad_group.performance["conversions"]
+        order = sorted(worst_conversions, key=lambda cid: (_LAST_ROTATED.get(cid, 0), worst_conversions[cid]))
+        decisions = []
+        declined = set() # Campaigns that kept their worst ad group against the current head champion
+        requeued = 0 # Champions requeued since the last replacement; once every one was, the run is over
+        for _ in range(env.rotation_max_per_campaign):
+            for campaign_id in order:
+                worst_ad_group = _STORE.worst_ad_group(campaign_id)
+                champion = _STORE.next_champion()
+                decision = {"campaign_id": campaign_id, "worst_ad_group_id": worst_ad_group.ad_group_id,
+                            "worst_conversions": worst_ad_group.performance["conversions"],
+                            "champion_id": champion.ad_group_id if champion else None,
+                            "champion_conversions": champion.performance["conversions"] if champion else None}
+                if champion is None:
+                    decision["action"] = "NO_CHAMPION"
+                elif decision["champion_conversions"] <= decision["worst_conversions"]:
+                    decision["action"] = "KEPT"
+                    declined.add(campaign_id)
+                else:
+                    _STORE.dequeue_champion()
+                    _STORE.replace_ad_group(campaign_id, worst_ad_group.ad_group_id, champion.ad_group_id)
+                    _LAST_ROTATED[campaign_id] = run_id
+                    decision["action"] = "REPLACED"
+                    declined.clear()
+                    requeued = 0
+                decisions.append(decision)
+                if len(declined) == len(order):
+                    _STORE.requeue_champion()
+                    decisions.append({"campaign_id": None, "champion_id": champion.ad_group_id,
+                                      "champion_conversions": decision["champion_conversions"],
+                                      "action": "REQUEUED"})
+                    declined.clear()
+                    requeued += 1
+                    if requeued >= _STORE.champion_queue_size():
+                        return decisions
+            if not _STORE.champion_queue_size():
+                break
+        return decisions
+
+@app.route('/cm/v1/rotations', methods=['GET'])
+def get_rotations():
+    """
+    Recent runs of the rotation scheduler, newest first, each with every decision it made.
+    Query param: limit (default 20).
+    """
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    return jsonify({"data": _ROTATION.runs(limit), "interval_seconds": _ROTATION.interval})
+
+@app.route('/cm/v1/rotations', methods=['POST'])
+def run_rotation():
+    """
+    Rotates champions into the REGULAR campaigns now instead of at the next scheduled run.
+    A request made while a run is in progress waits for the next one, shared with the scheduler
+    and with any other request made meanwhile.
+    """
+    return jsonify({"data": _ROTATION.run_now()})
 
 
-def simulate_get_champion_queue_status():
-    """Returns the current list of champion creative group IDs in the waiting queue."""
-    return _MOLOCO_CHAMPION_CONCEPTS_QUEUE
+def _open_database(path: str, compact_threshold: int = 100000, seed=None) -> SQLitePersistence:
+    """
+    Restores the store from the SQLite file at path, or seeds an empty file with the fixtures
+    (after calling seed, when given, to fill the store first).
+    The change log is folded into a fresh snapshot at exit, and at startup once it grows past
+    compact_threshold rows.
+    """
+    global _STORE, _PERSISTENCE
+    persistence = _PERSISTENCE = SQLitePersistence(path)
+    if persistence.is_empty():
+        if seed is not None:
+            seed()
+        _STORE.attach_persistence(persistence)
+    else:
+        _STORE = EntityStore.load(persistence)
+        if persistence.log_size() > compact_threshold:
+            _STORE.compact()
+    persistence.flush()
+    # Jobs do not survive a restart; probe again whatever was still processing
+    for creative in _STORE.creatives_with_status("PROCESSING"):
+        if _BLOBS.has_blob(creative.content_hash):
+            try:
+                _submit_media_job(creative)
+            except QueueFullError:
+                _LOG.warning("Media queue is full; marked creative %s FAILED instead of probing it again", creative.id)
+        else:
+            _STORE.update_creative_status(creative.id, "FAILED", {"processing_error": "Asset is missing."})
+
+    def close():
+        _MEDIA_JOBS.shutdown()
+        if persistence.error is None:
+            _STORE.compact()
+        persistence.close()
+    atexit.register(close)
+    return persistence
+
+def _load_dataset(path: str, shard=None, shard_count: int = 1):
+    """
+    Replaces the store with the synthetic dataset at path (see simulator/dataset.py), keeping the
+    fixtures next to it, and pins the engine's true conversion rates to the ones the dataset's
+    performance was drawn at. A shard loads only the accounts it owns, with its tag on their IDs.
+    """
+    global _STORE
+    start = time.perf_counter()
+    dataset = SyntheticDataset.load(path)
+    if shard is not None:
+        dataset = dataset.for_accounts(lambda account_id: shard_for_account(account_id, shard_count) == shard)
+    store = dataset.build_store(_SHARD_TAG)
+    if shard is None or shard_for_account(env.ad_account_id, shard_count) == shard:
+        _add_fixtures(store)
+    _STORE = store
+    _ENGINE.set_true_rates(dataset.true_rates(_SHARD_TAG))
+    _LOG.info("Loaded %s entities from %s in %.2fs", f"{dataset.entity_count():,}", path, time.perf_counter() - start)
+
+def _configure_shard(shard: int, shard_count: int):
+    """
+    Makes this process shard number shard of shard_count behind a router: the IDs it generates
+    (entities, uploads, media jobs) are tagged with the shard so the router can send requests
+    for them here, and the fixtures are kept only by the shard that owns their account.
+    """
+    global _STORE, _SHARD_TAG
+    _SHARD_TAG = _BLOBS.id_suffix = _MEDIA_JOBS.id_suffix = shard_tag(shard)
+    if shard_for_account(env.ad_account_id, shard_count) != shard:
+        _STORE = EntityStore()
+
+def _shard_db_path(path: str, shard: int) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}.shard{shard}{extension}"
+
+def _serve_router(args):
+    """
+    Starts args.shards worker processes, each owning the accounts that hash to it, and serves the
+    router in front of them on args.port. Worker n listens on args.port + 1 + n and keeps its
+    entities in its own --db file. The workers are stopped when the router exits.
+    """
+    worker_ports = [args.port + 1 + shard for shard in range(args.shards)]
+    workers = []
+    for shard, port in enumerate(worker_ports):
+        command = [sys.executable, os.path.abspath(__file__), "--server", "production", "--threads", str(args.threads),
+                   "--port", str(port), "--shards", str(args.shards), "--shard", str(shard)]
+        if args.db:
+            command += ["--db", _shard_db_path(args.db, shard)]
+        if args.dataset:
+            command += ["--dataset", args.dataset]
+        if args.no_rate_limit:
+            command.append("--no-rate-limit")
+        workers.append(subprocess.Popen(command))
+
+    def stop_workers():
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+    atexit.register(stop_workers)
+    router = ShardRouter([f"http://127.0.0.1:{port}" for port in worker_ports], env.ad_account_id)
+    router.wait_until_ready()
+    _LOG.info("Routing %d shards on port %d", args.shards, args.port)
+    router_app = create_router_app(router, log_sample_rate=env.request_log_sample_rate,
+                                   slow_request_seconds=env.slow_request_seconds)
+    if args.server == "production":
+        from waitress import serve
+        serve(router_app, host="0.0.0.0", port=args.port, threads=args.threads)
+    else:
+        router_app.run(host="0.0.0.0", port=args.port, threaded=True)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Mock Moloco Ads API")
+    parser.add_argument("--db", help="SQLite file to persist entities in (default: in-memory fixtures only)")
+    parser.add_argument("--server", choices=["dev", "production"], default="dev",
+                        help="dev: Flask's debug server with the reloader; production: waitress worker threads")
+    parser.add_argument("--threads", type=int, default=env.simulator_threads,
+                        help="Worker threads for --server production")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--shards", type=int, default=env.simulator_shards,
+                        help="Worker processes to partition accounts over; more than 1 serves a router on --port")
+    parser.add_argument("--shard", type=int, help=argparse.SUPPRESS) # Set by the router on its workers
+    parser.add_argument("--dataset", help="Start with a synthetic dataset written by python -m simulator.dataset "
+                                          "(with --db, it only seeds an empty database)")
+    parser.add_argument("--no-rate-limit", action="store_true",
+                        help="Accept unlimited traffic, e.g. to measure raw capacity with benchmarks.load_test")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.no_rate_limit:
+        _RATE_LIMITER.enabled = False
+    if args.shards > 1:
+        # Exit through SystemExit on SIGTERM, so atexit stops the workers and compacts the database
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if args.shard is None:
+            _serve_router(args)
+            sys.exit(0)
+        _configure_shard(args.shard, args.shards)
+    load_dataset = functools.partial(_load_dataset, args.dataset, args.shard, args.shards) if args.dataset else None
+    if args.db:
+        start = time.perf_counter()
+        _open_database(args.db, seed=load_dataset)
+        _LOG.info("Loaded %s in %.2fs", args.db, time.perf_counter() - start)
+    elif load_dataset is not None:
+        load_dataset()
+    _ROTATION.start()
+    atexit.register(_ROTATION.stop)
+    if args.server == "production":
+        # One process with many threads: all state lives in this process's store
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=args.port, threads=args.threads)
+    else:
+        # The reloader would run a second process against the same database file
+        app.run(host="0.0.0.0", port=args.port, debug=True, threaded=True, use_reloader=not args.db)
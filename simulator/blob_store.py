@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Optional
+
+# Bytes read from a request stream at a time, so memory stays flat whatever the asset size
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Blobs are named by their lowercase hex SHA-256, and nothing else may become part of a path
+_CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+def is_content_hash(value) -> bool:
+    return isinstance(value, str) and _CONTENT_HASH.fullmatch(value) is not None
+
+
+class UploadError(Exception):
+    """A malformed or out-of-order upload request. offset, when set, is where the upload can resume."""
+
+    def __init__(self, message: str, offset: Optional[int] = None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class _UploadSession:
+    def __init__(self, upload_id: str, path: str, filename: str, size: Optional[int]):
+        self.upload_id = upload_id
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class BlobStore:
+    """
+    Content-addressed file store for uploaded assets.
+    Blobs live at <root>/blobs/<sha256[:2]>/<sha256>, so identical content is stored once.
+    Uploads are resumable sessions: parts are appended in order at an explicit offset and
+    hashed as they stream in, and a client that lost a part asks for the session's offset
+    and resends from there. complete() moves the part file into place, or drops it when a
+    blob with the same hash already exists.
+    """
+
+    def __init__(self, root: str, id_suffix: str = ""):
+        self.root = root
+        self.id_suffix = id_suffix # Appended to upload IDs, e.g. to tell which shard holds the session
+        self._blob_dir = os.path.join(root, "blobs")
+        self._upload_dir = os.path.join(root, "uploads")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._upload_dir, exist_ok=True)
+        self._sessions: Dict[str, _UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def blob_path(self, content_hash: str) -> str:
+        """Path of the blob with this hash. Raises ValueError for anything but a hex SHA-256 digest."""
+        if not is_content_hash(content_hash):
+            raise ValueError(f"Not a content hash: {content_hash!r}")
+        return os.path.join(self._blob_dir, content_hash[:2], content_hash)
+
+    def has_blob(self, content_hash: str) -> bool:
+        return is_content_hash(content_hash) and os.path.exists(self.blob_path(content_hash))
+
+    def blob_size(self, content_hash: str) -> int:
+        return os.path.getsize(self.blob_path(content_hash))
+
+    def put_bytes(self, data: bytes) -> str:
+        """Stores a small in-memory blob, such as a generated thumbnail, and returns its content hash."""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(content_hash)
+        if not os.path.exists(path):
+            temp_path = os.path.join(self._upload_dir, uuid.uuid4().hex)
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        return content_hash
+
+    def init_upload(self, filename: str, size: Optional[int] = None) -> str:
+        upload_id = uuid.uuid4().hex + self.id_suffix
+        session = _UploadSession(upload_id, os.path.join(self._upload_dir, upload_id), filename, size)
+        open(session.path, "wb").close()
+        with self._lock:
+            self._sessions[upload_id] = session
+        return upload_id
+
+    def _session(self, upload_id: str) -> _UploadSession:
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+        return session
+
+    def offset(self, upload_id: str) -> int:
+        """Number of bytes received so far, which is where the next part must start."""
+        return self._session(upload_id).offset
+
+    def write_part(self, upload_id: str, offset: int, stream: BinaryIO) -> int:
+        """Appends the stream at offset, reading it in chunks, and returns the new offset."""
+        session = self._session(upload_id)
+        with session.lock:
+            if offset != session.offset:
+                raise UploadError(f"Part starts at {offset}, expected {session.offset}.", session.offset)
+            with open(session.path, "ab") as part_file:
+                while True:
+                    chunk = stream.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if session.size is not None and session.offset + len(chunk) > session.size:
+                        raise UploadError(f"Upload exceeds its declared size of {session.size} bytes.",
+                                          session.offset)
+                    part_file.write(chunk)
+                    session.hasher.update(chunk)
+                    session.offset += len(chunk)
+            return session.offset
+
+    def complete(self, upload_id: str) -> dict:
+        """Finalizes the upload into a blob and returns {content_hash, size, deduplicated, upload_time_seconds}."""
+        session = self._session(upload_id)
+        with session.lock:
+            if session.size is not None and session.offset != session.size:
+                raise UploadError(f"Upload has {session.offset} of {session.size} bytes.", session.offset)
+            content_hash = session.hasher.hexdigest()
+            path = self.blob_path(content_hash)
+            deduplicated = os.path.exists(path)
+            if deduplicated:
+                os.remove(session.path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(session.path, path)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            return {"content_hash": content_hash, "size": session.offset, "deduplicated": deduplicated,
+                    "upload_time_seconds": round(time.monotonic() - session.started, 3)}
+
+    def abort(self, upload_id: str):
+        session = self._session(upload_id)
+        with session.lock:
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            if os.path.exists(session.path):
+                os.remove(session.path)
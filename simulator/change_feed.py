@@ -0,0 +1,63 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from typing import List, Optional, Tuple
+
+
+class ChangeFeed:
+    """
+    Ordered feed of entity changes for subscribers that want to refresh only what changed.
+    Every change gets the next sequence number and is kept in a ring buffer of the latest
+    capacity events, so publishing is O(1) and memory stays bounded. A subscriber that
+    falls further behind than the buffer, or that saw a different feed_id (the server
+    restarted), is told to reset and reload everything instead.
+    Events are (seq, kind, id, version) tuples; champion queue changes have kind
+    "champion_queue" and the ad group's ID (None when the queue was reordered). A simulation
+    publishes one "ad_group_performance" event per campaign whose ad groups it updated, with
+    the campaign's ID (None for ad groups outside campaigns), rather than one per ad group.
+    """
+
+    def __init__(self, capacity: int = 100000):
+        self.feed_id = uuid.uuid4().hex[:12]
+        self._events: "deque[tuple]" = deque(maxlen=capacity)
+        self._sequence = 0
+        self._changed = threading.Condition(threading.Lock())
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the latest event, 0 before the first one."""
+        return self._sequence
+
+    def publish(self, kind: str, entity_id: Optional[str], version: int = 0):
+        with self._changed:
+            self._sequence += 1
+            self._events.append((self._sequence, kind, entity_id, version))
+            self._changed.notify_all()
+
+    def since(self, sequence: int, limit: int = 1000) -> Tuple[List[tuple], bool]:
+        """
+        Returns (events, reset): up to limit events after sequence, oldest first, and whether
+        the subscriber missed events that are no longer buffered and has to reload.
+        """
+        with self._changed:
+            if not self._events or sequence >= self._sequence:
+                return [], sequence > self._sequence
+            oldest = self._events[0][0]
+            if sequence < oldest - 1:
+                return [], True
+            # Sequence numbers are contiguous, so the position of sequence + 1 is known
+            start = sequence + 1 - oldest
+            return list(itertools.islice(self._events, start, start + limit)), False
+
+    def wait(self, sequence: int, timeout: float) -> bool:
+        """Blocks until there is an event after sequence or timeout seconds passed; True if there is."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._sequence <= sequence:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
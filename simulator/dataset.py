@@ -0,0 +1,252 @@
+"""
+Synthetic datasets for loading the simulator with realistic volumes of entities.
+
+Generate one and save it as a .npz file:
+    python -m simulator.dataset synthetic.npz --accounts 1000 --campaigns 20 --ad-groups 16
+then start the simulator preloaded with it:
+    python3 moloco_simulator.py --server production --dataset synthetic.npz
+"""
+import argparse
+import dataclasses
+import datetime
+import gc
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from dtos.campaign import Campaign
+from dtos.ad_group import AdGroup
+from dtos.creative_group import CreativeGroup
+from dtos.creative import Creative
+from simulator.entity_store import EntityStore
+from simulator.persistence import EntitySnapshot
+
+# Code tables of the int8 columns
+CAMPAIGN_TYPES = ("REGULAR", "TESTING")
+CAMPAIGN_STATUSES = ("ACTIVE", "PAUSED")
+CREATIVE_TYPES = ("VIDEO", "IMAGE")
+AD_TYPES = ("PORTRAIT", "LANDSCAPE")
+_FORMAT_VERSION = 1
+_TESTING_IMPRESSIONS_GOAL = 10000 # impressions_goal_per_cg of generated testing campaigns
+
+
+def account_id(account: int) -> str:
+    return f"synthetic_account_{account}"
+
+
+class SyntheticDataset:
+    """
+    Columnar image of accounts x campaigns_per_account x ad_groups_per_campaign entities.
+    Every ad group has one creative group holding one creative. Per-campaign columns are
+    (accounts, campaigns) arrays and per-ad-group columns (accounts, campaigns, ad_groups) arrays
+    of small integer types, so a million entities take a few megabytes and no IDs are stored:
+    they follow from the array positions. save() writes the columns to one uncompressed .npz
+    file, which load() reads back without parsing anything.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], created: float):
+        self.columns = columns
+        self.created = created # Epoch seconds; every entity's createTime and lastModifiedTime
+
+    @property
+    def shape(self):
+        return self.columns["ad_group_impressions"].shape
+
+    def entity_count(self) -> int:
+        accounts, campaigns, ad_groups = self.shape
+        return accounts * campaigns * (1 + 3 * ad_groups)
+
+    @classmethod
+    def generate(cls, accounts: int, campaigns_per_account: int, ad_groups_per_campaign: int,
+                 testing_campaigns_per_account: int = 1, paused_share: float = 0.1, champions: int = 100,
+                 impressions_median: float = 2000, impressions_sigma: float = 1.2, rate_median: float = 0.03,
+                 rate_sigma: float = 0.6, seed: Optional[int] = None) -> "SyntheticDataset":
+        """
+        Draws a dataset with the skew of real ad traffic. Accounts get a lognormal traffic scale,
+        so a few large accounts serve most impressions, and each ad group's impressions are
+        lognormal on top of that, so most ad groups have little traffic. True conversion rates
+        are lognormal around rate_median, so a few ad groups convert several times better than
+        the rest, and conversions are binomial draws at those rates. The first
+        testing_campaigns_per_account campaigns of each account are TESTING campaigns, and the
+        champions ad groups with the best observed rate among theirs fill the champion queue.
+        """
+        rng = np.random.default_rng(seed)
+        campaign_shape = (accounts, campaigns_per_account)
+        shape = campaign_shape + (ad_groups_per_campaign,)
+        account_scale = rng.lognormal(0.0, 1.0, size=(accounts, 1, 1))
+        impressions = rng.lognormal(np.log(impressions_median), impressions_sigma, size=shape) * account_scale
+        impressions = np.minimum(impressions, np.iinfo(np.int32).max).astype(np.int32)
+        rates = np.minimum(rng.lognormal(np.log(rate_median), rate_sigma, size=shape), 1.0).astype(np.float32)
+        conversions = rng.binomial(impressions, rates).astype(np.int32)
+        campaign_type = np.zeros(campaign_shape, dtype=np.int8)
+        campaign_type[:, :testing_campaigns_per_account] = CAMPAIGN_TYPES.index("TESTING")
+        campaign_status = (rng.random(campaign_shape) < paused_share).astype(np.int8)
+        # Champions: the best converting testing ad groups with enough traffic to trust the rate
+        observed = np.where((campaign_type[..., None] == CAMPAIGN_TYPES.index("TESTING")) & (impressions >= 1000),
+                            conversions / np.maximum(impressions, 1), -1.0)
+        best = np.argsort(-observed, axis=None, kind="stable")[:champions]
+        best = best[observed.ravel()[best] >= 0]
+        champion_rank = np.full(shape, -1, dtype=np.int32)
+        champion_rank.ravel()[best] = np.arange(len(best), dtype=np.int32)
+        columns = {
+            "account_index": np.arange(accounts, dtype=np.int32),
+            "campaign_type": campaign_type,
+            "campaign_status": campaign_status,
+            "ad_group_impressions": impressions,
+            "ad_group_conversions": conversions,
+            "ad_group_rate": rates,
+            "champion_rank": champion_rank,
+            "creative_type": rng.integers(0, len(CREATIVE_TYPES), size=shape, dtype=np.int8),
+            "creative_ad_type": rng.integers(0, len(AD_TYPES), size=shape, dtype=np.int8),
+        }
+        return cls(columns, time.time())
+
+    def save(self, path: str):
+        """Writes the dataset to path; numpy appends .npz when path has no extension."""
+        np.savez(path, format_version=np.int32(_FORMAT_VERSION), created=np.float64(self.created), **self.columns)
+
+    @classmethod
+    def load(cls, path: str) -> "SyntheticDataset":
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+        format_version = int(columns.pop("format_version"))
+        if format_version != _FORMAT_VERSION:
+            raise ValueError(f"{path} has dataset format {format_version}; this simulator reads format {_FORMAT_VERSION}.")
+        return cls(columns, float(columns.pop("created")))
+
+    def for_accounts(self, keep: Callable[[str], bool]) -> "SyntheticDataset":
+        """The part of the dataset whose account IDs keep accepts, e.g. the accounts of one shard."""
+        mask = np.fromiter((keep(account_id(account)) for account in self.columns["account_index"].tolist()),
+                           dtype=bool, count=len(self.columns["account_index"]))
+        return SyntheticDataset({name: column[mask] for name, column in self.columns.items()}, self.created)
+
+    def _keys(self) -> List[str]:
+        """account_campaign_adgroup position keys of every ad group, in column order."""
+        _, campaigns, ad_groups = self.shape
+        return [f"{account}_{campaign}_{ad_group}" for account in self.columns["account_index"].tolist()
+                for campaign in range(campaigns) for ad_group in range(ad_groups)]
+
+    def ad_group_ids(self, id_suffix: str = "") -> List[str]:
+        return [f"ad_group_syn{key}{id_suffix}" for key in self._keys()]
+
+    def true_rates(self, id_suffix: str = "") -> Dict[str, float]:
+        """Ad group ID -> the conversion rate its performance was drawn at, for the performance engine."""
+        return dict(zip(self.ad_group_ids(id_suffix), self.columns["ad_group_rate"].ravel().tolist()))
+
+    def build_store(self, id_suffix: str = "") -> EntityStore:
+        """
+        Builds an EntityStore holding the dataset, straight from its columns. id_suffix is appended
+        to every generated entity ID, like the tag of the shard that owns them.
+        """
+        # Like EntityStore.load: the columns are a million long-lived objects, so collecting is wasted work
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._build_store(id_suffix)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _build_store(self, id_suffix: str) -> EntityStore:
+        accounts, campaigns, ad_groups = self.shape
+        created = datetime.datetime.fromtimestamp(self.created).isoformat()
+        account_ids = [account_id(account) for account in self.columns["account_index"].tolist()]
+        product_ids = [f"synthetic_product_{account}" for account in self.columns["account_index"].tolist()]
+        keys = self._keys()
+        ad_group_ids = [f"ad_group_syn{key}{id_suffix}" for key in keys]
+        creative_group_ids = [f"creative_group_syn{key}{id_suffix}" for key in keys]
+        creative_ids = [f"creative_syn{key}{id_suffix}" for key in keys]
+        campaign_ids = [f"campaign_syn{key.rsplit('_', 1)[0]}{id_suffix}" for key in keys[::ad_groups]]
+        ad_group_count, campaign_count = len(keys), len(campaign_ids)
+        per_ad_group = ad_groups * campaigns
+
+        creatives = {
+            "id": creative_ids,
+            "ad_account_id": [value for value in account_ids for _ in range(per_ad_group)],
+            "product_id": [value for value in product_ids for _ in range(per_ad_group)],
+            "title": creative_ids,
+            "type": _decode(CREATIVE_TYPES, self.columns["creative_type"]),
+            "ad_type": _decode(AD_TYPES, self.columns["creative_ad_type"]),
+            "video_property": [{"auto_endcard": True} for _ in range(ad_group_count)],
+            "createTime": [created] * ad_group_count,
+            "lastModifiedTime": [created] * ad_group_count,
+            "content_hash": [None] * ad_group_count,
+            "status": ["READY"] * ad_group_count,
+        }
+        creative_groups = {
+            "id": creative_group_ids,
+            "title": creative_group_ids,
+            "description": ["Synthetic creative group"] * ad_group_count,
+            "creative_ids": [[creative_id] for creative_id in creative_ids],
+            "status": ["ACTIVE"] * ad_group_count,
+            "createTime": [created] * ad_group_count,
+            "lastModifiedTime": [created] * ad_group_count,
+            "performance": [{"impressions": 0, "conversions": 0} for _ in range(ad_group_count)],
+        }
+        ad_group_columns = {
+            "ad_group_id": ad_group_ids,
+            "campaign_id": [value for value in campaign_ids for _ in range(ad_groups)],
+            "creative_group_ids": [[creative_group_id] for creative_group_id in creative_group_ids],
+            "performance": [{"impressions": impressions, "conversions": conversions} for impressions, conversions
+                            in zip(self.columns["ad_group_impressions"].ravel().tolist(),
+                                   self.columns["ad_group_conversions"].ravel().tolist())],
+        }
+        types = _decode(CAMPAIGN_TYPES, self.columns["campaign_type"])
+        campaign_columns = {
+            "ad_account_id": [value for value in account_ids for _ in range(campaigns)],
+            "product_id": [value for value in product_ids for _ in range(campaigns)],
+            "campaign_id": campaign_ids,
+            "title": campaign_ids,
+            "description": ["Synthetic campaign"] * campaign_count,
+            "status": _decode(CAMPAIGN_STATUSES, self.columns["campaign_status"]),
+            "ad_group_ids": [ad_group_ids[start:start + ad_groups] for start in range(0, ad_group_count, ad_groups)],
+            "type": types,
+            "createTime": [created] * campaign_count,
+            "lastModifiedTime": [created] * campaign_count,
+            "impressions_goal_per_cg": [_TESTING_IMPRESSIONS_GOAL if campaign_type == "TESTING" else None
+                                        for campaign_type in types],
+            "allocation_mode": ["FIXED"] * campaign_count,
+            "impression_budget": [None] * campaign_count,
+        }
+        snapshots = {
+            "creative": _snapshot(Creative, creatives, modified_order=creative_ids),
+            "creative_group": _snapshot(CreativeGroup, creative_groups),
+            "ad_group": _snapshot(AdGroup, ad_group_columns),
+            "campaign": _snapshot(Campaign, campaign_columns, modified_order=campaign_ids),
+        }
+        ranks = self.columns["champion_rank"].ravel()
+        champions = np.flatnonzero(ranks >= 0)
+        champions = champions[np.argsort(ranks[champions], kind="stable")]
+        return EntityStore.from_snapshots(snapshots, [ad_group_ids[index] for index in champions.tolist()])
+
+
+def _decode(codes: tuple, column: np.ndarray) -> list:
+    """Maps an int8 code column to its strings, flattened in column order."""
+    return np.array(codes, dtype=object)[column.ravel()].tolist()
+
+
+def _snapshot(entity_type, columns: Dict[str, list], modified_order: Optional[List[str]] = None) -> EntitySnapshot:
+    field_names = [field.name for field in dataclasses.fields(entity_type)]
+    count = len(next(iter(columns.values())))
+    return EntitySnapshot(field_names, [columns[name] for name in field_names], [1] * count, modified_order)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset for moloco_simulator.py --dataset")
+    parser.add_argument("path", help="File to write (.npz)")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--campaigns", type=int, default=20, help="Campaigns per account")
+    parser.add_argument("--ad-groups", type=int, default=16, help="Ad groups per campaign")
+    parser.add_argument("--testing-campaigns", type=int, default=1, help="TESTING campaigns per account")
+    parser.add_argument("--champions", type=int, default=100, help="Ad groups to put in the champion queue")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    dataset = SyntheticDataset.generate(args.accounts, args.campaigns, args.ad_groups,
+                                        testing_campaigns_per_account=args.testing_campaigns,
+                                        champions=args.champions, seed=args.seed)
+    dataset.save(args.path)
+    print(f"Wrote {dataset.entity_count():,} entities to {args.path} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
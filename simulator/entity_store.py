@@ -0,0 +1,492 @@
+import dataclasses
+import datetime
+import functools
+import gc
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+from dtos.campaign import Campaign
+from dtos.ad_group import AdGroup
+from dtos.creative_group import CreativeGroup
+from dtos.creative import Creative
+from simulator.change_feed import ChangeFeed
+from simulator.persistence import ENTITY_KINDS, EntitySnapshot
+from simulator.worst_performer_index import WorstPerformerIndex
+
+_ENTITY_TYPES = {"creative": Creative, "creative_group": CreativeGroup, "ad_group": AdGroup, "campaign": Campaign}
+_ID_FIELDS = {"creative": "id", "creative_group": "id", "ad_group": "ad_group_id", "campaign": "campaign_id"}
+
+
+def _synchronized(method):
+    """Runs a store method under the store's lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class EntityStore:
+    """
+    In-memory repository for the mock Moloco entities.
+    Every entity is kept in a dict keyed by its ID, and the lookups the API needs
+    (creatives by ad_type, ad groups by campaign, owning campaign of an ad group,
+    campaigns by status) are answered from secondary indexes that are updated on
+    every insert, attach and replace.
+    Each entity also carries a version number that is bumped on every change, and
+    creatives and campaigns are kept in last-modified order so delta queries only
+    touch the entities that changed. Every change is also published to `changes`, a
+    sequenced ChangeFeed that subscribers follow instead of re-reading everything.
+    With a persistence backend attached, every change is also handed to it for a
+    group-committed write, and load() rebuilds a store from it.
+    All writes, and reads that walk an index, hold one reentrant lock, so the store is safe
+    to share between request threads. Point lookups by ID are single dict reads and take
+    no lock. Callers that read and then write (find the worst ad group, then replace it)
+    hold `lock` around the whole sequence.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Primary indexes
+        self._creatives: Dict[str, Creative] = {}
+        self._creative_groups: Dict[str, CreativeGroup] = {}
+        self._ad_groups: Dict[str, AdGroup] = {}
+        self._campaigns: Dict[str, Campaign] = {}
+        # Secondary indexes (dicts with None values are used as insertion-ordered sets).
+        # Creatives and campaigns are never deleted, so their scan orders are append-only
+        # lists that page tokens can address by position.
+        self._creative_ids_by_ad_type: Dict[str, List[str]] = {}
+        self._campaign_order: List[str] = []
+        # The campaign's own ad_group_ids list is its ad group index; positions make removal O(1)
+        self._ad_group_positions: Dict[str, int] = {}
+        self._campaign_id_by_ad_group: Dict[str, str] = {}
+        self._campaign_ids_by_status: Dict[str, Dict[str, None]] = {}
+        # Per-campaign min-heaps of attached ad groups by conversions
+        self._worst_performers = WorstPerformerIndex()
+        # Champion ad groups waiting to replace the worst ad group of a regular campaign
+        self._champion_queue: "deque[AdGroup]" = deque()
+        # Change tracking: kind -> id -> version, and kind -> ids ordered by last modification
+        self._versions: Dict[str, Dict[str, int]] = {kind: {} for kind in ENTITY_KINDS}
+        self._modified_order: Dict[str, "OrderedDict[str, None]"] = {"creative": OrderedDict(), "campaign": OrderedDict()}
+        self._entities_by_kind = {"creative": self._creatives, "creative_group": self._creative_groups,
+                                  "ad_group": self._ad_groups, "campaign": self._campaigns}
+        self._persistence = None
+        # Sequenced change events for subscribers (load() does not replay history into it)
+        self.changes = ChangeFeed()
+
+    # --- Persistence ---
+    @classmethod
+    def load(cls, persistence) -> "EntityStore":
+        """
+        Rebuilds a store from a persistence backend's snapshots and change log, then keeps
+        writing changes to it. Entities are rebuilt in bulk and indexed once, without
+        replaying every historical change.
+        """
+        store = cls._build(persistence)
+        store._persistence = persistence
+        return store
+
+    @classmethod
+    def from_snapshots(cls, snapshots: Dict[str, EntitySnapshot], champion_queue: List[str] = ()) -> "EntityStore":
+        """
+        Builds a store without persistence from one snapshot per entity kind and the champion
+        queue's ad group IDs, in bulk like load(). Used to start from a generated dataset.
+        """
+        return cls._build(_SnapshotSource(snapshots, champion_queue))
+
+    @classmethod
+    def _build(cls, source) -> "EntityStore":
+        store = cls()
+        # Everything loaded here is long-lived, so collecting while building it is wasted work
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            store._load_entities(source)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        for ad_group_id in source.load_champion_queue():
+            store._champion_queue.append(store._ad_groups[ad_group_id])
+        return store
+
+    def _load_entities(self, persistence):
+        for kind in ENTITY_KINDS:
+            entity_type = _ENTITY_TYPES[kind]
+            entities = self._entities_by_kind[kind]
+            versions = self._versions[kind]
+            snapshot = persistence.load_snapshot(kind)
+            if snapshot is not None:
+                ids = snapshot.columns[snapshot.field_names.index(_ID_FIELDS[kind])]
+                if snapshot.field_names == [f.name for f in dataclasses.fields(entity_type)]:
+                    entities.update(zip(ids, map(entity_type, *snapshot.columns)))
+                else:
+                    # Written by an older DTO layout: fall back to keyword construction
+                    entities.update(zip(ids, (entity_type(**dict(zip(snapshot.field_names, values)))
+                                              for values in zip(*snapshot.columns))))
+                versions.update(zip(ids, snapshot.versions))
+                if kind in self._modified_order:
+                    self._modified_order[kind] = OrderedDict.fromkeys(snapshot.modified_order)
+            log = persistence.load_log(kind)
+            for entry in log:
+                entities[entry.entity_id] = entity_type(**entry.fields)
+                versions[entry.entity_id] = entry.version
+            modified_order = self._modified_order.get(kind)
+            if modified_order is not None:
+                for entry in sorted(log, key=lambda e: e.updated):
+                    modified_order[entry.entity_id] = None
+                    modified_order.move_to_end(entry.entity_id)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        for creative_id, creative in self._creatives.items():
+            self._creative_ids_by_ad_type.setdefault(creative.ad_type, []).append(creative_id)
+        for campaign_id, campaign in self._campaigns.items():
+            self._campaign_order.append(campaign_id)
+            self._campaign_ids_by_status.setdefault(campaign.status, {})[campaign_id] = None
+            self._ad_group_positions.update(zip(campaign.ad_group_ids, range(len(campaign.ad_group_ids))))
+            self._campaign_id_by_ad_group.update(dict.fromkeys(campaign.ad_group_ids, campaign_id))
+            self._worst_performers.load_campaign(campaign_id, [
+                (ad_group_id, self._ad_groups[ad_group_id].performance["conversions"])
+                for ad_group_id in campaign.ad_group_ids if ad_group_id in self._ad_groups])
+
+    @_synchronized
+    def attach_persistence(self, persistence):
+        """Writes the whole store to an empty backend as its first snapshot, then keeps writing changes to it."""
+        self._persistence = persistence
+        for ad_group in self._champion_queue:
+            persistence.champion_enqueued(ad_group.ad_group_id)
+        self.compact()
+
+    @_synchronized
+    def compact(self):
+        """Writes a snapshot of every entity to the persistence backend, which then drops its change log."""
+        snapshots = {}
+        for kind in ENTITY_KINDS:
+            entity_type = _ENTITY_TYPES[kind]
+            entities = self._entities_by_kind[kind]
+            field_names = [f.name for f in dataclasses.fields(entity_type)]
+            columns = [[getattr(entity, name) for entity in entities.values()] for name in field_names]
+            versions = [self._versions[kind][entity_id] for entity_id in entities]
+            modified_order = list(self._modified_order[kind]) if kind in self._modified_order else None
+            snapshots[kind] = EntitySnapshot(field_names, columns, versions, modified_order)
+        self._persistence.write_snapshots(snapshots)
+
+    def _persist(self, kind: str, entity_id: str):
+        entity = self._entities_by_kind[kind][entity_id]
+        self._persistence.save(kind, entity_id, self._versions[kind][entity_id], entity.to_dict())
+
+    # --- Change Tracking ---
+    def version(self, kind: str, entity_id: str) -> int:
+        """Returns the entity's version, which starts at 1 on insert and grows on every change."""
+        return self._versions[kind].get(entity_id, 0)
+
+    def _mark_modified(self, kind: str, entity_id: str):
+        versions = self._versions[kind]
+        versions[entity_id] = versions.get(entity_id, 0) + 1
+        modified_order = self._modified_order.get(kind)
+        if modified_order is not None:
+            modified_order[entity_id] = None
+            modified_order.move_to_end(entity_id)
+        if self._persistence is not None:
+            self._persist(kind, entity_id)
+        self.changes.publish(kind, entity_id, versions[entity_id])
+
+    def _touch_campaign(self, campaign: Campaign):
+        campaign.lastModifiedTime = datetime.datetime.now().isoformat()
+        self._mark_modified("campaign", campaign.campaign_id)
+
+    def _modified_since(self, kind: str, entities: dict, since: str) -> list:
+        # Walk back from the most recently modified entity and stop at the first older one
+        result = []
+        for entity_id in reversed(self._modified_order[kind]):
+            entity = entities[entity_id]
+            if entity.lastModifiedTime <= since:
+                break
+            result.append(entity)
+        result.reverse()
+        return result
+
+    # --- Creatives ---
+    @_synchronized
+    def add_creative(self, creative: Creative):
+        if creative.id not in self._creatives:
+            self._creative_ids_by_ad_type.setdefault(creative.ad_type, []).append(creative.id)
+        self._creatives[creative.id] = creative
+        self._mark_modified("creative", creative.id)
+
+    def get_creative(self, creative_id: str) -> Optional[Creative]:
+        return self._creatives.get(creative_id)
+
+    def creatives_by_ad_type(self, ad_type: str) -> List[Creative]:
+        ids = self._creative_ids_by_ad_type.get(ad_type, [])
+        return [self._creatives[creative_id] for creative_id in ids]
+
+    def scan_creatives_by_ad_type(self, ad_type: str, start: int = 0) -> Iterator[Tuple[int, Creative]]:
+        """Lazily yields (position, creative) pairs for the ad_type, starting at a page token offset."""
+        ids = self._creative_ids_by_ad_type.get(ad_type, [])
+        for position in range(start, len(ids)):
+            yield position, self._creatives[ids[position]]
+
+    @_synchronized
+    def creatives_modified_since(self, since: str) -> List[Creative]:
+        """Returns creatives whose lastModifiedTime is after since, oldest change first."""
+        return self._modified_since("creative", self._creatives, since)
+
+    @_synchronized
+    def creatives_with_status(self, status: str) -> List[Creative]:
+        return [creative for creative in self._creatives.values() if creative.status == status]
+
+    @_synchronized
+    def update_creative_status(self, creative_id: str, status: str, video_property: Optional[dict] = None):
+        """Sets the creative's processing status, merging video_property into its existing one."""
+        creative = self._creatives[creative_id]
+        creative.status = status
+        if video_property:
+            creative.video_property = {**creative.video_property, **video_property}
+        creative.lastModifiedTime = datetime.datetime.now().isoformat()
+        self._mark_modified("creative", creative_id)
+
+    # --- Creative Groups ---
+    @_synchronized
+    def add_creative_group(self, creative_group: CreativeGroup):
+        self._creative_groups[creative_group.id] = creative_group
+        self._mark_modified("creative_group", creative_group.id)
+
+    def get_creative_group(self, creative_group_id: str) -> Optional[CreativeGroup]:
+        return self._creative_groups.get(creative_group_id)
+
+    # --- Ad Groups ---
+    @_synchronized
+    def add_ad_group(self, ad_group: AdGroup):
+        self._ad_groups[ad_group.ad_group_id] = ad_group
+        self._mark_modified("ad_group", ad_group.ad_group_id)
+        self._index_performance(ad_group.ad_group_id)
+
+    def get_ad_group(self, ad_group_id: str) -> Optional[AdGroup]:
+        return self._ad_groups.get(ad_group_id)
+
+    @_synchronized
+    def update_ad_group_performance(self, ad_group_id: str, performance: Dict[str, int]):
+        self._ad_groups[ad_group_id].performance = performance
+        self._mark_modified("ad_group", ad_group_id)
+        self._index_performance(ad_group_id)
+
+    @_synchronized
+    def add_ad_group_performance(self, ad_group_ids: List[str], impressions: List[int], conversions: List[int]):
+        """
+        Adds simulated impressions and conversions to the running totals of many ad groups in bulk:
+        one version bump each, one batched persistence record, and one worst-performer heap rebuild
+        and one "ad_group_performance" change event per campaign they are attached to, instead of a
+        full update per ad group.
+        """
+        ad_groups = self._ad_groups
+        for ad_group_id, imp, conv in zip(ad_group_ids, impressions, conversions):
+            ad_group = ad_groups[ad_group_id]
+            performance = ad_group.performance
+            ad_group.performance = {"impressions": performance["impressions"] + imp,
+                                    "conversions": performance["conversions"] + conv}
+        changed = list(dict.fromkeys(ad_group_ids))
+        versions = self._versions["ad_group"]
+        for ad_group_id in changed:
+            versions[ad_group_id] = versions.get(ad_group_id, 0) + 1
+        if self._persistence is not None:
+            self._persistence.save_many("ad_group", [(ad_group_id, versions[ad_group_id],
+                                                      ad_groups[ad_group_id].to_dict()) for ad_group_id in changed])
+        campaign_ids = dict.fromkeys(self._campaign_id_by_ad_group.get(ad_group_id) for ad_group_id in changed)
+        for campaign_id in campaign_ids:
+            self.changes.publish("ad_group_performance", campaign_id)
+        campaign_ids.pop(None, None)
+        for campaign_id in campaign_ids:
+            self._worst_performers.rebuild_campaign(campaign_id, [
+                (ad_group_id, ad_groups[ad_group_id].performance["conversions"])
+                for ad_group_id in self._campaigns[campaign_id].ad_group_ids if ad_group_id in ad_groups])
+
+    def _index_performance(self, ad_group_id: str):
+        # Only attached ad groups compete for worst-performer replacement
+        campaign_id = self._campaign_id_by_ad_group.get(ad_group_id)
+        ad_group = self._ad_groups.get(ad_group_id)
+        if campaign_id is not None and ad_group is not None:
+            self._worst_performers.update(campaign_id, ad_group_id, ad_group.performance["conversions"])
+
+    @_synchronized
+    def worst_ad_group(self, campaign_id: str) -> Optional[AdGroup]:
+        """Returns the attached ad group with the fewest conversions, or None if the campaign has none."""
+        worst = self._worst_performers.worst(campaign_id)
+        return self._ad_groups[worst[0]] if worst is not None else None
+
+    @_synchronized
+    def k_worst_ad_groups(self, campaign_ids: List[str], k: int) -> List[Tuple[str, AdGroup]]:
+        """Returns the k ad groups with the fewest conversions across the campaigns, as (campaign_id, ad_group)."""
+        return [(campaign_id, self._ad_groups[ad_group_id])
+                for campaign_id, ad_group_id, _ in self._worst_performers.k_worst(campaign_ids, k)]
+
+    @_synchronized
+    def ad_groups_for_campaign(self, campaign_id: str) -> List[AdGroup]:
+        """Returns the ad groups currently attached to the campaign, in the campaign's ad_group_ids order."""
+        campaign = self._campaigns.get(campaign_id)
+        ids = campaign.ad_group_ids if campaign is not None else []
+        return [self._ad_groups[ad_group_id] for ad_group_id in ids if ad_group_id in self._ad_groups]
+
+    def campaign_for_ad_group(self, ad_group_id: str) -> Optional[Campaign]:
+        """Returns the campaign the ad group is attached to, or None if it is not attached."""
+        campaign_id = self._campaign_id_by_ad_group.get(ad_group_id)
+        return self._campaigns.get(campaign_id) if campaign_id is not None else None
+
+    # --- Campaigns ---
+    @_synchronized
+    def add_campaign(self, campaign: Campaign):
+        if campaign.campaign_id not in self._campaigns:
+            self._campaign_order.append(campaign.campaign_id)
+        self._campaigns[campaign.campaign_id] = campaign
+        self._campaign_ids_by_status.setdefault(campaign.status, {})[campaign.campaign_id] = None
+        for position, ad_group_id in enumerate(campaign.ad_group_ids):
+            self._ad_group_positions[ad_group_id] = position
+            self._campaign_id_by_ad_group[ad_group_id] = campaign.campaign_id
+            self._index_performance(ad_group_id)
+        self._mark_modified("campaign", campaign.campaign_id)
+
+    def get_campaign(self, campaign_id: str) -> Optional[Campaign]:
+        return self._campaigns.get(campaign_id)
+
+    @_synchronized
+    def campaigns(self, status: Optional[str] = None) -> List[Campaign]:
+        """Returns all campaigns, or only those with the given status."""
+        if status is None:
+            return list(self._campaigns.values())
+        ids = self._campaign_ids_by_status.get(status, {})
+        return [self._campaigns[campaign_id] for campaign_id in ids]
+
+    def scan_campaigns(self, start: int = 0) -> Iterator[Tuple[int, Campaign]]:
+        """Lazily yields (position, campaign) pairs in creation order, starting at a page token offset."""
+        for position in range(start, len(self._campaign_order)):
+            yield position, self._campaigns[self._campaign_order[position]]
+
+    @_synchronized
+    def campaigns_modified_since(self, since: str) -> List[Campaign]:
+        """Returns campaigns whose lastModifiedTime is after since, oldest change first."""
+        return self._modified_since("campaign", self._campaigns, since)
+
+    @_synchronized
+    def update_campaign_status(self, campaign_id: str, status: str):
+        campaign = self._campaigns[campaign_id]
+        self._campaign_ids_by_status.get(campaign.status, {}).pop(campaign_id, None)
+        campaign.status = status
+        self._campaign_ids_by_status.setdefault(status, {})[campaign_id] = None
+        self._touch_campaign(campaign)
+
+    @_synchronized
+    def update_campaign_allocation(self, campaign_id: str, allocation_mode: str, impression_budget: Optional[int]):
+        campaign = self._campaigns[campaign_id]
+        campaign.allocation_mode = allocation_mode
+        campaign.impression_budget = impression_budget
+        self._touch_campaign(campaign)
+
+    @_synchronized
+    def attach_ad_group(self, campaign_id: str, ad_group_id: str):
+        """Attaches an existing ad group to a campaign, detaching it from its previous campaign."""
+        campaign = self._campaigns[campaign_id]
+        self._detach_ad_group(ad_group_id)
+        self._ad_group_positions[ad_group_id] = len(campaign.ad_group_ids)
+        campaign.ad_group_ids.append(ad_group_id)
+        self._campaign_id_by_ad_group[ad_group_id] = campaign_id
+        self._index_performance(ad_group_id)
+        self._touch_campaign(campaign)
+
+    @_synchronized
+    def replace_ad_group(self, campaign_id: str, old_ad_group_id: str, new_ad_group_id: str):
+        """Swaps new_ad_group_id into the position of old_ad_group_id in the campaign, in O(1)."""
+        if old_ad_group_id == new_ad_group_id:
+            return
+        if self._campaign_id_by_ad_group.get(old_ad_group_id) != campaign_id:
+            self.attach_ad_group(campaign_id, new_ad_group_id)
+            return
+        # Detach the newcomer first, as it may sit in this or another campaign
+        self._detach_ad_group(new_ad_group_id)
+        campaign = self._campaigns[campaign_id]
+        position = self._ad_group_positions.pop(old_ad_group_id)
+        del self._campaign_id_by_ad_group[old_ad_group_id]
+        self._worst_performers.remove(old_ad_group_id)
+        campaign.ad_group_ids[position] = new_ad_group_id
+        self._ad_group_positions[new_ad_group_id] = position
+        self._campaign_id_by_ad_group[new_ad_group_id] = campaign_id
+        self._index_performance(new_ad_group_id)
+        self._touch_campaign(campaign)
+
+    def _detach_ad_group(self, ad_group_id: str):
+        campaign_id = self._campaign_id_by_ad_group.pop(ad_group_id, None)
+        if campaign_id is None:
+            return
+        self._worst_performers.remove(ad_group_id)
+        # Move the last ad group into the hole instead of shifting the whole list
+        ad_group_ids = self._campaigns[campaign_id].ad_group_ids
+        position = self._ad_group_positions.pop(ad_group_id)
+        last = ad_group_ids.pop()
+        if last != ad_group_id:
+            ad_group_ids[position] = last
+            self._ad_group_positions[last] = position
+        self._touch_campaign(self._campaigns[campaign_id])
+
+    # --- Champion Queue ---
+    @_synchronized
+    def enqueue_champion(self, ad_group: AdGroup):
+        self._champion_queue.append(ad_group)
+        if self._persistence is not None:
+            self._persistence.champion_enqueued(ad_group.ad_group_id)
+        self.changes.publish("champion_queue", ad_group.ad_group_id)
+
+    @_synchronized
+    def dequeue_champion(self) -> Optional[AdGroup]:
+        if not self._champion_queue:
+            return None
+        if self._persistence is not None:
+            self._persistence.champion_dequeued()
+        ad_group = self._champion_queue.popleft()
+        self.changes.publish("champion_queue", ad_group.ad_group_id)
+        return ad_group
+
+    @_synchronized
+    def requeue_champion(self) -> Optional[AdGroup]:
+        """Moves the next champion to the back of the queue, e.g. when no campaign took it, and returns it."""
+        ad_group = self.dequeue_champion()
+        if ad_group is not None:
+            self.enqueue_champion(ad_group)
+        return ad_group
+
+    @_synchronized
+    def reorder_champions(self, ad_group_ids: List[str]):
+        """Puts the waiting champions in the given order, which must list exactly the queued ad groups."""
+        if sorted(ad_group_ids) != sorted(ad_group.ad_group_id for ad_group in self._champion_queue):
+            raise ValueError("ad_group_ids must list exactly the ad groups in the champion queue.")
+        self._champion_queue = deque(self._ad_groups[ad_group_id] for ad_group_id in ad_group_ids)
+        if self._persistence is not None:
+            self._persistence.champions_reordered(ad_group_ids)
+        self.changes.publish("champion_queue", None)
+
+    @_synchronized
+    def champion_queue(self) -> List[AdGroup]:
+        """Returns a snapshot of the waiting champions, next in line first."""
+        return list(self._champion_queue)
+
+    def next_champion(self) -> Optional[AdGroup]:
+        """The champion dequeue_champion would return, left in the queue; None when it is empty."""
+        return self._champion_queue[0] if self._champion_queue else None
+
+    def champion_queue_size(self) -> int:
+        return len(self._champion_queue)
+
+
+class _SnapshotSource:
+    """Serves in-memory snapshots through the part of the persistence interface that load() reads."""
+
+    def __init__(self, snapshots: Dict[str, EntitySnapshot], champion_queue: List[str]):
+        self._snapshots = snapshots
+        self._champion_queue = list(champion_queue)
+
+    def load_snapshot(self, kind: str) -> Optional[EntitySnapshot]:
+        return self._snapshots.get(kind)
+
+    def load_log(self, kind: str) -> list:
+        return []
+
+    def load_champion_queue(self) -> List[str]:
+        return self._champion_queue
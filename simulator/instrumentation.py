@@ -0,0 +1,161 @@
+import bisect
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from flask import Flask, Response, g, request
+from simulator.serialization import dumps
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pyinstrument is optional; ?profile=1 falls back to cProfile
+    Profiler = None
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_UNMATCHED_ROUTE = "<unmatched>"
+_PROFILE_LINES = 40
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """
+    Per-route request counters, latency histograms and in-flight gauges, rendered in the
+    Prometheus text exposition format. Routes are labelled by their URL rule
+    (/cm/v1/ad_groups/<ad_group_id>), never by the raw path, so label cardinality stays bounded.
+    Extra gauges, such as queue sizes, are read from callbacks at render time.
+    """
+
+    def __init__(self, namespace: str = "simulator"):
+        self.namespace = namespace
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._latency: Dict[Tuple[str, str], _Histogram] = {}
+        self._in_flight: Dict[Tuple[str, str], int] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self._lock = threading.Lock()
+
+    def add_gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        self._gauges.append((f"{self.namespace}_{name}", help_text, read))
+
+    def started(self, method: str, route: str):
+        with self._lock:
+            self._in_flight[method, route] = self._in_flight.get((method, route), 0) + 1
+
+    def finished(self, method: str, route: str, status: int, seconds: float):
+        with self._lock:
+            self._in_flight[method, route] -= 1
+            self._requests[method, route, status] = self._requests.get((method, route, status), 0) + 1
+            histogram = self._latency.get((method, route))
+            if histogram is None:
+                histogram = self._latency[method, route] = _Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        prefix = self.namespace
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted((key, list(h.counts), h.total, h.count) for key, h in self._latency.items())
+            in_flight = sorted(self._in_flight.items())
+        lines = [f"# HELP {prefix}_http_requests_total Requests handled, by route and status.",
+                 f"# TYPE {prefix}_http_requests_total counter"]
+        for (method, route, status), count in requests:
+            lines.append(f'{prefix}_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        lines += [f"# HELP {prefix}_http_request_duration_seconds Time to build the response, by route.",
+                  f"# TYPE {prefix}_http_request_duration_seconds histogram"]
+        for (method, route), counts, total, count in latency:
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'{prefix}_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{prefix}_http_request_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"{prefix}_http_request_duration_seconds_count{{{labels}}} {count}")
+        lines += [f"# HELP {prefix}_http_requests_in_flight Requests being handled, by route.",
+                  f"# TYPE {prefix}_http_requests_in_flight gauge"]
+        for (method, route), count in in_flight:
+            lines.append(f'{prefix}_http_requests_in_flight{{method="{method}",route="{route}"}} {count}')
+        for name, help_text, read in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {read()}"]
+        return "\n".join(lines) + "\n"
+
+
+def instrument(app: Flask, metrics: RequestMetrics, log_sample_rate: float = 0.01,
+               slow_request_seconds: float = 0.5, allow_profiling: bool = True,
+               logger: Optional[logging.Logger] = None):
+    """
+    Records every request of the app in metrics and logs a sample of them as one JSON object
+    per line on the simulator.requests logger. Server errors and requests slower than
+    slow_request_seconds are always logged. Durations cover building the response, not
+    streaming its body.
+    With allow_profiling, a request with ?profile=1 is run under a profiler (pyinstrument when
+    installed, otherwise cProfile) and answered with the text report instead of its normal body.
+    """
+    logger = logger or logging.getLogger("simulator.requests")
+
+    @app.before_request
+    def _start():
+        g.metrics_route = request.url_rule.rule if request.url_rule is not None else _UNMATCHED_ROUTE
+        g.metrics_status = None
+        g.metrics_start = time.perf_counter()
+        metrics.started(request.method, g.metrics_route)
+        if allow_profiling and request.args.get("profile") == "1":
+            g.profiler = _start_profiler()
+
+    @app.after_request
+    def _record(response: Response) -> Response:
+        g.metrics_status = response.status_code
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            return Response(_stop_profiler(profiler), status=response.status_code, mimetype="text/plain")
+        return response
+
+    @app.teardown_request
+    def _finish(error):
+        if "metrics_start" not in g:
+            return
+        seconds = time.perf_counter() - g.metrics_start
+        # A handler that raised never reached after_request
+        status = g.metrics_status or 500
+        metrics.finished(request.method, g.metrics_route, status, seconds)
+        if status >= 500 or seconds >= slow_request_seconds or random.random() < log_sample_rate:
+            logger.info(dumps({"time": time.time(), "method": request.method, "route": g.metrics_route,
+                               "path": request.path, "status": status, "duration_ms": round(seconds * 1000, 3),
+                               "sample_rate": log_sample_rate, "error": repr(error) if error else None}))
+
+
+def _start_profiler():
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler) -> str:
+    if Profiler is not None and isinstance(profiler, Profiler):
+        profiler.stop()
+        return profiler.output_text()
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(_PROFILE_LINES)
+    return out.getvalue()
@@ -0,0 +1,166 @@
+import multiprocessing
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from simulator.media_probe import probe_media
+
+QUEUED, RUNNING, DONE, FAILED = "QUEUED", "RUNNING", "DONE", "FAILED"
+
+
+class QueueFullError(Exception):
+    """The job queue is at capacity. retry_after is a hint, in seconds, for when there will be room."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _probe_with_timeout(path: str, content_hash: str, ad_type: Optional[str], timeout: Optional[float]) -> dict:
+    """
+    probe_media in a worker process, interrupted with TimeoutError after timeout seconds so a
+    pathological file cannot hold the worker (and its queue slot) forever. The timer is a signal
+    in the worker itself, so the worker stays alive and takes the next job. Platforms without
+    setitimer run the probe without a limit.
+    """
+    if not timeout or not hasattr(signal, "setitimer"):
+        return probe_media(path, content_hash, ad_type)
+
+    def expire(signum, frame):
+        raise TimeoutError(f"Probing the asset took longer than {timeout}s.")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return probe_media(path, content_hash, ad_type)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class MediaJob:
+    """Processing of one creative's asset. status is QUEUED, RUNNING, DONE or FAILED."""
+
+    __slots__ = ("job_id", "creative_id", "content_hash", "submitted", "finished", "result", "error", "_future")
+
+    def __init__(self, job_id: str, creative_id: str, content_hash: str):
+        self.job_id = job_id
+        self.creative_id = creative_id
+        self.content_hash = content_hash
+        self.submitted = time.time()
+        self.finished: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._future: Optional[Future] = None
+
+    @property
+    def status(self) -> str:
+        if self.finished is not None:
+            return FAILED if self.error else DONE
+        return RUNNING if self._future is not None and self._future.running() else QUEUED
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "creative_id": self.creative_id,
+            "content_hash": self.content_hash,
+            "status": self.status,
+            "error": self.error,
+            "submitted": self.submitted,
+            "finished": self.finished,
+        }
+
+
+class MediaJobQueue:
+    """
+    Runs probe_media for uploaded assets on a bounded pool of worker processes, so hashing and
+    thumbnailing large files never holds up a request thread or the GIL.
+    At most max_pending jobs are queued or running at once; beyond that submit raises QueueFullError
+    and callers are expected to retry later. on_done(job) is called from a pool thread once a job
+    finishes, with job.result holding the probe_media metadata (job.error is set on failure).
+    The most recent history finished jobs stay available to job() for status polling.
+    A job still probing after job_timeout seconds fails with a TimeoutError.
+    Workers are spawned rather than forked, since the server process runs many threads.
+    """
+
+    def __init__(self, on_done: Callable[[MediaJob], None], max_workers: int = 2, max_pending: int = 256,
+                 history: int = 10000, id_suffix: str = "", job_timeout: Optional[float] = 300):
+        self.on_done = on_done
+        self.id_suffix = id_suffix # Appended to job IDs, e.g. to tell which shard runs the job
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self.job_timeout = job_timeout
+        self._jobs: "OrderedDict[str, MediaJob]" = OrderedDict()
+        self._pending = 0
+        self._average_seconds = 1.0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def pending(self) -> int:
+        return self._pending
+
+    def has_capacity(self, count: int = 1) -> bool:
+        return self._pending + count <= self.max_pending
+
+    def retry_after(self) -> int:
+        """Rough seconds until the backlog drains, from the average job duration so far."""
+        return max(1, round(self._pending * self._average_seconds / self.max_workers))
+
+    def submit(self, creative_id: str, path: str, content_hash: str, ad_type: Optional[str]) -> MediaJob:
+        job = MediaJob(uuid.uuid4().hex + self.id_suffix, creative_id, content_hash)
+        with self._lock:
+            if not self.has_capacity():
+                raise QueueFullError(f"{self._pending} media jobs are already pending.", self.retry_after())
+            self._pending += 1
+            self._jobs[job.job_id] = job
+            args = (path, content_hash, ad_type, self.job_timeout)
+            try:
+                job._future = self._pool().submit(_probe_with_timeout, *args)
+            except BrokenProcessPool:
+                # A worker died and took the pool with it; start a fresh one
+                self._executor = None
+                job._future = self._pool().submit(_probe_with_timeout, *args)
+        # Outside the lock: an already finished future runs the callback right here
+        job._future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def job(self, job_id: str) -> Optional[MediaJob]:
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _finish(self, job: MediaJob, future: Future):
+        if future.cancelled():
+            job.error = "Cancelled."
+        elif future.exception() is not None:
+            job.error = f"{type(future.exception()).__name__}: {future.exception()}"
+        else:
+            job.result = future.result()
+            job.error = job.result["error"]
+        try:
+            self.on_done(job)
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._pending -= 1
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * (job.finished - job.submitted)
+                # Forget the oldest finished jobs; unfinished ones are always kept
+                while len(self._jobs) > self.history:
+                    oldest_id, oldest = next(iter(self._jobs.items()))
+                    if oldest.finished is None:
+                        break
+                    del self._jobs[oldest_id]
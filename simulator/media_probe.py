@@ -0,0 +1,151 @@
+import hashlib
+import io
+import shutil
+import struct
+import subprocess
+from typing import BinaryIO, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only PNG and MP4 headers are probed
+    Image = None
+
+THUMBNAIL_SIZE = (320, 320)
+_HASH_CHUNK_SIZE = 1024 * 1024
+# MP4 boxes that only contain other boxes, down to the ones holding duration and dimensions
+_MP4_CONTAINERS = {b"moov", b"trak"}
+
+
+def probe_media(path: str, content_hash: str, ad_type: Optional[str]) -> dict:
+    """
+    Inspects an uploaded asset and returns its metadata:
+    {format, width, height, duration_seconds, orientation, checksum_ok, thumbnail, error}.
+    Reads only headers, apart from the checksum pass, so large videos are never loaded whole.
+    thumbnail holds JPEG bytes when one could be rendered. error is set when the checksum does
+    not match content_hash or the orientation contradicts the declared ad_type.
+    Runs in a worker process, so it takes and returns plain values only.
+    """
+    metadata = {"format": None, "width": None, "height": None, "duration_seconds": None,
+                "orientation": None, "checksum_ok": _sha256(path) == content_hash, "thumbnail": None, "error": None}
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+        if head[4:8] == b"ftyp":
+            metadata["format"] = "mp4"
+            metadata["width"], metadata["height"], metadata["duration_seconds"] = _probe_mp4(f)
+            metadata["thumbnail"] = _video_thumbnail(path)
+        elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+            metadata["format"] = "png"
+            metadata["width"], metadata["height"] = struct.unpack(">II", f.read(24)[16:24])
+            metadata["thumbnail"] = _image_thumbnail(path)
+        elif Image is not None:
+            metadata["format"], metadata["width"], metadata["height"] = _probe_image(path)
+            metadata["thumbnail"] = _image_thumbnail(path)
+
+    width, height = metadata["width"], metadata["height"]
+    if width and height:
+        metadata["orientation"] = "PORTRAIT" if height > width else "LANDSCAPE" if width > height else "SQUARE"
+    if not metadata["checksum_ok"]:
+        metadata["error"] = "Stored asset does not match its content hash."
+    elif ad_type in ("PORTRAIT", "LANDSCAPE") and metadata["orientation"] not in (None, ad_type):
+        metadata["error"] = (f"Asset is {width}x{height} ({metadata['orientation'].lower()}) "
+                             f"but the creative is declared {ad_type}.")
+    return metadata
+
+
+def _sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _read_box_header(f: BinaryIO) -> Optional[Tuple[bytes, int, int]]:
+    """
+    Returns (type, payload size, header size) of the box at the current position, or None at the end.
+    Raises ValueError for a box whose declared size does not even cover its header.
+    """
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack(">I4s", header)
+    header_size = 8
+    if size == 1:
+        largesize = f.read(8)
+        if len(largesize) < 8:
+            return None
+        size = struct.unpack(">Q", largesize)[0]
+        header_size = 16
+    elif size == 0:
+        # Box runs to the end of the file
+        position = f.tell()
+        size = f.seek(0, io.SEEK_END) - position + header_size
+        f.seek(position)
+    if size < header_size:
+        raise ValueError(f"Malformed MP4: {box_type!r} box declares {size} bytes, less than its header.")
+    return box_type, size - header_size, header_size
+
+
+def _probe_mp4(f: BinaryIO, end: Optional[int] = None) -> Tuple[Optional[int], Optional[int], Optional[float]]:
+    """Walks the MP4 box tree, skipping media data, for the movie duration and the video track size."""
+    width = height = duration = None
+    while end is None or f.tell() < end:
+        box = _read_box_header(f)
+        if box is None:
+            break
+        box_type, payload_size, _ = box
+        payload_start = f.tell()
+        if end is not None and payload_start + payload_size > end:
+            raise ValueError(f"Malformed MP4: {box_type!r} box runs past the end of its parent.")
+        if box_type in _MP4_CONTAINERS:
+            w, h, d = _probe_mp4(f, payload_start + payload_size)
+            width, height = (width, height) if width else (w, h)
+            duration = duration or d
+        elif box_type == b"mvhd":
+            payload = f.read(payload_size)
+            if payload[0] == 1:
+                timescale, length = struct.unpack(">IQ", payload[20:32])
+            else:
+                timescale, length = struct.unpack(">II", payload[12:20])
+            duration = round(length / timescale, 3) if timescale else None
+        elif box_type == b"tkhd":
+            payload = f.read(payload_size)
+            # Width and height are 16.16 fixed point at the end of the box; audio tracks have zeros
+            w, h = struct.unpack(">II", payload[-8:])
+            if w and not width:
+                width, height = w >> 16, h >> 16
+        f.seek(payload_start + payload_size)
+    return width, height, duration
+
+
+def _probe_image(path: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    try:
+        with Image.open(path) as image:
+            return (image.format or "").lower() or None, image.width, image.height
+    except OSError:
+        return None, None, None
+
+
+def _image_thumbnail(path: str) -> Optional[bytes]:
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            out = io.BytesIO()
+            image.convert("RGB").save(out, format="JPEG", quality=80)
+            return out.getvalue()
+    except OSError:
+        return None
+
+
+def _video_thumbnail(path: str) -> Optional[bytes]:
+    # Decoding video frames needs ffmpeg; without it the creative simply has no thumbnail
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    result = subprocess.run([ffmpeg, "-v", "error", "-i", path, "-frames:v", "1",
+                             "-vf", f"scale={THUMBNAIL_SIZE[0]}:-2", "-f", "mjpeg", "pipe:1"],
+                            capture_output=True, timeout=60)
+    return result.stdout or None
@@ -0,0 +1,109 @@
+import base64
+import datetime
+import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from simulator.serialization import dumps
+
+# Upper bound for a single page, so one request cannot ask for the whole store at once
+MAX_PAGE_SIZE = 1000
+
+
+def encode_page_token(offset: int) -> str:
+    """Encodes a scan offset as an opaque page token."""
+    raw = json.dumps({"offset": offset}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_page_token(token: Optional[str]) -> int:
+    """
+    Decodes a page token produced by encode_page_token.
+    Returns 0 for an empty token and raises ValueError for a malformed one.
+    """
+    if not token:
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(token.encode()))["offset"]
+    except Exception:
+        raise ValueError(f"Invalid page_token '{token}'.")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Invalid page_token '{token}'.")
+    return offset
+
+
+def parse_page_size(value: Optional[str]) -> Optional[int]:
+    """Parses the page_size query param. Returns None when the caller did not ask for paging."""
+    if value is None:
+        return None
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid page_size '{value}'.")
+    if page_size <= 0:
+        raise ValueError(f"Invalid page_size '{value}'.")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def _normalize_time(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}'.")
+
+
+def build_filter(args, fields: Tuple[str, ...]) -> Callable[[object], bool]:
+    """
+    Builds a predicate from the request query params.
+    Supports exact matches on the given fields (e.g. type, status) and an
+    inclusive create_time_from / exclusive create_time_to range on createTime.
+    """
+    equals: Dict[str, str] = {f: args.get(f) for f in fields if args.get(f)}
+    time_from = _normalize_time(args.get("create_time_from"))
+    time_to = _normalize_time(args.get("create_time_to"))
+
+    def predicate(entity) -> bool:
+        for field_name, expected in equals.items():
+            if getattr(entity, field_name) != expected:
+                return False
+        if time_from is not None and entity.createTime < time_from:
+            return False
+        if time_to is not None and entity.createTime >= time_to:
+            return False
+        return True
+
+    return predicate
+
+
+def paginate(scan: Iterable[Tuple[int, object]], predicate: Callable[[object], bool],
+             page_size: int) -> Tuple[List[dict], Optional[str]]:
+    """
+    Collects up to page_size matching entities from a (position, entity) scan.
+    Returns the serialized page and the token of the next page (None on the last page).
+    """
+    page = []
+    for position, entity in scan:
+        if not predicate(entity):
+            continue
+        if len(page) == page_size:
+            return page, encode_page_token(position)
+        page.append(entity.to_dict())
+    return page, None
+
+
+def ndjson_stream(scan: Iterable[Tuple[int, object]], predicate: Callable[[object], bool],
+                  limit: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields matching entities as newline-delimited JSON, one line per entity.
+    Entities are serialized lazily, so memory stays flat regardless of result size.
+    When a limit is given, a final {"next_page_token": ...} line is emitted if more results remain.
+    """
+    count = 0
+    for position, entity in scan:
+        if not predicate(entity):
+            continue
+        if limit is not None and count == limit:
+            yield dumps({"next_page_token": encode_page_token(position)}) + "\n"
+            return
+        yield dumps(entity.to_dict()) + "\n"
+        count += 1
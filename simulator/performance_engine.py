@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+
+NOISE_MODELS = ("binomial", "poisson")
+
+
+class PerformanceEngine:
+    """
+    Vectorized impression and conversion simulator for ad groups.
+    Every ad group has a true conversion rate, kept in one NumPy array indexed by slot,
+    and a simulation run draws all ad groups and all ticks in a single batched call.
+    Rates that were never set are drawn uniformly from default_rate_range on first use.
+    """
+
+    def __init__(self, seed: Optional[int] = None, default_rate_range: Tuple[float, float] = (0.01, 0.15)):
+        self._rng = np.random.default_rng(seed)
+        self.default_rate_range = default_rate_range
+        self._slots: Dict[str, int] = {}
+        self._rates = np.empty(0, dtype=np.float64)
+
+    def reseed(self, seed: Optional[int]):
+        self._rng = np.random.default_rng(seed)
+
+    def set_true_rates(self, rates: Dict[str, float]):
+        """Pins the true conversion rate of the given ad groups."""
+        slots = self._slots_for(list(rates))
+        self._rates[slots] = np.fromiter(rates.values(), dtype=np.float64, count=len(rates))
+
+    def true_rates(self, ad_group_ids: List[str]) -> np.ndarray:
+        slots = self._slots_for(ad_group_ids)
+        return self._rates[slots]
+
+    def _slots_for(self, ad_group_ids: List[str]) -> np.ndarray:
+        """Maps IDs to array slots, drawing default rates for IDs seen for the first time."""
+        new_ids = [agid for agid in dict.fromkeys(ad_group_ids) if agid not in self._slots]
+        if new_ids:
+            start = len(self._rates)
+            low, high = self.default_rate_range
+            self._rates = np.concatenate([self._rates, self._rng.uniform(low, high, size=len(new_ids))])
+            self._slots.update(zip(new_ids, range(start, start + len(new_ids))))
+        return np.fromiter((self._slots[agid] for agid in ad_group_ids), dtype=np.intp, count=len(ad_group_ids))
+
+    def simulate(self, ad_group_ids: List[str], impressions_per_tick: Union[int, np.ndarray], ticks: int = 1,
+                 noise: str = "binomial", seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Simulates ticks rounds of traffic for all ad groups in one pass.
+        impressions_per_tick is a scalar or one value per ad group (or a (ticks, n) array).
+        With "binomial" noise every ad group gets exactly its impressions and conversions are
+        Binomial(impressions, rate); with "poisson" noise impressions are Poisson around the
+        target and conversions are Poisson(impressions * rate).
+        Returns (impressions, conversions) as int64 arrays of shape (ticks, n).
+        A seed makes this run reproducible without touching the engine's own generator.
+        """
+        if noise not in NOISE_MODELS:
+            raise ValueError(f"Unknown noise model '{noise}'. Expected one of {NOISE_MODELS}.")
+        rng = np.random.default_rng(seed) if seed is not None else self._rng
+        rates = self.true_rates(ad_group_ids)
+        shape = (ticks, len(ad_group_ids))
+        target = np.broadcast_to(np.asarray(impressions_per_tick, dtype=np.int64), shape)
+        if noise == "binomial":
+            impressions = np.array(target, dtype=np.int64)
+            conversions = rng.binomial(impressions, rates)
+        else:
+            impressions = rng.poisson(target)
+            conversions = np.minimum(rng.poisson(impressions * rates), impressions)
+        return impressions, conversions.astype(np.int64)
@@ -0,0 +1,189 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Rollup granularities and their bucket width in seconds
+GRANULARITIES = {"hour": 3600, "day": 86400}
+
+
+class _Rollup:
+    """
+    Per-bucket totals for one granularity, stored sparsely.
+    Closed buckets keep only the ad group slots that had impressions or conversions in them, as
+    (slot, impressions, conversions) entries of one append-only log grouped by bucket; the open
+    (latest) bucket is a dense row that new samples are added to, and it is written to the log
+    when the next bucket opens. A window sum binary searches the bucket starts for its range of
+    the log and sums those entries per slot, so memory grows with activity rather than with
+    buckets x every ad group ever recorded.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self.bucket_starts = np.empty(16, dtype=np.int64)
+        # Bucket i's entries are log[bucket_offsets[i]:bucket_offsets[i + 1]] once it is closed
+        self.bucket_offsets = np.zeros(17, dtype=np.int64)
+        self.size = 0
+        self._log_slots = np.empty(1024, dtype=np.int32)
+        self._log_impressions = np.empty(1024, dtype=np.int64)
+        self._log_conversions = np.empty(1024, dtype=np.int64)
+        self._log_size = 0
+        self._open_impressions = np.zeros(16, dtype=np.int64)
+        self._open_conversions = np.zeros(16, dtype=np.int64)
+
+    def ensure_slots(self, slot_count: int):
+        capacity = len(self._open_impressions)
+        if slot_count <= capacity:
+            return
+        pad = (0, max(slot_count, capacity * 2) - capacity)
+        self._open_impressions = np.pad(self._open_impressions, pad)
+        self._open_conversions = np.pad(self._open_conversions, pad)
+
+    def append(self, timestamp: int, slots: np.ndarray, impressions: np.ndarray, conversions: np.ndarray):
+        bucket = timestamp - timestamp % self.width
+        last = self.bucket_starts[self.size - 1] if self.size else None
+        if last is not None and bucket < last:
+            raise ValueError("Performance samples must be appended in time order.")
+        if bucket != last:
+            self._open_bucket(bucket)
+        np.add.at(self._open_impressions, slots, impressions)
+        np.add.at(self._open_conversions, slots, conversions)
+
+    def _open_bucket(self, bucket: int):
+        if self.size:
+            self._close_open_bucket()
+        if self.size == len(self.bucket_starts):
+            self.bucket_starts = _grown(self.bucket_starts, self.size, self.size * 2)
+            self.bucket_offsets = _grown(self.bucket_offsets, self.size + 1, self.size * 2 + 1)
+        self.bucket_starts[self.size] = bucket
+        self.bucket_offsets[self.size] = self._log_size
+        self.size += 1
+
+    def _close_open_bucket(self):
+        active = np.flatnonzero(self._open_impressions | self._open_conversions)
+        end = self._log_size + len(active)
+        if end > len(self._log_slots):
+            capacity = max(end, len(self._log_slots) * 2)
+            self._log_slots = _grown(self._log_slots, self._log_size, capacity)
+            self._log_impressions = _grown(self._log_impressions, self._log_size, capacity)
+            self._log_conversions = _grown(self._log_conversions, self._log_size, capacity)
+        self._log_slots[self._log_size:end] = active
+        self._log_impressions[self._log_size:end] = self._open_impressions[active]
+        self._log_conversions[self._log_size:end] = self._open_conversions[active]
+        self._log_size = end
+        self.bucket_offsets[self.size] = end
+        self._open_impressions[active] = 0
+        self._open_conversions[active] = 0
+
+    def window(self, from_ts: Optional[int], to_ts: Optional[int]) -> Tuple[int, int]:
+        """Returns the [lo, hi) bucket range of buckets starting in [from_ts, to_ts)."""
+        starts = self.bucket_starts[:self.size]
+        lo = 0 if from_ts is None else int(np.searchsorted(starts, from_ts - from_ts % self.width, side="left"))
+        hi = self.size if to_ts is None else int(np.searchsorted(starts, to_ts, side="left"))
+        return lo, max(lo, hi)
+
+    def totals_between(self, lo: int, hi: int, slots) -> Tuple[np.ndarray, np.ndarray]:
+        impressions = np.zeros(np.size(slots), dtype=np.int64)
+        conversions = np.zeros(np.size(slots), dtype=np.int64)
+        if hi <= lo:
+            return impressions, conversions
+        # The last bucket is the open one, held in the dense row rather than in the log
+        closed_hi = min(hi, self.size - 1)
+        if closed_hi > lo:
+            start, end = self.bucket_offsets[lo], self.bucket_offsets[closed_hi]
+            entry_slots = self._log_slots[start:end]
+            slot_count = len(self._open_impressions)
+            # Exact as float64 below 2**53 per ad group
+            impressions += np.bincount(entry_slots, weights=self._log_impressions[start:end],
+                                       minlength=slot_count)[slots].astype(np.int64)
+            conversions += np.bincount(entry_slots, weights=self._log_conversions[start:end],
+                                       minlength=slot_count)[slots].astype(np.int64)
+        if hi == self.size:
+            impressions += self._open_impressions[slots]
+            conversions += self._open_conversions[slots]
+        return impressions, conversions
+
+    def slot_series(self, slot: int, lo: int, hi: int) -> List[Tuple[int, int, int]]:
+        """(bucket start, impressions, conversions) of every bucket in [lo, hi) where slot had activity."""
+        entries = []
+        closed_hi = min(hi, self.size - 1)
+        if closed_hi > lo:
+            start, end = self.bucket_offsets[lo], self.bucket_offsets[closed_hi]
+            positions = start + np.flatnonzero(self._log_slots[start:end] == slot)
+            buckets = np.searchsorted(self.bucket_offsets[:self.size], positions, side="right") - 1
+            entries = list(zip(self.bucket_starts[buckets].tolist(), self._log_impressions[positions].tolist(),
+                               self._log_conversions[positions].tolist()))
+        if hi == self.size and hi > lo and (self._open_impressions[slot] or self._open_conversions[slot]):
+            entries.append((int(self.bucket_starts[self.size - 1]), int(self._open_impressions[slot]),
+                            int(self._open_conversions[slot])))
+        return entries
+
+
+def _grown(array: np.ndarray, used: int, capacity: int) -> np.ndarray:
+    """A copy of array's first used items with room for capacity."""
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+class PerformanceTimeSeries:
+    """
+    Append-only, array-backed performance history for ad groups.
+    Samples are rolled up into hourly and daily buckets as they arrive, and each rollup keeps
+    only the ad groups active in each bucket, so a windowed aggregate over any set of ad groups
+    is one vectorized sum over the window's entries instead of per-object Python work.
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._rollups = {name: _Rollup(width) for name, width in GRANULARITIES.items()}
+
+    def _slots_for(self, ad_group_ids: List[str], create: bool) -> np.ndarray:
+        if create:
+            for ad_group_id in ad_group_ids:
+                if ad_group_id not in self._slots:
+                    self._slots[ad_group_id] = len(self._slots)
+            for rollup in self._rollups.values():
+                rollup.ensure_slots(len(self._slots))
+        return np.fromiter((self._slots.get(agid, -1) for agid in ad_group_ids), dtype=np.intp,
+                           count=len(ad_group_ids))
+
+    def last_timestamp(self) -> Optional[int]:
+        """Start of the most recent hourly bucket, or None if nothing was recorded yet."""
+        rollup = self._rollups["hour"]
+        return int(rollup.bucket_starts[rollup.size - 1]) if rollup.size else None
+
+    def append(self, ad_group_ids: List[str], timestamps: List[int], impressions: np.ndarray,
+               conversions: np.ndarray):
+        """
+        Records simulation ticks. impressions and conversions have shape (len(timestamps), len(ad_group_ids)).
+        Timestamps are epoch seconds and must not go back in time.
+        """
+        slots = self._slots_for(ad_group_ids, create=True)
+        for tick, timestamp in enumerate(timestamps):
+            for rollup in self._rollups.values():
+                rollup.append(int(timestamp), slots, impressions[tick], conversions[tick])
+
+    def series(self, ad_group_id: str, granularity: str, from_ts: Optional[int] = None,
+               to_ts: Optional[int] = None) -> List[dict]:
+        """Returns one {start, impressions, conversions} entry per bucket of the ad group in the window."""
+        rollup = self._rollups[granularity]
+        slot = self._slots.get(ad_group_id)
+        if slot is None:
+            return []
+        lo, hi = rollup.window(from_ts, to_ts)
+        return [{"start": start, "impressions": impressions, "conversions": conversions}
+                for start, impressions, conversions in rollup.slot_series(slot, lo, hi)]
+
+    def aggregate(self, ad_group_ids: List[str], granularity: str = "day", from_ts: Optional[int] = None,
+                  to_ts: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (impressions, conversions) totals per ad group over the window, in the order of
+        ad_group_ids. Ad groups without history get zeros.
+        """
+        rollup = self._rollups[granularity]
+        slots = self._slots_for(ad_group_ids, create=False)
+        known = slots >= 0
+        lo, hi = rollup.window(from_ts, to_ts)
+        impressions = np.zeros(len(ad_group_ids), dtype=np.int64)
+        conversions = np.zeros(len(ad_group_ids), dtype=np.int64)
+        impressions[known], conversions[known] = rollup.totals_between(lo, hi, slots[known])
+        return impressions, conversions
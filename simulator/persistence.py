@@ -0,0 +1,261 @@
+import logging
+import marshal
+import sqlite3
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+_LOG = logging.getLogger("simulator.persistence")
+
+# Entity kinds in load order: campaigns index the ad groups they reference, so those come first
+ENTITY_KINDS = ("creative", "creative_group", "ad_group", "campaign")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    updated INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entities_by_created ON entities (kind, created);
+CREATE TABLE IF NOT EXISTS snapshots (
+    kind TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS champion_queue (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    ad_group_id TEXT NOT NULL
+);
+"""
+
+_UPSERT = ("INSERT INTO entities (kind, id, created, updated, version, data) VALUES (?, ?, ?, ?, ?, ?) "
+           "ON CONFLICT (kind, id) DO UPDATE SET updated = excluded.updated, version = excluded.version, "
+           "data = excluded.data")
+_ENQUEUE = "INSERT INTO champion_queue (ad_group_id) VALUES (?)"
+_DEQUEUE = "DELETE FROM champion_queue WHERE position = (SELECT MIN(position) FROM champion_queue)"
+
+# Writer log records. Snapshots, flushes and stop are barriers: a batch never spans one.
+_ENTITY, _CHAMPION_ENQUEUED, _CHAMPION_DEQUEUED, _CHAMPION_REORDERED, _SNAPSHOT, _FLUSH, _STOP, _ENTITIES = range(8)
+_BARRIERS = (_SNAPSHOT, _FLUSH, _STOP)
+
+
+class EntitySnapshot:
+    """Compact, column-oriented image of every entity of one kind, in creation order."""
+
+    def __init__(self, field_names: List[str], columns: List[list], versions: List[int],
+                 modified_order: Optional[List[str]] = None):
+        self.field_names = field_names
+        self.columns = columns
+        self.versions = versions
+        self.modified_order = modified_order
+
+    def dumps(self) -> bytes:
+        return marshal.dumps((self.field_names, self.columns, self.versions, self.modified_order))
+
+    @classmethod
+    def loads(cls, data: bytes) -> "EntitySnapshot":
+        return cls(*marshal.loads(data))
+
+
+class LogEntry:
+    """One entity row written since the last snapshot."""
+
+    def __init__(self, entity_id: str, updated: int, version: int, fields: dict):
+        self.entity_id = entity_id
+        self.updated = updated
+        self.version = version
+        self.fields = fields
+
+
+class PersistenceError(RuntimeError):
+    """The backend failed to commit earlier changes and accepts no more writes."""
+
+
+class SQLitePersistence:
+    """
+    SQLite backend for EntityStore, laid out as a compact snapshot plus a change log.
+    The snapshots table holds one marshalled, column-oriented blob per entity kind, which
+    loads without per-row parsing. Every change after it is an upserted, marshalled row in the
+    entities table, so the log never holds more than one row per entity.
+    EntityStore.compact() folds the log into new snapshots and empties the log.
+    Changes are serialized on the caller's thread and appended to an in-memory log that a single
+    writer thread drains, committing everything that arrived since its last commit in one
+    transaction. A crash loses at most the changes that were not committed yet.
+    The first failed commit (a full disk, a locked database) is logged and kept in `error`; from
+    then on every write raises PersistenceError, so callers find out instead of losing changes.
+    A store only needs save, save_many, champion_enqueued, champion_dequeued, champions_reordered
+    and write_snapshots from its persistence, so other backends can be swapped in.
+    """
+
+    def __init__(self, path: str, max_batch: int = 50000):
+        self.path = path
+        self.max_batch = max_batch
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;" + _SCHEMA)
+        max_updated = self._connection.execute("SELECT MAX(updated) FROM entities").fetchone()[0]
+        self._sequence = (max_updated or 0) + 1
+        self._log: "deque[tuple]" = deque()
+        self._pending = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    # --- Reads (before the store starts writing) ---
+    def is_empty(self) -> bool:
+        for table in ("snapshots", "entities"):
+            if self._connection.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None:
+                return False
+        return True
+
+    def load_snapshot(self, kind: str) -> Optional[EntitySnapshot]:
+        row = self._connection.execute("SELECT data FROM snapshots WHERE kind = ?", (kind,)).fetchone()
+        return EntitySnapshot.loads(row[0]) if row is not None else None
+
+    def load_log(self, kind: str) -> List[LogEntry]:
+        """Returns the entities of the kind written since the last snapshot, in creation order."""
+        cursor = self._connection.execute(
+            "SELECT id, updated, version, data FROM entities WHERE kind = ? ORDER BY created", (kind,))
+        return [LogEntry(entity_id, updated, version, marshal.loads(data))
+                for entity_id, updated, version, data in cursor]
+
+    def log_size(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    def load_champion_queue(self) -> List[str]:
+        return [row[0] for row in self._connection.execute("SELECT ad_group_id FROM champion_queue ORDER BY position")]
+
+    # --- Writes ---
+    @property
+    def error(self) -> Optional[str]:
+        """Why writes stopped being accepted, or None while the backend is healthy."""
+        return f"SQLite writer failed: {self._error}" if self._error is not None else None
+
+    def _check_writable(self):
+        if self._error is not None:
+            raise PersistenceError(self.error) from self._error
+
+    def save(self, kind: str, entity_id: str, version: int, fields: dict):
+        self._check_writable()
+        # Serialize now: the entity may change again before the writer gets to it
+        self._append((_ENTITY, (kind, entity_id, version, marshal.dumps(fields))))
+
+    def save_many(self, kind: str, entities: List[Tuple[str, int, dict]]):
+        """Like save() for (entity_id, version, fields) of many entities, queued as one log record."""
+        self._check_writable()
+        self._append((_ENTITIES, (kind, [(entity_id, version, marshal.dumps(fields))
+                                         for entity_id, version, fields in entities])))
+
+    def champion_enqueued(self, ad_group_id: str):
+        self._check_writable()
+        self._append((_CHAMPION_ENQUEUED, ad_group_id))
+
+    def champion_dequeued(self):
+        self._check_writable()
+        self._append((_CHAMPION_DEQUEUED, None))
+
+    def champions_reordered(self, ad_group_ids: List[str]):
+        self._check_writable()
+        self._append((_CHAMPION_REORDERED, list(ad_group_ids)))
+
+    def write_snapshots(self, snapshots: Dict[str, EntitySnapshot]):
+        """Replaces the snapshots and drops the log; every change queued before this call must be in them."""
+        self._check_writable()
+        self._append((_SNAPSHOT, {kind: snapshot.dumps() for kind, snapshot in snapshots.items()}))
+
+    def flush(self):
+        """Blocks until every change queued so far is committed."""
+        done = threading.Event()
+        self._append((_FLUSH, done))
+        done.wait()
+        self._check_writable()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._append((_STOP, None))
+            self._writer.join()
+        self._connection.close()
+
+    def _append(self, record: tuple):
+        self._log.append(record)
+        # The writer clears the flag before draining, so a set flag means this record will be seen
+        if not self._pending.is_set():
+            self._pending.set()
+
+    def _write_loop(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            while self._log:
+                batch = []
+                while self._log and len(batch) < self.max_batch:
+                    record = self._log.popleft()
+                    if record[0] in _BARRIERS:
+                        break
+                    batch.append(record)
+                else:
+                    record = None
+                if batch:
+                    self._commit(batch)
+                if record is not None and self._barrier(record):
+                    return
+
+    def _commit(self, batch: list):
+        if self._error is not None:
+            # Committing on after a lost batch would leave a gap in the log that nothing notices
+            return
+        # One row per entity: created from its first write in the batch, everything else from its last
+        rows: Dict[Tuple[str, str], list] = {}
+        champion_ops = []
+
+        def upsert(kind, entity_id, version, data):
+            sequence = self._sequence
+            self._sequence += 1
+            row = rows.get((kind, entity_id))
+            if row is None:
+                rows[kind, entity_id] = [kind, entity_id, sequence, sequence, version, data]
+            else:
+                row[3:] = [sequence, version, data]
+        for op, payload in batch:
+            if op == _ENTITY:
+                upsert(*payload)
+            elif op == _ENTITIES:
+                kind, entities = payload
+                for entity_id, version, data in entities:
+                    upsert(kind, entity_id, version, data)
+            else:
+                champion_ops.append((op, payload))
+        try:
+            with self._connection:
+                self._connection.executemany(_UPSERT, rows.values())
+                for op, payload in champion_ops:
+                    if op == _CHAMPION_ENQUEUED:
+                        self._connection.execute(_ENQUEUE, (payload,))
+                    elif op == _CHAMPION_REORDERED:
+                        self._connection.execute("DELETE FROM champion_queue")
+                        self._connection.executemany(_ENQUEUE, [(ad_group_id,) for ad_group_id in payload])
+                    else:
+                        self._connection.execute(_DEQUEUE)
+        except sqlite3.Error as e:
+            self._fail(e)
+
+    def _fail(self, error: sqlite3.Error):
+        if self._error is None:
+            _LOG.error("SQLite commit to %s failed, no further changes will be persisted: %s", self.path, error)
+            self._error = error
+
+    def _barrier(self, record: tuple) -> bool:
+        op, payload = record
+        if op == _SNAPSHOT and self._error is None:
+            try:
+                with self._connection:
+                    self._connection.executemany("INSERT OR REPLACE INTO snapshots (kind, data) VALUES (?, ?)",
+                                                 payload.items())
+                    self._connection.execute("DELETE FROM entities")
+            except sqlite3.Error as e:
+                self._fail(e)
+        elif op == _FLUSH:
+            payload.set()
+        return op == _STOP
@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from flask import Flask, jsonify, request
+
+# Never limited, so metrics and health can still be checked while clients are being throttled
+_UNLIMITED_ROUTES = ("/metrics", "/health")
+_ANONYMOUS = "anonymous"
+
+
+class RateLimiter:
+    """
+    Token buckets per (account, endpoint), like the quotas of the real Moloco API.
+    Every endpoint ("POST /cm/v1/creatives/batch", with the URL rule rather than the raw path)
+    allows rate requests per second on average and bursts of up to burst requests; overrides
+    set (rate, burst) for single endpoints. Buckets refill lazily when they are next used. A bucket
+    that has refilled is no different from a new one, so the least recently used buckets are dropped
+    once they are full, and beyond max_buckets the least recently used go regardless: accounts are
+    whatever the caller claims, and a client inventing one per request must not grow the table
+    without end. A rate of 0 turns limiting off.
+    """
+
+    def __init__(self, rate: float, burst: int, overrides: Optional[Dict[str, Tuple[float, int]]] = None,
+                 max_buckets: int = 100000):
+        self.enabled = rate > 0
+        self.rate = rate
+        self.burst = burst
+        self.overrides = dict(overrides or {})
+        self.max_buckets = max_buckets
+        # Least recently used first; values are [tokens, last refill time]
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket_count(self) -> int:
+        return len(self._buckets)
+
+    def limits(self, endpoint: str) -> Tuple[float, int]:
+        return self.overrides.get(endpoint, (self.rate, self.burst))
+
+    def acquire(self, account: str, endpoint: str) -> float:
+        """Takes a token from the bucket. Returns 0 when it had one, else the seconds until it will."""
+        rate, burst = self.limits(endpoint)
+        now = time.monotonic()
+        with self._lock:
+            self._drop_full_buckets(now)
+            bucket = self._buckets.get((account, endpoint))
+            if bucket is None:
+                while len(self._buckets) >= self.max_buckets:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[account, endpoint] = [float(burst), now]
+            else:
+                self._buckets.move_to_end((account, endpoint))
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+    def _drop_full_buckets(self, now: float):
+        # From the least recently used end, up to the first bucket still refilling: amortized O(1) per call
+        while self._buckets:
+            (_, endpoint), (tokens, last) = next(iter(self._buckets.items()))
+            rate, burst = self.limits(endpoint)
+            if tokens + (now - last) * rate < burst:
+                break
+            self._buckets.popitem(last=False)
+
+
+def rate_limit(app: Flask, limiter: RateLimiter):
+    """
+    Answers requests over their account's limit with 429 Too Many Requests, a Retry-After header
+    and the exact wait in X-RateLimit-Reset-After.
+    The account is the ad_account_id query param, else the X-Ad-Account-Id header, else one shared
+    anonymous account. Register after instrument(), so rejected requests still show in the metrics.
+    """
+    @app.before_request
+    def _check_rate_limit():
+        if not limiter.enabled or request.url_rule is None or request.path in _UNLIMITED_ROUTES:
+            return None
+        account = request.args.get("ad_account_id") or request.headers.get("X-Ad-Account-Id") or _ANONYMOUS
+        endpoint = f"{request.method} {request.url_rule.rule}"
+        wait = limiter.acquire(account, endpoint)
+        if not wait:
+            return None
+        rate, burst = limiter.limits(endpoint)
+        response = jsonify({"error": f"Rate limit of {rate:g} requests per second (bursts of {burst}) exceeded "
+                                     f"for {endpoint} by account '{account}'. Retry in {wait:.2f}s."})
+        response.headers["Retry-After"] = str(math.ceil(wait))
+        # Retry-After only takes whole seconds, far longer than most waits at these rates
+        response.headers["X-RateLimit-Reset-After"] = f"{wait:.3f}"
+        return response, 429
@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+_LOG = logging.getLogger("simulator.rotation")
+
+
+class RotationScheduler:
+    """
+    Runs rotate(run_id) every interval seconds on a daemon thread, and on demand through run_now().
+    Runs never overlap. A request that arrives while a run is in progress waits for the next run,
+    which every request waiting at that point shares. A burst of triggers therefore costs at most
+    one extra run, and none of them is answered by a run that started before it was made.
+    rotate returns the run's decisions; the most recent history runs are kept for runs().
+    """
+
+    def __init__(self, rotate: Callable[[int], List[dict]], interval: float, history: int = 1000):
+        self.rotate = rotate
+        self.interval = interval
+        self._runs: "deque[dict]" = deque(maxlen=history)
+        self._started = 0
+        self._completed = 0
+        self._running = False
+        self._changed = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name="rotation-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stopping.wait(self.interval):
+            self.run_now("schedule")
+
+    def run_now(self, trigger: str = "manual") -> dict:
+        """Runs a rotation, or waits for the one that starts next if a run is in progress, and returns its record."""
+        with self._changed:
+            target = self._started + 1
+            while self._running:
+                self._changed.wait()
+            if self._completed >= target:
+                return self._record(target)
+            self._running = True
+            self._started += 1
+            run_id = self._started
+        started = time.time()
+        try:
+            decisions, error = self.rotate(run_id), None
+        except Exception as e:
+            _LOG.exception("Rotation run %d failed", run_id)
+            decisions, error = [], repr(e)
+        record = {"run_id": run_id, "trigger": trigger, "started": started, "finished": time.time(),
+                  "replaced": sum(1 for d in decisions if d["action"] == "REPLACED"),
+                  "decisions": decisions, "error": error}
+        with self._changed:
+            self._runs.append(record)
+            self._completed = run_id
+            self._running = False
+            self._changed.notify_all()
+        return record
+
+    def _record(self, run_id: int) -> dict:
+        for record in reversed(self._runs):
+            if record["run_id"] == run_id:
+                return record
+        return {"run_id": run_id, "error": "Run record is no longer kept."}
+
+    def runs(self, limit: int = 20) -> List[dict]:
+        """The most recent runs, newest first."""
+        with self._changed:
+            return list(reversed(self._runs))[:limit]
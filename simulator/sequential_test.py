@@ -0,0 +1,113 @@
+import math
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Decision codes, one per arm
+UNDECIDED, WINNER, LOSER, INCONCLUSIVE = 0, 1, 2, 3
+DECISION_NAMES = {WINNER: "WINNER", LOSER: "LOSER", INCONCLUSIVE: "INCONCLUSIVE"}
+
+_EPSILON = 1e-9
+
+
+class SequentialEvaluator:
+    """
+    Wald sequential probability ratio test of every test arm against a control ad group.
+    For a control conversion rate p0 the test weighs H1: rate = p0 * (1 + lift) against
+    H0: rate = p0 on each arm's cumulative binomial counts, and stops an arm as
+    soon as its log-likelihood ratio leaves [log(beta / (1 - alpha)), log((1 - beta) / alpha)].
+    All arms and all rounds are tested in one vectorized pass.
+    Arms that reach max_impressions without crossing a boundary stop as INCONCLUSIVE.
+    Decisions are remembered per ad group, so decided arms are not simulated again.
+    """
+
+    def __init__(self, lift: float = 0.2, alpha: float = 0.05, beta: float = 0.2,
+                 min_control_conversions: int = 20):
+        if lift <= 0:
+            raise ValueError("lift must be positive.")
+        if not (0 < alpha < 1 and 0 < beta < 1):
+            raise ValueError("alpha and beta must be between 0 and 1.")
+        self.lift = lift
+        self.alpha = alpha
+        self.beta = beta
+        self.min_control_conversions = min_control_conversions
+        self._decisions: Dict[str, int] = {}
+
+    @property
+    def upper_bound(self) -> float:
+        return math.log((1 - self.beta) / self.alpha)
+
+    @property
+    def lower_bound(self) -> float:
+        return math.log(self.beta / (1 - self.alpha))
+
+    def log_likelihood_ratio(self, control_impressions, control_conversions, arm_impressions,
+                             arm_conversions) -> np.ndarray:
+        """Log-likelihood ratio of 'arm beats control by lift' over 'arm converts like control'; broadcasts."""
+        control_impressions = np.asarray(control_impressions, dtype=np.float64)
+        p0 = np.clip(np.asarray(control_conversions) / np.maximum(control_impressions, 1), _EPSILON, 1 - _EPSILON)
+        low = p0
+        high = np.minimum(p0 * (1 + self.lift), 1 - _EPSILON)
+        arm_conversions = np.asarray(arm_conversions, dtype=np.float64)
+        arm_misses = np.asarray(arm_impressions, dtype=np.float64) - arm_conversions
+        return arm_conversions * np.log(high / low) + arm_misses * np.log((1 - high) / (1 - low))
+
+    def decide(self, control_impressions, control_conversions, arm_impressions, arm_conversions,
+               max_impressions: Optional[int] = None) -> np.ndarray:
+        """Returns a decision code for every arm given cumulative counts; broadcasts like log_likelihood_ratio."""
+        llr = self.log_likelihood_ratio(control_impressions, control_conversions, arm_impressions, arm_conversions)
+        ready = np.broadcast_to(np.asarray(control_conversions) >= self.min_control_conversions, llr.shape)
+        codes = np.full(llr.shape, UNDECIDED, dtype=np.int8)
+        codes[ready & (llr >= self.upper_bound)] = WINNER
+        codes[ready & (llr <= self.lower_bound)] = LOSER
+        if max_impressions is not None:
+            exhausted = np.broadcast_to(np.asarray(arm_impressions) >= max_impressions, llr.shape)
+            codes[(codes == UNDECIDED) & exhausted] = INCONCLUSIVE
+        return codes
+
+    def run(self, control_base: Tuple[int, int], arm_base: Tuple[np.ndarray, np.ndarray],
+            impressions: np.ndarray, conversions: np.ndarray,
+            max_impressions: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        Replays simulated rounds through the test with early stopping.
+        impressions and conversions have shape (rounds, 1 + arms) with the control in column 0;
+        control_base and arm_base are the counts recorded before the first round.
+        Returns (impressions, conversions, decisions, rounds_used): the inputs with every round after
+        an arm's decision zeroed out, one decision code per arm, and the number of rounds that
+        served any traffic. The control keeps serving while any arm is still undecided.
+        """
+        cum_impressions = np.cumsum(impressions, axis=0)
+        cum_conversions = np.cumsum(conversions, axis=0)
+        control_impressions = control_base[0] + cum_impressions[:, :1]
+        control_conversions = control_base[1] + cum_conversions[:, :1]
+        codes = self.decide(control_impressions, control_conversions,
+                            arm_base[0] + cum_impressions[:, 1:], arm_base[1] + cum_conversions[:, 1:],
+                            max_impressions)
+        decided = codes != UNDECIDED
+        # An arm serves a round only if it was undecided after every earlier round
+        decided_before = np.zeros_like(decided)
+        decided_before[1:] = np.logical_or.accumulate(decided, axis=0)[:-1]
+        active = np.empty(impressions.shape, dtype=bool)
+        active[:, 1:] = ~decided_before
+        active[:, 0] = active[:, 1:].any(axis=1)
+        first_decision = np.where(decided.any(axis=0), decided.argmax(axis=0), -1)
+        decisions = np.where(first_decision >= 0, codes[np.maximum(first_decision, 0), np.arange(codes.shape[1])],
+                             UNDECIDED).astype(np.int8)
+        rounds_used = int(active[:, 0].sum())
+        return np.where(active, impressions, 0), np.where(active, conversions, 0), decisions, rounds_used
+
+    def record(self, ad_group_ids: List[str], decisions: np.ndarray):
+        for ad_group_id, code in zip(ad_group_ids, decisions.tolist()):
+            if code != UNDECIDED:
+                self._decisions[ad_group_id] = code
+
+    def decision(self, ad_group_id: str) -> Optional[str]:
+        code = self._decisions.get(ad_group_id)
+        return DECISION_NAMES.get(code) if code is not None else None
+
+    def is_decided(self, ad_group_id: str) -> bool:
+        return ad_group_id in self._decisions
+
+    def reset(self, ad_group_ids: List[str]):
+        """Forgets the decisions of the given ad groups, so they are tested again."""
+        for ad_group_id in ad_group_ids:
+            self._decisions.pop(ad_group_id, None)
@@ -0,0 +1,338 @@
+import itertools
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import requests
+from flask import Flask, Response, jsonify, request
+from simulator.instrumentation import RequestMetrics, instrument
+from simulator.serialization import FastJSONProvider
+
+# IDs generated by shard n end in _s<n>, so a request that names an entity is routed by that ID
+_SHARD_TAG = re.compile(r"_s(\d+)$")
+# JSON body fields holding entity IDs, checked in this order when a request names no account
+_ID_FIELDS = ("ad_group_id", "ad_group_ids", "campaign_ids", "creative_ids")
+_ACCOUNT_HEADER = "X-Ad-Account-Id" # Identifies the caller's account to the shard's rate limiter
+_PASSED_REQUEST_HEADERS = ("Content-Type", "Accept", "If-None-Match", "Last-Event-ID", _ACCOUNT_HEADER)
+_PASSED_RESPONSE_HEADERS = ("Content-Type", "ETag", "Retry-After", "X-RateLimit-Reset-After", "Cache-Control",
+                            "X-Accel-Buffering")
+# Sent along with fanned-out requests, whose bodies and conditions the router builds itself
+_FAN_OUT_HEADERS = ("Accept", _ACCOUNT_HEADER)
+_STREAMED_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def shard_tag(shard: int) -> str:
+    """Suffix that shard appends to the IDs it generates."""
+    return f"_s{shard}"
+
+
+def shard_for_account(ad_account_id: str, shard_count: int) -> int:
+    """The shard that owns an account: a stable hash, so the router and every worker agree without a directory."""
+    return zlib.crc32(ad_account_id.encode()) % shard_count
+
+
+class ShardRouter:
+    """
+    Sends Moloco API requests to the worker process that owns their account, one process per shard.
+    A request goes to the shard of its ad_account_id (query or JSON body), else to the shard tagged
+    in the first entity ID it names (path, query or body), else to the shard of the account in its
+    X-Ad-Account-Id header, else to the shard that owns the fixture account. IDs created before
+    sharding carry no tag and live in that default shard as well. The header only identifies the
+    caller, so unlike the param it does not keep cross-account lists from fanning out.
+    An explicit ?shard=<n> overrides all of that, e.g. to scrape one shard's /metrics.
+    """
+
+    def __init__(self, shard_urls: List[str], default_account: str, timeout: float = 60):
+        # timeout bounds every wait for the next bytes from a shard: long polls wait at most 30s
+        # and event streams send keepalives every 15s, so only a hung shard ever reaches it
+        self.shard_urls = list(shard_urls)
+        self.shard_count = len(self.shard_urls)
+        self.default_shard = shard_for_account(default_account, self.shard_count)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=self.shard_count,
+                                                                    pool_maxsize=64))
+        self._pool = ThreadPoolExecutor(max_workers=self.shard_count * 4)
+        self._upload_shards = itertools.cycle(range(self.shard_count))
+
+    def shard_of_id(self, entity_id) -> Optional[int]:
+        """The shard tagged in entity_id, or None for untagged IDs."""
+        match = _SHARD_TAG.search(entity_id) if isinstance(entity_id, str) else None
+        if match and int(match.group(1)) < self.shard_count:
+            return int(match.group(1))
+        return None
+
+    def shard_for_id(self, entity_id) -> int:
+        shard = self.shard_of_id(entity_id)
+        return self.default_shard if shard is None else shard
+
+    def explicit_shard(self, args, body=None) -> Optional[int]:
+        """The shard picked by a shard or ad_account_id param (or body field), None when there is neither."""
+        if args.get("shard", "").isdigit() and int(args["shard"]) < self.shard_count:
+            return int(args["shard"])
+        account = args.get("ad_account_id") or (body.get("ad_account_id") if isinstance(body, dict) else None)
+        if isinstance(account, str) and account:
+            return shard_for_account(account, self.shard_count)
+        return None
+
+    def shard_for_request(self, path: str, args, body=None, headers=None) -> int:
+        shard = self.explicit_shard(args, body)
+        if shard is not None:
+            return shard
+        candidates = path.split("/") + [value for values in args.listvalues() for value in values]
+        if isinstance(body, dict):
+            for field in _ID_FIELDS:
+                value = body.get(field)
+                candidates.extend(value if isinstance(value, list) else [value])
+        for candidate in candidates:
+            shard = self.shard_of_id(candidate)
+            if shard is not None:
+                return shard
+        account = headers.get(_ACCOUNT_HEADER) if headers is not None else None
+        if account:
+            return shard_for_account(account, self.shard_count)
+        if path == "/cm/v1/uploads":
+            # A new upload names nothing yet; spread the hashing and disk writes over the shards
+            return next(self._upload_shards)
+        return self.default_shard
+
+    def send(self, shard: int, method: str, path: str, params=None, json=None, data=None, headers=None,
+             stream: bool = False) -> requests.Response:
+        return self.session.request(method, self.shard_urls[shard] + path, params=params, json=json, data=data,
+                                    headers=headers, stream=stream, timeout=(5, self.timeout))
+
+    def fan_out(self, calls: Dict[int, dict]) -> Dict[int, requests.Response]:
+        """Sends {shard: send() keyword arguments} to all those shards at once and returns {shard: response}."""
+        futures = {shard: self._pool.submit(self.send, shard, **kwargs) for shard, kwargs in calls.items()}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    def wait_until_ready(self, timeout: float = 30):
+        """Blocks until every shard answers, raising TimeoutError after timeout seconds."""
+        deadline = time.monotonic() + timeout
+        for url in self.shard_urls:
+            while True:
+                try:
+                    self.session.get(url + "/metrics", timeout=1)
+                    break
+                except requests.ConnectionError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Shard at {url} did not start within {timeout}s.")
+                    time.sleep(0.1)
+
+
+def create_router_app(router: ShardRouter, log_sample_rate: float = 0.01,
+                      slow_request_seconds: float = 0.5) -> Flask:
+    """
+    Flask app serving the Moloco API in front of the shards.
+    Most requests are proxied to one shard as they are, including streamed responses. These
+    cross-account requests fan out to every shard concurrently and are merged here:
+      - GET /cm/v1/campaigns and /cm/v1/creatives/<ad_type> without ad_account_id
+        (concatenated in shard order; page_size / page_token need an ad_account_id)
+      - GET /cm/v1/ad_groups?ids=... (in request order)
+      - POST /cm/v1/creatives/batch and /cm/v1/creative_groups/batch (in request order; each shard
+        accepts or rejects its part on its own)
+      - POST /cm/v1/campaigns/performance and /cm/v1/campaigns/replace_worst (totals summed; every
+        shard replaces up to k ad groups from its own champion queue)
+    /metrics reports the router's own requests; /metrics?shard=<n> is shard n's.
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    metrics = RequestMetrics(namespace="router")
+    # ?profile=1 is passed on to the shard, which is where the work happens
+    instrument(app, metrics, log_sample_rate=log_sample_rate, slow_request_seconds=slow_request_seconds,
+               allow_profiling=False)
+
+    def respond(upstream: requests.Response) -> Response:
+        headers = {name: upstream.headers[name] for name in _PASSED_RESPONSE_HEADERS if name in upstream.headers}
+        if upstream.headers.get("Content-Type", "").startswith(_STREAMED_TYPES):
+            def relay():
+                with upstream:
+                    yield from upstream.iter_content(chunk_size=None)
+            return Response(relay(), status=upstream.status_code, headers=headers)
+        return Response(upstream.content, status=upstream.status_code, headers=headers)
+
+    def passed_headers(names=_PASSED_REQUEST_HEADERS) -> Optional[dict]:
+        return {name: request.headers[name] for name in names if name in request.headers} or None
+
+    def wants_stream() -> bool:
+        """True for the NDJSON and server-sent event responses, which are relayed as they arrive."""
+        return request.path.endswith("/changes/stream") or request.args.get("format") == "ndjson" or \
+            request.accept_mimetypes.best in _STREAMED_TYPES
+
+    def proxy(shard: int) -> Response:
+        headers = passed_headers()
+        # Upload parts are relayed chunk by chunk instead of being read into memory here
+        data = request.stream if request.method == "PUT" and not request.is_json else request.get_data()
+        return respond(router.send(shard, request.method, request.full_path, data=data, headers=headers,
+                                   stream=wants_stream()))
+
+    @app.errorhandler(requests.Timeout)
+    def shard_timed_out(e):
+        return jsonify({"error": f"Shard did not answer within {router.timeout:g}s."}), 504
+
+    def first_failure(responses: Dict[int, requests.Response]) -> Optional[Response]:
+        """The first failed shard's answer, if any; the other responses are closed then, streamed or not."""
+        failed = [shard for shard in sorted(responses) if responses[shard].status_code >= 400]
+        if not failed:
+            return None
+        for shard, response in responses.items():
+            if shard != failed[0]:
+                response.close()
+        return respond(responses[failed[0]])
+
+    def list_jsonify(payload: dict) -> Response:
+        response = jsonify(payload)
+        response.add_etag()
+        return response.make_conditional(request)
+
+    def merged_list():
+        shard = router.explicit_shard(request.args)
+        if shard is not None:
+            return proxy(shard)
+        if request.args.get("page_size") or request.args.get("page_token"):
+            return jsonify({"error": "Pagination needs an ad_account_id; cross-account lists are not paginated."}), 400
+        responses = router.fan_out({shard: {"method": "GET", "path": request.full_path,
+                                            "headers": passed_headers(_FAN_OUT_HEADERS), "stream": wants_stream()}
+                                    for shard in range(router.shard_count)})
+        failure = first_failure(responses)
+        if failure is not None:
+            return failure
+        ordered = [responses[shard] for shard in range(router.shard_count)]
+        if ordered[0].headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            def relay():
+                # One shard's stream after the other, so no shard's list is ever held here whole
+                try:
+                    for response in ordered:
+                        yield from response.iter_content(chunk_size=None)
+                finally:
+                    for response in ordered:
+                        response.close()
+            return Response(relay(), mimetype="application/x-ndjson")
+        bodies = [r.json() for r in ordered]
+        payload = {"data": [entity for body in bodies for entity in body.get("data", [])]}
+        if not payload["data"] and "error" in bodies[0]:
+            # Every shard answered the same "nothing found" body
+            return jsonify(bodies[0])
+        server_times = [body["server_time"] for body in bodies if "server_time" in body]
+        if server_times:
+            # The earliest one, so the next modified_since delta misses nothing on any shard
+            payload["server_time"] = min(server_times)
+        return list_jsonify(payload)
+
+    def split_batch(field: str, shard_of: Callable[[dict], int], merge=None):
+        """
+        Splits the body's field list by shard_of(item), sends each shard its part and answers as one.
+        Without merge, every shard's data list is interleaved back into request order.
+        """
+        body = request.get_json(silent=True) or {}
+        items = body.get(field)
+        if not isinstance(items, list) or not items:
+            # The shard answers with the validation error, or with its defaults
+            return proxy(router.shard_for_request(request.path, request.args, body, request.headers))
+        shards = [shard_of(item) for item in items]
+        if len(set(shards)) == 1:
+            return proxy(shards[0])
+        responses = router.fan_out({shard: {"method": "POST", "path": request.full_path, "json": {
+            **body, field: [item for item, owner in zip(items, shards) if owner == shard]},
+            "headers": passed_headers(_FAN_OUT_HEADERS)} for shard in set(shards)})
+        failure = first_failure(responses)
+        if failure is not None:
+            return failure
+        bodies = {shard: response.json() for shard, response in responses.items()}
+        if merge is not None:
+            return jsonify(merge(bodies))
+        results = {shard: iter(body["data"]) for shard, body in bodies.items()}
+        return jsonify({"data": [next(results[shard]) for shard in shards]})
+
+    def item_shard(item) -> int:
+        if not isinstance(item, dict):
+            return router.default_shard
+        shard = router.explicit_shard({}, item)
+        if shard is not None:
+            return shard
+        for creative_id in item.get("creative_ids") or []:
+            shard = router.shard_of_id(creative_id)
+            if shard is not None:
+                return shard
+        return router.default_shard
+
+    @app.route('/metrics', methods=['GET'])
+    def router_metrics():
+        if "shard" in request.args:
+            return proxy(router.shard_for_request(request.path, request.args))
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route('/cm/v1/campaigns', methods=['GET'])
+    def get_campaigns():
+        return merged_list()
+
+    @app.route('/cm/v1/creatives/<ad_type>', methods=['GET'])
+    def get_creatives_by_ad_type(ad_type):
+        return merged_list()
+
+    @app.route('/cm/v1/ad_groups', methods=['GET'])
+    def get_ad_groups_by_ids():
+        ad_group_ids = [agid for value in request.args.getlist("ids") for agid in value.split(",") if agid]
+        shards = {router.shard_for_id(agid) for agid in ad_group_ids}
+        if len(shards) <= 1:
+            return proxy(shards.pop() if shards else router.default_shard)
+        responses = router.fan_out({shard: {"method": "GET", "path": request.path, "params": {
+            "ids": ",".join(agid for agid in ad_group_ids if router.shard_for_id(agid) == shard)},
+            "headers": passed_headers(_FAN_OUT_HEADERS)} for shard in shards})
+        failure = first_failure(responses)
+        if failure is not None:
+            return failure
+        found = {}
+        for response in responses.values():
+            for ad_group in response.json()["data"]:
+                found[ad_group["ad_group_id"]] = ad_group
+        return list_jsonify({"data": [found[agid] for agid in ad_group_ids if agid in found],
+                             "not_found": [agid for agid in ad_group_ids if agid not in found]})
+
+    @app.route('/cm/v1/creatives/batch', methods=['POST'])
+    def batch_upload_creatives():
+        return split_batch("creatives", item_shard)
+
+    @app.route('/cm/v1/creative_groups/batch', methods=['POST'])
+    def batch_create_creative_groups():
+        return split_batch("creative_groups", item_shard)
+
+    @app.route('/cm/v1/campaigns/performance', methods=['POST'])
+    def simulate_campaign_performance():
+        def merge(bodies):
+            totals = {"ad_group_count": 0, "impressions": 0, "conversions": 0}
+            for body in bodies.values():
+                for key in totals:
+                    totals[key] += body["data"][key]
+            ticks = next(iter(bodies.values()))["data"]["ticks"]
+            return {"message": "Performance simulated successfully.", "data": {**totals, "ticks": ticks}}
+        return split_batch("campaign_ids", router.shard_for_id, merge)
+
+    @app.route('/cm/v1/campaigns/replace_worst', methods=['POST'])
+    def replace_worst_ad_groups():
+        def merge(bodies):
+            replacements = [r for shard in sorted(bodies) for r in bodies[shard]["replacements"]]
+            return {"message": f"Replaced {len(replacements)} worst ad groups.", "replacements": replacements,
+                    "queue_size": sum(body["queue_size"] for body in bodies.values())}
+        body = request.get_json(silent=True) or {}
+        if router.explicit_shard(request.args) is not None:
+            return proxy(router.explicit_shard(request.args))
+        if body.get("campaign_ids") is not None:
+            return split_batch("campaign_ids", router.shard_for_id, merge)
+        # Every REGULAR campaign of every account
+        responses = router.fan_out({shard: {"method": "POST", "path": request.full_path, "json": body,
+                                            "headers": passed_headers(_FAN_OUT_HEADERS)}
+                                    for shard in range(router.shard_count)})
+        failure = first_failure(responses)
+        if failure is not None:
+            return failure
+        return jsonify(merge({shard: response.json() for shard, response in responses.items()}))
+
+    @app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE'])
+    @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
+    def route_to_shard(path):
+        body = request.get_json(silent=True) if request.is_json else None
+        return proxy(router.shard_for_request(request.path, request.args, body, request.headers))
+
+    return app
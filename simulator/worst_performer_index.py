@@ -0,0 +1,125 @@
+import heapq
+import itertools
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Heap entry: (conversions, attach order, ad_group_id)
+_Entry = Tuple[int, int, str]
+
+
+class WorstPerformerIndex:
+    """
+    Per-campaign min-heaps of ad group performance, keyed by conversions.
+    Updates push a fresh entry and leave the old one behind; stale entries are dropped
+    lazily when they reach the top, so updates and worst-lookups are O(log n).
+    Ties go to the ad group that was attached first, as in a linear scan.
+    """
+
+    def __init__(self):
+        self._heaps: Dict[str, List[_Entry]] = {}
+        # ad_group_id -> (campaign_id, current entry)
+        self._current: Dict[str, Tuple[str, _Entry]] = {}
+        self._attach_order: Dict[str, int] = {}
+        self._live_counts: Dict[str, int] = {}
+        self._counter = itertools.count()
+
+    def update(self, campaign_id: str, ad_group_id: str, conversions: int):
+        """Sets the ad group's score in the campaign, moving it there if it was indexed elsewhere."""
+        current = self._current.get(ad_group_id)
+        if current is None or current[0] != campaign_id:
+            if current is not None:
+                self._live_counts[current[0]] -= 1
+            self._live_counts[campaign_id] = self._live_counts.get(campaign_id, 0) + 1
+            self._attach_order[ad_group_id] = next(self._counter)
+        elif current[1][0] == conversions:
+            return
+        entry = (conversions, self._attach_order[ad_group_id], ad_group_id)
+        self._current[ad_group_id] = (campaign_id, entry)
+        heap = self._heaps.setdefault(campaign_id, [])
+        heapq.heappush(heap, entry)
+        self._compact(campaign_id)
+
+    def load_campaign(self, campaign_id: str, scores: Iterable[Tuple[str, int]]):
+        """
+        Indexes (ad_group_id, conversions) pairs of ad groups that are not indexed yet, in attach
+        order, into a campaign that has none: one heapify instead of a push per ad group.
+        """
+        entries = [(conversions, next(self._counter), ad_group_id) for ad_group_id, conversions in scores]
+        heapq.heapify(entries)
+        self._heaps[campaign_id] = entries
+        self._live_counts[campaign_id] = len(entries)
+        for entry in entries:
+            self._current[entry[2]] = (campaign_id, entry)
+            self._attach_order[entry[2]] = entry[1]
+
+    def rebuild_campaign(self, campaign_id: str, scores: Iterable[Tuple[str, int]]):
+        """
+        Replaces the heap of a campaign with the (ad_group_id, conversions) pairs of all the ad
+        groups indexed in it, with one heapify: cheaper than an update each when most changed.
+        """
+        entries = []
+        for ad_group_id, conversions in scores:
+            entry = (conversions, self._attach_order[ad_group_id], ad_group_id)
+            self._current[ad_group_id] = (campaign_id, entry)
+            entries.append(entry)
+        heapq.heapify(entries)
+        self._heaps[campaign_id] = entries
+
+    def remove(self, ad_group_id: str):
+        current = self._current.pop(ad_group_id, None)
+        if current is not None:
+            self._live_counts[current[0]] -= 1
+        self._attach_order.pop(ad_group_id, None)
+
+    def campaign_of(self, ad_group_id: str) -> Optional[str]:
+        current = self._current.get(ad_group_id)
+        return current[0] if current is not None else None
+
+    def _is_current(self, campaign_id: str, entry: _Entry) -> bool:
+        current = self._current.get(entry[2])
+        return current is not None and current == (campaign_id, entry)
+
+    def _clean_top(self, campaign_id: str) -> Optional[_Entry]:
+        heap = self._heaps.get(campaign_id)
+        while heap and not self._is_current(campaign_id, heap[0]):
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _compact(self, campaign_id: str):
+        # Rebuild when stale entries outnumber live ones, so the heap stays O(live ad groups)
+        heap = self._heaps[campaign_id]
+        if len(heap) > 64 and len(heap) > 2 * self._live_counts.get(campaign_id, 0):
+            self._heaps[campaign_id] = [e for e in heap if self._is_current(campaign_id, e)]
+            heapq.heapify(self._heaps[campaign_id])
+
+    def worst(self, campaign_id: str) -> Optional[Tuple[str, int]]:
+        """Returns (ad_group_id, conversions) of the campaign's worst ad group, or None if it has none."""
+        top = self._clean_top(campaign_id)
+        return (top[2], top[0]) if top is not None else None
+
+    def k_worst(self, campaign_ids: Iterable[str], k: int) -> List[Tuple[str, str, int]]:
+        """
+        Returns the k worst ad groups across the given campaigns as (campaign_id, ad_group_id, conversions),
+        worst first. Merges the campaign heaps through a heap of their tops, so it costs O(k log n).
+        """
+        tops = []
+        for campaign_id in campaign_ids:
+            top = self._clean_top(campaign_id)
+            if top is not None:
+                tops.append((top, campaign_id))
+        heapq.heapify(tops)
+        popped: List[Tuple[str, _Entry]] = []
+        seen = set()
+        while tops and len(popped) < k:
+            entry, campaign_id = heapq.heappop(tops)
+            heapq.heappop(self._heaps[campaign_id])
+            # A score that went A -> B -> A leaves two identical live entries; keep one
+            if entry[2] not in seen:
+                seen.add(entry[2])
+                popped.append((campaign_id, entry))
+            top = self._clean_top(campaign_id)
+            if top is not None:
+                heapq.heappush(tops, (top, campaign_id))
+        # The selection is read-only: put the popped entries back
+        for campaign_id, entry in popped:
+            heapq.heappush(self._heaps[campaign_id], entry)
+        return [(campaign_id, entry[2], entry[0]) for campaign_id, entry in popped]
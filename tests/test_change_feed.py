@@ -0,0 +1,57 @@
+"""
+ChangeFeed reads around its ring buffer. Run from the repository root with python -m pytest tests.
+"""
+import threading
+from simulator.change_feed import ChangeFeed
+
+CAPACITY = 8
+
+
+def _feed(published: int):
+    feed = ChangeFeed(capacity=CAPACITY)
+    for n in range(published):
+        feed.publish("campaign", f"campaign_{n % 3}", n)
+    events = [(n + 1, "campaign", f"campaign_{n % 3}", n) for n in range(published)]
+    return feed, events
+
+
+def test_since_matches_a_filter_of_every_event_across_wraparound():
+    # Before the buffer fills, exactly full, and wrapped around a few times
+    for published in (0, 5, CAPACITY, CAPACITY + 1, 3 * CAPACITY + 5):
+        feed, events = _feed(published)
+        oldest_buffered = max(1, published - CAPACITY + 1)
+        for sequence in range(published + 3):
+            for limit in (1, 3, CAPACITY, 1000):
+                result, reset = feed.since(sequence, limit)
+                if sequence > published or (published and sequence < oldest_buffered - 1):
+                    assert (result, reset) == ([], True), (published, sequence, limit)
+                else:
+                    expected = [event for event in events if event[0] > sequence][:limit]
+                    assert (result, reset) == (expected, False), (published, sequence, limit)
+
+
+def test_following_the_feed_sees_every_event_once():
+    feed, _ = _feed(0)
+    seen, sequence = [], 0
+    for n in range(50):
+        feed.publish("creative", f"creative_{n}")
+        if n % 3 == 0:
+            while True:
+                events, reset = feed.since(sequence, limit=2)
+                assert not reset
+                if not events:
+                    break
+                seen.extend(event[2] for event in events)
+                sequence = events[-1][0]
+    events, _ = feed.since(sequence)
+    seen.extend(event[2] for event in events)
+    assert seen == [f"creative_{n}" for n in range(50)]
+
+
+def test_wait_wakes_on_publish():
+    feed, _ = _feed(1)
+    assert not feed.wait(1, 0.01)
+    publisher = threading.Timer(0.05, feed.publish, ("campaign", "campaign_0"))
+    publisher.start()
+    assert feed.wait(1, 5)
+    publisher.join()
@@ -0,0 +1,84 @@
+"""
+Index consistency of the entity store. Run from the repository root with python -m pytest tests.
+"""
+import random
+from dtos.ad_group import AdGroup
+from dtos.campaign import Campaign
+from simulator.entity_store import EntityStore
+
+CAMPAIGNS = 4
+AD_GROUPS = 60
+
+
+def _campaign(campaign_id: str, status: str = "ACTIVE") -> Campaign:
+    return Campaign(ad_account_id="acct", product_id="product", campaign_id=campaign_id, title=campaign_id,
+                    description="", status=status, ad_group_ids=[], type="REGULAR",
+                    createTime="2024-01-01T00:00:00", lastModifiedTime="2024-01-01T00:00:00")
+
+
+def _store(rng: random.Random) -> EntityStore:
+    store = EntityStore()
+    for c in range(CAMPAIGNS):
+        store.add_campaign(_campaign(f"campaign_{c}"))
+    for a in range(AD_GROUPS):
+        store.add_ad_group(AdGroup(ad_group_id=f"ad_group_{a}", campaign_id="", creative_group_ids=[],
+                                   performance={"impressions": 1000, "conversions": rng.randrange(50)}))
+    return store
+
+
+def _assert_consistent(store: EntityStore):
+    attached = {}
+    for campaign in store.campaigns():
+        ids = campaign.ad_group_ids
+        assert len(set(ids)) == len(ids)
+        for position, ad_group_id in enumerate(ids):
+            assert store._ad_group_positions[ad_group_id] == position
+            assert store.campaign_for_ad_group(ad_group_id) is campaign
+            attached[ad_group_id] = campaign.campaign_id
+        worst = store.worst_ad_group(campaign.campaign_id)
+        if ids:
+            assert worst.performance["conversions"] == min(
+                store.get_ad_group(ad_group_id).performance["conversions"] for ad_group_id in ids)
+        else:
+            assert worst is None
+    assert store._campaign_id_by_ad_group == attached
+    assert set(store._ad_group_positions) == set(attached)
+    for ad_group_id in (f"ad_group_{a}" for a in range(AD_GROUPS)):
+        if ad_group_id not in attached:
+            assert store.campaign_for_ad_group(ad_group_id) is None
+
+
+def test_indexes_stay_consistent_through_attach_replace_and_detach():
+    rng = random.Random(7)
+    store = _store(rng)
+    campaign_ids = [f"campaign_{c}" for c in range(CAMPAIGNS)]
+    ad_group_ids = [f"ad_group_{a}" for a in range(AD_GROUPS)]
+    for step in range(2000):
+        campaign_id = rng.choice(campaign_ids)
+        ad_group_id = rng.choice(ad_group_ids)
+        operation = rng.randrange(4)
+        if operation == 0:
+            # Also detaches the ad group from wherever it was
+            store.attach_ad_group(campaign_id, ad_group_id)
+        elif operation == 1:
+            campaign = store.get_campaign(campaign_id)
+            if campaign.ad_group_ids:
+                store.replace_ad_group(campaign_id, rng.choice(campaign.ad_group_ids), ad_group_id)
+        elif operation == 2:
+            store.update_ad_group_performance(ad_group_id, {"impressions": 1000,
+                                                            "conversions": rng.randrange(50)})
+        else:
+            with store.lock:
+                store._detach_ad_group(ad_group_id)
+        if step % 50 == 0:
+            _assert_consistent(store)
+    _assert_consistent(store)
+
+
+def test_campaign_status_index_follows_updates():
+    store = EntityStore()
+    for c in range(CAMPAIGNS):
+        store.add_campaign(_campaign(f"campaign_{c}", "ACTIVE" if c % 2 else "PAUSED"))
+    store.update_campaign_status("campaign_0", "ACTIVE")
+    assert [c.campaign_id for c in store.campaigns("ACTIVE")] == ["campaign_1", "campaign_3", "campaign_0"]
+    assert [c.campaign_id for c in store.campaigns("PAUSED")] == ["campaign_2"]
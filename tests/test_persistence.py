@@ -0,0 +1,111 @@
+"""
+SQLite persistence round trips and write failures. Run from the repository root with python -m pytest tests.
+"""
+import sqlite3
+import pytest
+from dtos.ad_group import AdGroup
+from dtos.campaign import Campaign
+from dtos.creative import Creative
+from dtos.creative_group import CreativeGroup
+from simulator.entity_store import EntityStore
+from simulator.persistence import ENTITY_KINDS, PersistenceError, SQLitePersistence
+
+NOW = "2024-01-01T00:00:00"
+
+
+def _seed(store: EntityStore):
+    for n in range(3):
+        store.add_creative(Creative(id=f"creative_{n}", ad_account_id="acct", product_id="product",
+                                    title=f"Creative {n}", type="VIDEO", ad_type="PORTRAIT",
+                                    video_property={"auto_endcard": True}, createTime=NOW, lastModifiedTime=NOW))
+    store.add_creative_group(CreativeGroup(id="creative_group_0", title="Group", description="",
+                                           creative_ids=["creative_0", "creative_1"], status="ACTIVE",
+                                           createTime=NOW, lastModifiedTime=NOW))
+    for n in range(6):
+        store.add_ad_group(AdGroup(ad_group_id=f"ad_group_{n}", campaign_id="campaign_0",
+                                   creative_group_ids=["creative_group_0"],
+                                   performance={"impressions": 1000, "conversions": 10 * n}))
+    store.add_campaign(Campaign(ad_account_id="acct", product_id="product", campaign_id="campaign_0",
+                                title="Campaign", description="", status="ACTIVE",
+                                ad_group_ids=[f"ad_group_{n}" for n in range(4)], type="REGULAR",
+                                createTime=NOW, lastModifiedTime=NOW))
+    store.enqueue_champion(store.get_ad_group("ad_group_4"))
+    store.enqueue_champion(store.get_ad_group("ad_group_5"))
+
+
+def _change(store: EntityStore):
+    """Changes after the first snapshot, so they are only in the change log."""
+    store.add_creative(Creative(id="creative_3", ad_account_id="acct", product_id="product", title="Creative 3",
+                                type="IMAGE", ad_type="LANDSCAPE", video_property={}, createTime=NOW,
+                                lastModifiedTime=NOW, content_hash="0" * 64, status="PROCESSING"))
+    store.update_creative_status("creative_0", "FAILED", {"processing_error": "Asset is missing."})
+    store.add_ad_group_performance(["ad_group_0", "ad_group_1", "ad_group_0"], [500, 500, 500], [40, 1, 40])
+    store.update_campaign_status("campaign_0", "PAUSED")
+    store.replace_ad_group("campaign_0", "ad_group_1", store.dequeue_champion().ad_group_id)
+    store.requeue_champion()
+    store.enqueue_champion(store.get_ad_group("ad_group_1"))
+
+
+def _image(store: EntityStore) -> dict:
+    image = {kind: {entity_id: (entity.to_dict(), store.version(kind, entity_id))
+                    for entity_id, entity in store._entities_by_kind[kind].items()} for kind in ENTITY_KINDS}
+    image["champion_queue"] = [ad_group.ad_group_id for ad_group in store.champion_queue()]
+    image["worst"] = store.worst_ad_group("campaign_0").ad_group_id
+    image["paused"] = [campaign.campaign_id for campaign in store.campaigns("PAUSED")]
+    image["creatives_by_ad_type"] = [creative.id for creative in store.creatives_by_ad_type("PORTRAIT")]
+    return image
+
+
+def _reload(path) -> EntityStore:
+    return EntityStore.load(SQLitePersistence(str(path)))
+
+
+def test_round_trip_through_log_and_snapshot(tmp_path):
+    path = tmp_path / "store.db"
+    store = EntityStore()
+    _seed(store)
+    persistence = SQLitePersistence(str(path))
+    assert persistence.is_empty()
+    store.attach_persistence(persistence)
+    _change(store)
+    persistence.flush()
+    assert persistence.log_size() > 0
+    expected = _image(store)
+    persistence.close()
+
+    # From the first snapshot plus the change log
+    loaded = _reload(path)
+    assert _image(loaded) == expected
+    # Then folded into new snapshots, with an empty log
+    loaded.compact()
+    loaded._persistence.flush()
+    assert loaded._persistence.log_size() == 0
+    loaded._persistence.close()
+    reloaded = _reload(path)
+    assert _image(reloaded) == expected
+    reloaded._persistence.close()
+
+
+def test_writes_fail_loudly_after_a_failed_commit(tmp_path):
+    path = tmp_path / "store.db"
+    store = EntityStore()
+    _seed(store)
+    persistence = SQLitePersistence(str(path))
+    store.attach_persistence(persistence)
+    persistence.flush()
+    assert persistence.error is None
+    # Pull the table out from under the writer, so its next commit fails
+    saboteur = sqlite3.connect(str(path))
+    saboteur.execute("DROP TABLE entities")
+    saboteur.commit()
+    saboteur.close()
+
+    store.update_campaign_status("campaign_0", "PAUSED")
+    with pytest.raises(PersistenceError):
+        persistence.flush()
+    assert "SQLite writer failed" in persistence.error
+    with pytest.raises(PersistenceError):
+        store.update_campaign_status("campaign_0", "ACTIVE")
+    with pytest.raises(PersistenceError):
+        persistence.champion_dequeued()
+    persistence.close()
@@ -0,0 +1,57 @@
+"""
+Token bucket bookkeeping of the rate limiter. Run from the repository root with python -m pytest tests.
+"""
+from typing import Tuple
+from simulator import rate_limiter
+from simulator.rate_limiter import RateLimiter
+
+ENDPOINT = "GET /cm/v1/campaigns"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _limiter(monkeypatch, **kwargs) -> Tuple[RateLimiter, _Clock]:
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return RateLimiter(**{"rate": 10, "burst": 2, **kwargs}), clock
+
+
+def test_burst_then_wait(monkeypatch):
+    limiter, clock = _limiter(monkeypatch)
+    assert [limiter.acquire("a", ENDPOINT) for _ in range(2)] == [0, 0]
+    assert limiter.acquire("a", ENDPOINT) == 0.1
+    clock.now += 0.1
+    assert limiter.acquire("a", ENDPOINT) == 0
+
+
+def test_refilled_buckets_are_dropped(monkeypatch):
+    limiter, clock = _limiter(monkeypatch)
+    for n in range(1000):
+        limiter.acquire(f"account_{n}", ENDPOINT)
+    # Each one-off account's bucket is full again 0.1s later and goes with the next request
+    clock.now += 0.1
+    limiter.acquire("a", ENDPOINT)
+    assert limiter.bucket_count() == 1
+
+
+def test_bucket_count_is_capped(monkeypatch):
+    limiter, _ = _limiter(monkeypatch, max_buckets=100)
+    for n in range(1000):
+        limiter.acquire(f"account_{n}", ENDPOINT)
+    assert limiter.bucket_count() == 100
+
+
+def test_drained_bucket_survives_other_accounts(monkeypatch):
+    limiter, clock = _limiter(monkeypatch, max_buckets=100)
+    limiter.acquire("a", ENDPOINT)
+    limiter.acquire("a", ENDPOINT)
+    clock.now += 0.01
+    limiter.acquire("b", ENDPOINT)
+    # Still refilling, so it is kept and keeps throttling
+    assert limiter.acquire("a", ENDPOINT) > 0
@@ -0,0 +1,78 @@
+"""
+Early stopping of the sequential test on seeded data. Run from the repository root with python -m pytest tests.
+"""
+import numpy as np
+from simulator.sequential_test import INCONCLUSIVE, LOSER, UNDECIDED, WINNER, SequentialEvaluator
+
+CONTROL_RATE = 0.02
+
+
+def _rounds(rates, rounds: int, impressions: int, seed: int):
+    """Seeded binomial rounds, shape (rounds, len(rates)), for arms with the given true rates."""
+    rng = np.random.default_rng(seed)
+    served = np.full((rounds, len(rates)), impressions, dtype=np.int64)
+    return served, rng.binomial(served, rates)
+
+
+def _reference_run(evaluator, impressions, conversions, max_impressions=None):
+    """The same test replayed one round at a time, as a loop over arms."""
+    arms = impressions.shape[1] - 1
+    totals = np.zeros((2, 1 + arms), dtype=np.int64)
+    decisions = [UNDECIDED] * arms
+    served_impressions, served_conversions = np.zeros_like(impressions), np.zeros_like(conversions)
+    for round_index in range(impressions.shape[0]):
+        if all(d != UNDECIDED for d in decisions):
+            break
+        for column in [0] + [1 + arm for arm in range(arms) if decisions[arm] == UNDECIDED]:
+            served_impressions[round_index, column] = impressions[round_index, column]
+            served_conversions[round_index, column] = conversions[round_index, column]
+            totals[:, column] += (impressions[round_index, column], conversions[round_index, column])
+        for arm in range(arms):
+            if decisions[arm] == UNDECIDED:
+                decisions[arm] = int(evaluator.decide(totals[0, 0], totals[1, 0], totals[0, 1 + arm],
+                                                      totals[1, 1 + arm], max_impressions))
+    return served_impressions, served_conversions, decisions
+
+
+def test_clear_winner_and_loser_stop_early():
+    evaluator = SequentialEvaluator(lift=0.2)
+    impressions, conversions = _rounds([CONTROL_RATE, CONTROL_RATE * 1.6, CONTROL_RATE * 0.5], 200, 2000, seed=1)
+    served, _, decisions, rounds_used = evaluator.run((0, 0), (np.zeros(2), np.zeros(2)), impressions, conversions)
+    assert decisions.tolist() == [WINNER, LOSER]
+    assert rounds_used < 200
+    # Nothing is served after the last decision
+    assert not served[rounds_used:].any()
+
+
+def test_run_matches_round_by_round_reference():
+    evaluator = SequentialEvaluator(lift=0.2)
+    rates = [CONTROL_RATE] + np.linspace(CONTROL_RATE * 0.6, CONTROL_RATE * 1.6, 12).tolist()
+    impressions, conversions = _rounds(rates, 150, 1000, seed=2)
+    # Low enough that the arm closest to the control runs out before a decision
+    max_impressions = 5000
+    served_impressions, served_conversions, decisions, _ = evaluator.run(
+        (0, 0), (np.zeros(12), np.zeros(12)), impressions, conversions, max_impressions)
+    expected_impressions, expected_conversions, expected_decisions = _reference_run(
+        evaluator, impressions, conversions, max_impressions)
+    assert decisions.tolist() == expected_decisions
+    assert np.array_equal(served_impressions, expected_impressions)
+    assert np.array_equal(served_conversions, expected_conversions)
+    assert {WINNER, LOSER, INCONCLUSIVE} <= set(expected_decisions)
+
+
+def test_no_decision_before_enough_control_conversions():
+    evaluator = SequentialEvaluator(lift=0.2, min_control_conversions=20)
+    # Ten conversions on the control so far: even an arm converting five times as often waits
+    assert evaluator.decide(1000, 10, 1000, 50) == UNDECIDED
+    assert evaluator.decide(1000, 20, 1000, 100) == WINNER
+
+
+def test_false_winners_stay_near_alpha():
+    evaluator = SequentialEvaluator(lift=0.2, alpha=0.05, beta=0.2)
+    arms = 400
+    impressions, conversions = _rounds([CONTROL_RATE] * (1 + arms), 300, 2000, seed=3)
+    # A long-running control, so its rate is known well, as it is for a campaign's incumbent
+    control_base = (2_000_000, int(2_000_000 * CONTROL_RATE))
+    _, _, decisions, _ = evaluator.run(control_base, (np.zeros(arms), np.zeros(arms)), impressions, conversions)
+    assert np.mean(decisions == WINNER) <= 2 * evaluator.alpha
+    assert np.mean(decisions == LOSER) >= 0.8
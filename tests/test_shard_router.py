@@ -0,0 +1,109 @@
+"""
+Router-mode tests: the real router app in front of two stub shards that run the real rate limiter.
+Run from the repository root with python -m pytest tests.
+"""
+import itertools
+import threading
+import time
+import pytest
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+from simulator.rate_limiter import RateLimiter, rate_limit
+from simulator.shard_router import ShardRouter, create_router_app, shard_for_account
+
+SHARDS = 2
+
+
+def _accounts_on_shards():
+    """Two accounts on different shards, and a second account on the first one's shard."""
+    accounts = (f"acct_{n}" for n in itertools.count())
+    first = next(accounts)
+    same = next(a for a in accounts if shard_for_account(a, SHARDS) == shard_for_account(first, SHARDS))
+    other = next(a for a in accounts if shard_for_account(a, SHARDS) != shard_for_account(first, SHARDS))
+    return first, same, other
+
+
+def _shard_app(shard: int) -> Flask:
+    app = Flask(f"shard{shard}")
+    # Bursts of 2 and a slow refill, so the third request in a row is throttled
+    rate_limit(app, RateLimiter(rate=0.5, burst=2))
+
+    @app.route('/cm/v1/campaigns/<campaign_id>', methods=['GET'])
+    def get_campaign(campaign_id):
+        return jsonify({"shard": shard, "account": request.headers.get("X-Ad-Account-Id")})
+
+    @app.route('/cm/v1/hung', methods=['GET'])
+    def hung():
+        time.sleep(3)
+        return jsonify({"shard": shard})
+
+    @app.route('/cm/v1/stream', methods=['GET'])
+    def stream():
+        return Response((f"{{\"n\": {n}}}\n" for n in range(3)), mimetype="application/x-ndjson")
+
+    @app.route('/cm/v1/campaigns', methods=['GET'])
+    def list_campaigns():
+        return Response((f"{{\"shard\": {shard}, \"n\": {n}}}\n" for n in range(2)), mimetype="application/x-ndjson")
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return ""
+    return app
+
+
+@pytest.fixture
+def router_client():
+    servers = [make_server("127.0.0.1", 0, _shard_app(shard), threaded=True) for shard in range(SHARDS)]
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    router = ShardRouter([f"http://127.0.0.1:{server.server_port}" for server in servers], "acct_default",
+                         timeout=0.5)
+    router.wait_until_ready()
+    yield create_router_app(router).test_client()
+    for server in servers:
+        server.shutdown()
+
+
+def test_header_account_routes_to_its_shard(router_client):
+    first, _, other = _accounts_on_shards()
+    for account in (first, other):
+        response = router_client.get("/cm/v1/campaigns/untagged", headers={"X-Ad-Account-Id": account})
+        assert response.status_code == 200
+        assert response.get_json() == {"shard": shard_for_account(account, SHARDS), "account": account}
+
+
+def test_rate_limit_is_per_header_account(router_client):
+    first, same, _ = _accounts_on_shards()
+    statuses = [router_client.get("/cm/v1/campaigns/untagged", headers={"X-Ad-Account-Id": first}).status_code
+                for _ in range(2)]
+    throttled = router_client.get("/cm/v1/campaigns/untagged", headers={"X-Ad-Account-Id": first})
+    assert statuses == [200, 200]
+    assert throttled.status_code == 429
+    assert "Retry-After" in throttled.headers
+    assert float(throttled.headers["X-RateLimit-Reset-After"]) > 0
+    # Another account on the same shard still has its own bucket
+    neighbour = router_client.get("/cm/v1/campaigns/untagged", headers={"X-Ad-Account-Id": same})
+    assert neighbour.status_code == 200
+
+
+def test_hung_shard_times_out(router_client):
+    started = time.monotonic()
+    response = router_client.get("/cm/v1/hung")
+    assert response.status_code == 504
+    assert time.monotonic() - started < 2
+
+
+def test_ndjson_is_relayed(router_client):
+    response = router_client.get("/cm/v1/stream?format=ndjson")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.get_data(as_text=True).splitlines() == ['{"n": 0}', '{"n": 1}', '{"n": 2}']
+
+
+def test_merged_ndjson_is_relayed_shard_by_shard(router_client):
+    response = router_client.get("/cm/v1/campaigns?format=ndjson")
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.get_data(as_text=True).splitlines() == [
+        f'{{"shard": {shard}, "n": {n}}}' for shard in range(SHARDS) for n in range(2)]
@@ -0,0 +1,76 @@
+"""
+Worst-performer heaps against a sorted scan. Run from the repository root with python -m pytest tests.
+"""
+import itertools
+import random
+from simulator.worst_performer_index import WorstPerformerIndex
+
+CAMPAIGNS = [f"campaign_{c}" for c in range(5)]
+AD_GROUPS = [f"ad_group_{a}" for a in range(80)]
+
+
+class _Scan:
+    """What the index should answer, from plain dicts: ad group -> (campaign, conversions, attach order)."""
+
+    def __init__(self):
+        self.entries = {}
+        self._counter = itertools.count()
+
+    def update(self, campaign_id, ad_group_id, conversions):
+        current = self.entries.get(ad_group_id)
+        order = current[2] if current is not None and current[0] == campaign_id else next(self._counter)
+        self.entries[ad_group_id] = (campaign_id, conversions, order)
+
+    def remove(self, ad_group_id):
+        self.entries.pop(ad_group_id, None)
+
+    def k_worst(self, campaign_ids, k):
+        ranked = sorted((conversions, order, campaign_id, ad_group_id)
+                        for ad_group_id, (campaign_id, conversions, order) in self.entries.items()
+                        if campaign_id in campaign_ids)
+        return [(campaign_id, ad_group_id, conversions) for conversions, _, campaign_id, ad_group_id in ranked[:k]]
+
+
+def test_k_worst_matches_sorted_scan():
+    rng = random.Random(5)
+    index, scan = WorstPerformerIndex(), _Scan()
+    for step in range(5000):
+        ad_group_id = rng.choice(AD_GROUPS)
+        if rng.random() < 0.1:
+            index.remove(ad_group_id)
+            scan.remove(ad_group_id)
+        else:
+            # Few distinct scores, so ties are common, and some updates move the ad group
+            current = scan.entries.get(ad_group_id)
+            campaign_id = current[0] if current is not None and rng.random() >= 0.2 else rng.choice(CAMPAIGNS)
+            conversions = rng.randrange(20)
+            index.update(campaign_id, ad_group_id, conversions)
+            scan.update(campaign_id, ad_group_id, conversions)
+        if step % 25 == 0:
+            campaign_ids = rng.sample(CAMPAIGNS, rng.randrange(1, len(CAMPAIGNS) + 1))
+            k = rng.randrange(1, 30)
+            assert index.k_worst(campaign_ids, k) == scan.k_worst(set(campaign_ids), k)
+            for campaign_id in CAMPAIGNS:
+                expected = scan.k_worst({campaign_id}, 1)
+                assert index.worst(campaign_id) == (expected[0][1:] if expected else None)
+
+
+def test_k_worst_is_read_only():
+    index = WorstPerformerIndex()
+    for a, ad_group_id in enumerate(AD_GROUPS):
+        index.update(CAMPAIGNS[a % len(CAMPAIGNS)], ad_group_id, a % 7)
+    first = index.k_worst(CAMPAIGNS, 40)
+    assert index.k_worst(CAMPAIGNS, 40) == first
+    assert len(first) == 40
+
+
+def test_rebuild_campaign_keeps_attach_order_for_ties():
+    index, scan = WorstPerformerIndex(), _Scan()
+    for ad_group_id in AD_GROUPS[:10]:
+        index.update("campaign_0", ad_group_id, 5)
+        scan.update("campaign_0", ad_group_id, 5)
+    scores = [(ad_group_id, 3 if a % 3 else 9) for a, ad_group_id in enumerate(AD_GROUPS[:10])]
+    index.rebuild_campaign("campaign_0", scores)
+    for ad_group_id, conversions in scores:
+        scan.update("campaign_0", ad_group_id, conversions)
+    assert index.k_worst(["campaign_0"], 10) == scan.k_worst({"campaign_0"}, 10)